@@ -4,9 +4,8 @@
 import logging
 import typing
 import random
-import atexit
 from enum import Enum
-from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride
+from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride, OpenOutput
 from purslane.addr_space import AddrSpace
 from purslane.aarch64 import v8
 
@@ -16,10 +15,10 @@ addr_space: AddrSpace = None
 nr_cpus: int = None
 armv7: bool = False
 
-rf = open('rand_proc.S', 'w')
-atexit.register(rf.close)
 
-rf.write('#include <linux/linkage.h>\n')
+def rand_proc_file():
+    # rand_proc.S 属于当前的 generation session，同一个 session 中返回同一个文件
+    return OpenOutput('rand_proc.S', '#include <linux/linkage.h>\n')
 
 OBJECT_SIZE = 128
 
@@ -79,7 +78,7 @@ class AdocP1(Action):
         addr_object = self.adoc_rsc.addr_object
 
         func_name = f'{self.name}_asm_func'
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             with v8.gpr_alloc(3) as (r1, r2, r5):
                 v8.ldr64_pseudo(r1, addr_object)
                 v8.ldr64_pseudo(r2, addr_pointer)
@@ -133,7 +132,7 @@ class AdocP2(Action):
         addr_object = self.adoc_rsc.addr_object
 
         func_name = f'{self.name}_asm_func'
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             with v8.gpr_alloc(3) as (r1, r2, r5):
                 v8.ldr64_pseudo(r2, addr_pointer)
 
@@ -191,6 +190,7 @@ class Entry(Action):
                           '#include <ivy/print.h>']
 
     def Activity(self):
+        rand_proc_file()
         for i in range(self.iters):
             cpus = [i for i in range(nr_cpus)]
             adoc_rsc = AdocRsc()
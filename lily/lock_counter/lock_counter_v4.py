@@ -4,9 +4,8 @@
 import logging
 import typing
 import random
-import atexit
 from enum import Enum
-from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride
+from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride, OpenOutput
 from purslane.addr_space import AddrSpace
 from purslane.aarch64 import v8
 from purslane.aarch64 import locks
@@ -18,10 +17,10 @@ addr_space: AddrSpace = None
 nr_cpus: int = None
 armv7: bool = False
 
-rf = open('rand_proc.S', 'w')
-atexit.register(rf.close)
 
-rf.write('#include <linux/linkage.h>\n')
+def rand_proc_file():
+    # rand_proc.S 属于当前的 generation session，同一个 session 中返回同一个文件
+    return OpenOutput('rand_proc.S', '#include <linux/linkage.h>\n')
 
 # 避免生成代码规模膨胀
 # 1. 一次迭代中，所有 increase 共享一个实现，通过参数进行随机控制，所有 disturb 也可以共享一个实现
@@ -148,7 +147,7 @@ def inc_dmb_excl_r8(la: Reg, ca: Reg):
 
 
 def gen_increase_func(name: str):
-    with v8.proc(name, rf):
+    with v8.proc(name, rand_proc_file()):
         with v8.gpr_spec(Reg.R0, Reg.R1, Reg.R2, Reg.R3):
             v8.label('10')
             # x0 lock address
@@ -238,7 +237,7 @@ def gen_increase_func(name: str):
 def gen_disturb_func(name: str):
     # x0 lock address, random load within 32 bytes
     # x1 stop flag address
-    with v8.proc(name, rf):
+    with v8.proc(name, rand_proc_file()):
         with v8.gpr_spec(Reg.R0, Reg.R1):
             with v8.gpr_alloc(3) as (flag_r, tr1, tr2):
                 v8.label('10')
@@ -419,6 +418,7 @@ class Entry(Action):
                           '#include "check.h"']
 
     def Activity(self):
+        rand_proc_file()
         logger.info(
             'generate global increase function shared by all cores for all iterations')
         gen_increase_func(GLOBAL_INC_FUNC_NAME)
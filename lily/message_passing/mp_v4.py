@@ -5,9 +5,8 @@ import ivy_app_cfg
 import logging
 import typing
 import random
-import atexit
 from enum import Enum
-from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride
+from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride, OpenOutput
 from purslane.dsl import RandU8, RandU16, RandU32, RandU64, RandUInt, RandS8, RandS16, RandS32, RandS64, RandInt
 from purslane.addr_space import AddrSpace
 from purslane.addr_space import SMWrite8, SMWrite16, SMWrite32, SMWrite64, SMWriteBytes
@@ -23,10 +22,10 @@ addr_space: AddrSpace = None
 nr_cpus: int = None
 armv7: bool = False
 
-rf = open('rand_proc.S', 'w')
-atexit.register(rf.close)
 
-rf.write('#include <linux/linkage.h>\n')
+def rand_proc_file():
+    # rand_proc.S 属于当前的 generation session，同一个 session 中返回同一个文件
+    return OpenOutput('rand_proc.S', '#include <linux/linkage.h>\n')
 
 
 class MpRsc:
@@ -89,7 +88,7 @@ class MessagePassingP1(Action):
         addr_flag = self.mp_rsc.addr_flag
 
         func_name = f'{self.name}_asm_func'
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             for i in range(random.randrange(6, 64)):
                 v8.verbatim('nop')
 
@@ -151,7 +150,7 @@ class MessagePassingP2(Action):
         addr_flag = self.mp_rsc.addr_flag
 
         func_name = f'{self.name}_asm_func'
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             v8.verbatim(f'ldr {r1}, ={addr_data:#x}')
             v8.verbatim(f'ldr {r2}, ={addr_flag:#x}')
 
@@ -231,6 +230,7 @@ class Entry(Action):
         self.c_headers = ['#include <linux/compiler.h>', '#include <ivy/print.h>']
 
     def Activity(self):
+        rand_proc_file()
         for i in range(self.iters):
             cpus = [i for i in range(nr_cpus)]
             mp_rsc = MpRsc()
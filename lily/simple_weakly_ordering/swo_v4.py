@@ -6,9 +6,8 @@ import argparse
 import typing
 import random
 import math
-import atexit
 from enum import Enum
-from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride
+from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride, OpenOutput
 from purslane.dsl import RandU8, RandU16, RandU32, RandU64, RandUInt, RandS8, RandS16, RandS32, RandS64, RandInt
 from purslane.addr_space import AddrSpace
 from purslane.addr_space import SMWrite8, SMWrite16, SMWrite32, SMWrite64, SMWriteBytes
@@ -24,10 +23,10 @@ logger = logging.getLogger('swo_v4')
 addr_space: AddrSpace = None
 nr_cpus: int = None
 
-rf = open('rand_proc.S', 'w')
-atexit.register(rf.close)
 
-rf.write('#include <linux/linkage.h>\n')
+def rand_proc_file():
+    # rand_proc.S 属于当前的 generation session，同一个 session 中返回同一个文件
+    return OpenOutput('rand_proc.S', '#include <linux/linkage.h>\n')
 
 # ARM DDI 0487F.c (ID072120)
 # K11. Barrier Litmus Tests
@@ -101,7 +100,7 @@ class SimpleWeaklyOrderingP1(Action):
 
         # logger.info(f'p1 {r1} {r2} {r5} {r6} {r7}')
 
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             v8.verbatim(f'ldr {r1}, ={addr_a:#x}')
             v8.verbatim(f'ldr {r2}, ={addr_b:#x}')
             v8.verbatim(f'ldr {r5}, ={0x5555555555555555:#x}')
@@ -164,7 +163,7 @@ class SimpleWeaklyOrderingP2(Action):
         addr_b = self.swo_rsc.addr_b
         addr_d = self.swo_rsc.addr_d
 
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             v8.verbatim(f'ldr {r1}, ={addr_a:#x}')
             v8.verbatim(f'ldr {r2}, ={addr_b:#x}')
             v8.verbatim(f'ldr {r5}, ={0x5555555555555555:#x}')
@@ -250,6 +249,7 @@ class Entry(Action):
         self.iters = iters
 
     def Activity(self):
+        rand_proc_file()
         for i in range(self.iters):
             cpus = [i for i in range(nr_cpus)]
             swo_rsc = SwoRsc()
@@ -5,9 +5,8 @@ import logging
 import argparse
 import typing
 import random
-import atexit
 from enum import Enum
-from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride
+from purslane.dsl import Do, Action, Sequence, Parallel, Schedule, Select, Run, TypeOverride, OpenOutput
 from purslane.dsl import RandU8, RandU16, RandU32, RandU64, RandUInt, RandS8, RandS16, RandS32, RandS64, RandInt
 from purslane.addr_space import AddrSpace
 from purslane.addr_space import SMWrite8, SMWrite16, SMWrite32, SMWrite64, SMWriteBytes
@@ -23,10 +22,10 @@ logger = logging.getLogger('ticket_lock_v4')
 addr_space: AddrSpace = None
 nr_cpus: int = None
 
-rf = open('rand_proc.S', 'w')
-atexit.register(rf.close)
 
-rf.write('#include <linux/linkage.h>\n')
+def rand_proc_file():
+    # rand_proc.S 属于当前的 generation session，同一个 session 中返回同一个文件
+    return OpenOutput('rand_proc.S', '#include <linux/linkage.h>\n')
 
 # pointer variable to the counter
 counter_pointer: str = None
@@ -104,7 +103,7 @@ class TicketLockTest(Action):
         addr_counter = self.tl_rsc.addr_counter
         addr_lock = self.tl_rsc.addr_lock
         func_name = f'{self.name}_asm_incr_func'
-        with v8.proc(func_name, rf):
+        with v8.proc(func_name, rand_proc_file()):
             # lock address register
             r1 = v8.Reg.R1
             # counter address register
@@ -162,6 +161,7 @@ class Entry(Action):
                           '#include <ivy/print.h>', '#include "cfunc.h"']
 
     def Activity(self):
+        rand_proc_file()
         for i in range(self.iters):
             logger.info(f'ticket lock iter {i}')
             tl_rsc = TlRsc()
@@ -0,0 +1,96 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 从保存的图（graph.json 或 --graph_npz_output 的 .npz）重新生成 uvm/soc 输出，不需要重新运行场景
+# 可以改变 executor 数量和分配策略，action 指定的 executor 保持不变
+# executor 不变并且图中保存了生成时的线程划分时，soc 输出使用同样的线程划分，与生成时的输出相同
+#
+# purslane_backend graph.npz --num_executors 8 --soc_output mp.c --soc_cooperative
+
+import argparse
+import logging
+import random
+from purslane import dag
+from purslane import dsl
+logger = logging.getLogger(__name__)
+
+
+def LoadGraph(fname: str) -> dag.Graph:
+    if fname.endswith('.npz'):
+        return dag.Graph.LoadNpz(fname)
+    return dag.Graph.LoadJson(fname)
+
+
+def PrepareArgParser(parser: argparse.ArgumentParser) -> None:
+    # graph 保存的图文件，.npz 为列存储格式，其余按 json 读取
+    # -S, --seed 随机种子，用于 executor 分配和重新划分线程时线程内 action 排序
+    # --num_executors 重新分配 executor 时的数量，不指定则使用图中的 executor 数量
+    # --executor_policy 重新分配 executor 的策略，不指定 --num_executors 和 --executor_policy 时保持图中的分配
+    # --cross_core_fraction critical_path 策略中跨核依赖至少占全部依赖的比例
+    # --reassign_threads 图中保存了线程划分时也按 --soc_thread_assign 重新划分
+    parser.add_argument('graph', help='saved graph, .npz or json')
+    parser.add_argument('-S', '--seed', help='random seed, default is random')
+    parser.add_argument('--num_executors', default=None, type=int,
+                        help='number of executors, reassign executors if given')
+    parser.add_argument('--executor_policy', default=None,
+                        choices=[m.name.lower() for m in dag.ExecutorAssignPolicy],
+                        help='executor assign policy, reassign executors if given')
+    parser.add_argument('--cross_core_fraction', default=0.0, type=float,
+                        help='minimum fraction of cross-core dependencies for the critical_path policy')
+    parser.add_argument('--reassign_threads', action='store_true',
+                        help='assign threads again even if the graph has saved threads')
+    dsl.PrepareBackendArgParser(parser)
+
+
+def Run(args: argparse.Namespace) -> dag.Graph:
+    logger.info(f'loading {args.graph}')
+    graph = LoadGraph(args.graph)
+    logger.info(f'{len(graph.nodes)} actions, {graph.num_executors} executors')
+
+    if args.num_executors is not None or args.executor_policy is not None:
+        num_executors = graph.num_executors if args.num_executors is None else args.num_executors
+        policy = dag.ExecutorAssignPolicy[(args.executor_policy or 'spread').upper()]
+        logger.info(f'reassigning executors, {num_executors} executors, policy {policy.name.lower()}')
+        graph.ReassignExecutors(num_executors, policy, args.cross_core_fraction)
+
+    if graph.threads_assigned and not args.reassign_threads:
+        if args.soc_thread_assign not in ('greedy', 'saved'):
+            logger.warning(f'--soc_thread_assign {args.soc_thread_assign} is ignored, using saved threads')
+        logger.info('using saved threads')
+        args.soc_thread_assign = 'saved'
+
+    dsl.RunBackends(graph, args)
+    return graph
+
+
+def Main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='regenerate uvm/soc outputs from a saved graph')
+    PrepareArgParser(parser)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        rand_seed = args.seed
+    else:
+        rand_seed = random.getrandbits(31)
+    random.seed(rand_seed)
+    logger.info(f'random seed is {rand_seed}')
+
+    Run(args)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,173 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 多个随机种子批量生成同一个场景
+# 每个工作进程只启动一次解释器、导入一次 purslane，之后依次运行分配到的种子：
+# 每个种子在新的 GenerationSession 中运行，并且卸载场景模块（lily、ivy_app_cfg 等）后重新导入，
+# 以 __main__ 运行场景脚本，工作目录为 <out_dir>/seed_<seed>，场景的输出文件都写在这个目录下
+# 场景参数在 -- 之后，原样传给场景脚本，--seed 由批量生成指定
+#
+# PYTHONPATH=<ivy build dir> python -m purslane.batch lily/lock_counter/lock_counter_main.py \
+#     --num_seeds 1000 --jobs 16 --out_dir seeds -- --soc_output lock_counter.c --soc_cooperative
+
+import argparse
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import runpy
+import sys
+import time
+import traceback
+import typing
+from purslane import cache
+from purslane import session
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class SeedResult:
+    seed: int
+    ok: bool
+    elapsed: float
+    error: typing.Optional[str] = None
+
+
+# 开始生成前已经加载的本地模块，例如批量生成的调用者，不会卸载
+_resident_modules: typing.Set[str] = set()
+
+
+def _UnloadScenarioModules() -> None:
+    # purslane 之外的本地模块在每个种子重新导入，模块级的状态（地址空间、输出文件等）不会带到下一个种子
+    for name in cache.LocalModules():
+        if name.split('.')[0] != 'purslane' and name not in _resident_modules:
+            del sys.modules[name]
+
+
+def _InitWorker(script: str) -> None:
+    # 与直接运行脚本相同，脚本所在目录加入模块搜索路径
+    sys.path.insert(0, os.path.dirname(script))
+    _resident_modules.update(cache.LocalModules())
+    # 只有 warning 输出到终端，每个种子的完整日志写到各自目录的 generate.log
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    console = logging.StreamHandler()
+    console.setLevel(logging.WARNING)
+    root.addHandler(console)
+
+
+def GenerateSeed(script: str, seed: int, out_dir: str, scenario_args: typing.List[str]) -> SeedResult:
+    seed_dir = os.path.join(out_dir, f'seed_{seed}')
+    os.makedirs(seed_dir, exist_ok=True)
+    _UnloadScenarioModules()
+
+    log_handler = logging.FileHandler(os.path.join(seed_dir, 'generate.log'), 'w')
+    logging.getLogger().addHandler(log_handler)
+    cwd = os.getcwd()
+    argv = sys.argv
+    start = time.perf_counter()
+    error = None
+    try:
+        os.chdir(seed_dir)
+        sys.argv = [script, '--seed', str(seed)] + scenario_args
+        with session.GenerationSession():
+            runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f'exit {e.code}'
+    except Exception:
+        error = traceback.format_exc()
+        logger.error(f'seed {seed} failed\n{error}')
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+        logging.getLogger().removeHandler(log_handler)
+        log_handler.close()
+    return SeedResult(seed, error is None, time.perf_counter() - start, error)
+
+
+def RunBatch(script: str, seeds: typing.List[int], out_dir: str, scenario_args: typing.List[str],
+             jobs: int) -> typing.List[SeedResult]:
+    script = os.path.abspath(script)
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    results = []
+
+    def Progress(result: SeedResult) -> None:
+        results.append(result)
+        if not result.ok:
+            logger.warning(f'seed {result.seed} failed: {result.error.splitlines()[-1]}')
+        elapsed = time.perf_counter() - start
+        logger.info(f'{len(results)}/{len(seeds)} seeds, {len(results) / elapsed * 60:.1f} seeds/min')
+
+    if jobs == 1:
+        # 在当前进程中运行，便于调试
+        sys.path.insert(0, os.path.dirname(script))
+        _resident_modules.update(cache.LocalModules())
+        for seed in seeds:
+            Progress(GenerateSeed(script, seed, out_dir, scenario_args))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_InitWorker, initargs=(script,)) as pool:
+            futures = [pool.submit(GenerateSeed, script, seed, out_dir, scenario_args)
+                       for seed in seeds]
+            for future in concurrent.futures.as_completed(futures):
+                Progress(future.result())
+
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda r: r.seed)
+    num_ok = sum(r.ok for r in results)
+    logger.info(f'{num_ok}/{len(results)} seeds generated in {elapsed:.1f}s, '
+                f'{len(results) / elapsed * 60:.1f} seeds/min with {jobs} jobs')
+    with open(os.path.join(out_dir, 'batch.json'), 'w') as f:
+        json.dump({'script': script, 'args': scenario_args, 'jobs': jobs, 'elapsed': elapsed,
+                   'seeds_per_minute': len(results) / elapsed * 60,
+                   'seeds': [dataclasses.asdict(r) for r in results]}, f, indent=2)
+    return results
+
+
+def Main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='generate many seeds of one scenario in a process pool')
+    parser.add_argument('script', help='scenario script')
+    parser.add_argument('--seeds', type=int, nargs='+',
+                        help='seeds to generate, default is first_seed .. first_seed+num_seeds-1')
+    parser.add_argument('--first_seed', type=int, default=0)
+    parser.add_argument('--num_seeds', type=int, default=16)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of worker processes, 1 runs in this process')
+    parser.add_argument('--out_dir', default='seeds',
+                        help='outputs of each seed go to <out_dir>/seed_<seed>')
+    parser.add_argument('scenario_args', nargs=argparse.REMAINDER,
+                        help='arguments after -- are passed to the scenario')
+    args = parser.parse_args()
+
+    scenario_args = args.scenario_args
+    if scenario_args[:1] == ['--']:
+        scenario_args = scenario_args[1:]
+    seeds = args.seeds
+    if seeds is None:
+        seeds = list(range(args.first_seed, args.first_seed + args.num_seeds))
+
+    results = RunBatch(args.script, seeds, args.out_dir, scenario_args, max(1, args.jobs))
+    sys.exit(0 if all(r.ok for r in results) else 1)
+
+
+if __name__ == '__main__':
+    Main()
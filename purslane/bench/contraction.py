@@ -0,0 +1,105 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+# 
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+# 
+#  https://www.apache.org/licenses/LICENSE-2.0
+# 
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# benchmark of removing scaffolding nodes around wide Parallel blocks
+# python -m purslane.bench.contraction --widths 16 64 256
+
+import argparse
+import time
+import typing
+from purslane import dag
+from purslane.bench.graphs import ScaffoldGraph, NumEdges
+from purslane.bench.reduction import Edges
+
+
+def NaiveRemoveNonTargetNodes(graph: dag.Graph):
+    # reference, the list based implementation used to be
+    graph.UpdateSuccessors()
+
+    for node in graph.nodes:
+        if not node.is_target:
+            for succ in node.Successors():
+                preds = list(succ.predecessors)
+                preds.remove(node)
+                for pred in node.predecessors:
+                    if pred not in preds:
+                        preds.append(pred)
+                succ.predecessors = dict.fromkeys(preds)
+
+    graph.nodes = [node for node in graph.nodes if node.is_target]
+
+
+def RunNaive(graph: dag.Graph) -> int:
+    NaiveRemoveNonTargetNodes(graph)
+    peak = NumEdges(graph)
+    graph.AssignSN()
+    graph.TransitiveReduction()
+    return peak
+
+
+def RunSpliced(graph: dag.Graph) -> int:
+    graph.RemoveNonTargetNodes()
+    peak = NumEdges(graph)
+    graph.AssignSN()
+    graph.TransitiveReduction()
+    return peak
+
+
+def RunJunctions(graph: dag.Graph) -> int:
+    graph.RemoveNonTargetNodes(keep_junctions=True)
+    peak = NumEdges(graph)
+    graph.AssignSN()
+    graph.TransitiveReduction(expand_junctions=True)
+    return peak
+
+
+def Main():
+    parser = argparse.ArgumentParser(
+        description='non-target node removal benchmark on wide Parallel blocks')
+    parser.add_argument('--widths', type=int, nargs='+',
+                        default=[16, 64, 256])
+    parser.add_argument('--rounds', type=int, default=8,
+                        help='number of sequential Parallel blocks')
+    parser.add_argument('--length', type=int, default=2,
+                        help='number of actions in each branch')
+    parser.add_argument('--naive_limit', type=int, default=256,
+                        help='run the naive reference only up to this width')
+    args = parser.parse_args()
+
+    print(f'{"width":>6} {"nodes":>8} {"targets":>8} {"mode":>9} {"unreduced":>10} {"final":>8} {"time(s)":>9}')
+    for width in args.widths:
+        modes = []
+        if width <= args.naive_limit:
+            modes.append(('naive', RunNaive))
+        modes.append(('spliced', RunSpliced))
+        modes.append(('junctions', RunJunctions))
+
+        reference = None
+        for name, func in modes:
+            graph = ScaffoldGraph(args.rounds, width, args.length)
+            num_nodes = graph.NumNodes()
+            start = time.perf_counter()
+            peak = func(graph)
+            elapsed = time.perf_counter() - start
+
+            edges = sorted(Edges(graph))
+            if reference is None:
+                reference = edges
+            elif edges != reference:
+                raise RuntimeError(f'{name} differs at width {width}')
+            print(f'{width:>6} {num_nodes:>8} {graph.NumNodes():>8} {name:>9} {peak:>10} {len(edges):>8} {elapsed:>9.3f}')
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,116 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+# 
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+# 
+#  https://www.apache.org/licenses/LICENSE-2.0
+# 
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# synthetic graphs for benchmarks
+
+import random
+import typing
+from purslane import dag
+from purslane import dsl
+
+
+def LayeredGraph(num_nodes: int, width: int = 64, fan_in: int = 3, depth: int = 3,
+                 seed: int = 0) -> dag.Graph:
+    # 节点按 width 分层，每个节点从之前 depth 层中随机选择至多 fan_in 个前序
+    # 跨多层的边大多是冗余边，用于测试 transitive reduction
+    rng = random.Random(seed)
+    graph = dag.Graph()
+    layers: typing.List[typing.List[dag.Node]] = []
+
+    for i in range(num_nodes):
+        if i % width == 0:
+            layers.append([])
+        node = dag.Node(f'n{i}')
+        node.is_target = True
+
+        cands = [n for layer in layers[-depth-1:-1] for n in layer]
+        if len(cands) > 0:
+            for pred in rng.sample(cands, min(fan_in, len(cands))):
+                node.AddPredecessor(pred)
+
+        layers[-1].append(node)
+        graph.AddNode(node)
+
+    graph.AssignSN()
+    return graph
+
+
+def ChainsGraph(num_nodes: int, num_chains: int = 64, cross_prob: float = 0.2,
+                window: int = 256, seed: int = 0) -> dag.Graph:
+    # 近似 moesi 等场景：每个 executor 一条较长的依赖链，链之间偶尔有依赖
+    # 每个节点依赖本链前一个节点，并冗余依赖本链前第二个节点
+    rng = random.Random(seed)
+    graph = dag.Graph()
+    tails: typing.List[typing.List[dag.Node]] = [[] for _ in range(num_chains)]
+
+    for i in range(num_nodes):
+        chain = tails[i % num_chains]
+        node = dag.Node(f'n{i}')
+        node.is_target = True
+        if len(chain) > 0:
+            node.AddPredecessor(chain[-1])
+        if len(chain) > 1:
+            node.AddPredecessor(chain[-2])
+        if i > 0 and rng.random() < cross_prob:
+            node.AddPredecessor(graph.nodes[rng.randrange(max(0, i - window), i)])
+
+        chain.append(node)
+        del chain[:-2]
+        graph.AddNode(node)
+
+    graph.AssignSN()
+    return graph
+
+
+def NumEdges(graph: dag.Graph) -> int:
+    return sum(node.NumPredecessors() for node in graph.Nodes())
+
+
+class _Leaf(dsl.Action):
+    def Body(self):
+        self.c_src = ''
+
+
+class _Wide(dsl.Action):
+    # rounds 个串行的 Parallel，每个 Parallel 内 width 个 Sequence，
+    # 每个 Sequence 内 length 个 action，nested 时 Sequence 内再嵌套一层 Parallel
+    def __init__(self, rounds: int, width: int, length: int, nested: bool):
+        super().__init__()
+        self.rounds = rounds
+        self.width = width
+        self.length = length
+        self.nested = nested
+
+    def Activity(self):
+        for _ in range(self.rounds):
+            with dsl.Parallel():
+                for _ in range(self.width):
+                    with dsl.Sequence():
+                        for _ in range(self.length):
+                            dsl.Do(_Leaf())
+                        if self.nested:
+                            with dsl.Parallel():
+                                for _ in range(self.length):
+                                    dsl.Do(_Leaf())
+
+
+def ScaffoldGraph(rounds: int, width: int, length: int = 2, nested: bool = True) -> dag.Graph:
+    # 通过 dsl 生成带有 init/final 脚手架节点的图，在新的 Context 中生成，之后恢复原来的 Context
+    saved_ctx = dsl.global_ctx
+    dsl.global_ctx = dsl.Context()
+    try:
+        dsl.Do(_Wide(rounds, width, length, nested))
+        return dsl.global_ctx.graph
+    finally:
+        dsl.global_ctx = saved_ctx
@@ -0,0 +1,269 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# scheduling overhead benchmark of the c backends, running hosted on linux
+# synthetic graphs with empty bodies are generated, compiled with the host compiler
+# and run through mango_main, reports:
+#   runtime   wall time of mango_main, best of --repeat runs
+#   dispatch  cpu time per action, runtime x min(cores, cpus) / actions
+#   wait      latency from a cross core predecessor to its successor, when the
+#             predecessor is the last one to run, from a build with timestamps in bodies
+# python -m purslane.bench.hosted --sizes 1000 10000 --num_cores 4 --json_output hosted.json
+# python -m purslane.bench.hosted --baseline hosted.json --tolerance 0.2
+
+import argparse
+import dataclasses
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import typing
+from purslane import dag
+from purslane.bench.graphs import LayeredGraph, ChainsGraph
+
+SHAPES = ['chains', 'wide', 'random', 'moesi']
+
+BACKENDS: typing.Dict[str, typing.Callable[[dag.Graph, str], None]] = {
+    'coop_switch': lambda graph, fname: dag.CooperativeCBackendGenF(
+        graph, True, False, fname, False, scheduler=dag.CooperativeScheduler.SWITCH),
+    'coop_table': lambda graph, fname: dag.CooperativeCBackendGenF(
+        graph, True, False, fname, False, scheduler=dag.CooperativeScheduler.TABLE),
+    'coop_backoff': lambda graph, fname: dag.CooperativeCBackendGenF(
+        graph, True, False, fname, False, wait=dag.CooperativeWait.BACKOFF),
+    # hosted 时 wfe 以 sched_yield 代替
+    'coop_yield': lambda graph, fname: dag.CooperativeCBackendGenF(
+        graph, True, False, fname, False, wait=dag.CooperativeWait.WFE),
+    'preempt_mutex': lambda graph, fname: dag.PreemptiveCBackendGenF(
+        graph, False, fname, dag.PreemptiveSync.MUTEX),
+    'preempt_futex': lambda graph, fname: dag.PreemptiveCBackendGenF(
+        graph, False, fname, dag.PreemptiveSync.FUTEX),
+}
+
+# 没有定义 MANGO_BENCH_TIMESTAMPS 时 body 为空
+_STAMP_DECL = (
+    '#ifdef MANGO_BENCH_TIMESTAMPS\n'
+    'void mango_bench_stamp(uint32_t sn);\n'
+    '#define MANGO_BENCH_STAMP(sn) mango_bench_stamp(sn)\n'
+    '#else\n'
+    '#define MANGO_BENCH_STAMP(sn)\n'
+    '#endif')
+
+_MAIN_C = '''
+#include <stdint.h>
+#include <stdio.h>
+#include <time.h>
+static uint64_t mango_bench_now(void){
+struct timespec t;
+clock_gettime(CLOCK_MONOTONIC, &t);
+return (uint64_t)t.tv_sec * 1000000000ull + t.tv_nsec;
+}
+uint64_t mango_bench_ts[%d];
+void mango_bench_stamp(uint32_t sn){
+mango_bench_ts[sn] = mango_bench_now();
+}
+void mango_main();
+int main(){
+uint64_t start = mango_bench_now();
+mango_main();
+printf("%%llu\\n", (unsigned long long)(mango_bench_now() - start));
+#ifdef MANGO_BENCH_TIMESTAMPS
+for(int i = 0; i < %d; i++){
+printf("%%llu\\n", (unsigned long long)mango_bench_ts[i]);
+}
+#endif
+return 0;
+}
+'''
+
+
+@dataclasses.dataclass
+class Result:
+    shape: str
+    backend: str
+    num_actions: int
+    num_cores: int
+    num_threads: int
+    runtime_ns: int
+    dispatch_ns: float
+    # 跨核等待延迟，没有跨核等待时为 None
+    wait_mean_ns: typing.Optional[float]
+    wait_p50_ns: typing.Optional[float]
+    wait_p99_ns: typing.Optional[float]
+
+    @property
+    def key(self) -> str:
+        return f'{self.shape}/{self.backend}/{self.num_actions}/{self.num_cores}'
+
+
+def BenchGraph(shape: str, num_nodes: int, num_cores: int, seed: int = 0) -> dag.Graph:
+    # chains 每个处理核一条链，没有跨核依赖
+    # wide   没有依赖
+    # random 分层随机图
+    # moesi  每个处理核一条链，链之间有较多近距离的依赖
+    random.seed(seed)
+    if shape == 'chains':
+        graph = ChainsGraph(num_nodes, num_cores, cross_prob=0.0, seed=seed)
+    elif shape == 'moesi':
+        graph = ChainsGraph(num_nodes, num_cores, cross_prob=0.3, window=4 * num_cores, seed=seed)
+    elif shape == 'wide':
+        graph = LayeredGraph(num_nodes, num_nodes, seed=seed)
+    elif shape == 'random':
+        graph = LayeredGraph(num_nodes, 16, seed=seed)
+    else:
+        raise ValueError(f'unknown shape {shape}')
+    graph.TransitiveReduction()
+    graph.num_executors = num_cores
+    if shape in ('chains', 'moesi'):
+        for i, node in enumerate(graph.nodes):
+            node.executor_id = i % num_cores
+    else:
+        graph.AssignExecutorSpread()
+
+    graph.AddCDecl(_STAMP_DECL)
+    for node in graph.nodes:
+        node.c_src = f'MANGO_BENCH_STAMP({node.sn});\n'
+    return graph
+
+
+def WaitLatencies(graph: dag.Graph, ts: typing.List[int]) -> typing.List[int]:
+    # 最后运行的前序在其他处理核上时，前序 body 到当前 body 的时间
+    latencies = []
+    for node in graph.nodes:
+        if not node.predecessors:
+            continue
+        last = max(node.predecessors, key=lambda p: ts[p.sn])
+        if last.executor_id != node.executor_id:
+            latencies.append(ts[node.sn] - ts[last.sn])
+    return latencies
+
+
+def _Percentile(values: typing.List[int], q: float) -> float:
+    values = sorted(values)
+    return float(values[min(len(values) - 1, int(q * len(values)))])
+
+
+def RunBackend(graph: dag.Graph, shape: str, backend: str, workdir: str, repeat: int,
+               cc: str = 'gcc', cflags: typing.List[str] = None, timeout: float = 60,
+               seed: int = 0) -> Result:
+    cflags = ['-O2'] if cflags is None else cflags
+    num_nodes = len(graph.nodes)
+    soc = os.path.join(workdir, f'{shape}_{backend}.c')
+    main = os.path.join(workdir, 'main.c')
+    with open(main, 'w') as f:
+        f.write(_MAIN_C % (num_nodes, num_nodes))
+    # 线程划分使用全局随机数，各后端相同
+    random.seed(seed)
+    BACKENDS[backend](graph, soc)
+    num_threads = len({(n.executor_id, n.thread_id) for n in graph.nodes})
+
+    def Build(exe: str, defines: typing.List[str]) -> None:
+        subprocess.run([cc, '-D_GNU_SOURCE', *defines, *cflags, '-pthread', '-o', exe, main, soc],
+                       check=True, capture_output=True)
+
+    def Run(exe: str) -> typing.List[int]:
+        ret = subprocess.run([exe], check=True, capture_output=True, timeout=timeout, text=True)
+        return [int(line) for line in ret.stdout.split()]
+
+    exe = os.path.join(workdir, f'{shape}_{backend}')
+    Build(exe, [])
+    runtime = min(Run(exe)[0] for _ in range(repeat))
+
+    Build(exe + '_ts', ['-DMANGO_BENCH_TIMESTAMPS'])
+    latencies = WaitLatencies(graph, Run(exe + '_ts')[1:])
+    wait = [None] * 3
+    if latencies:
+        wait = [statistics.fmean(latencies), _Percentile(latencies, 0.5), _Percentile(latencies, 0.99)]
+
+    parallel = min(graph.num_executors, os.cpu_count() or 1)
+    return Result(shape, backend, num_nodes, graph.num_executors, num_threads, runtime,
+                  runtime * parallel / max(num_nodes, 1), *wait)
+
+
+def Compare(results: typing.List[Result], baseline: typing.Dict[str, dict],
+            tolerance: float) -> typing.List[str]:
+    # 运行时间超过基准 (1 + tolerance) 倍的项
+    regressions = []
+    for r in results:
+        base = baseline.get(r.key)
+        if base is not None and r.runtime_ns > base['runtime_ns'] * (1 + tolerance):
+            regressions.append(f'{r.key} runtime {r.runtime_ns}ns, baseline {base["runtime_ns"]}ns')
+    return regressions
+
+
+def _Ns(value: typing.Optional[float]) -> str:
+    return '-' if value is None else f'{value:.0f}'
+
+
+def Main():
+    parser = argparse.ArgumentParser(
+        description='hosted scheduling overhead benchmark of the c backends')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=SHAPES)
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--num_cores', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each binary, the best runtime is reported')
+    parser.add_argument('--cc', default='gcc')
+    parser.add_argument('--cflags', nargs='*', default=['-O2'])
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='timeout of one run in seconds')
+    parser.add_argument('--workdir', default=None,
+                        help='keep generated sources and binaries here, default is a temporary directory')
+    parser.add_argument('--json_output', default=None)
+    parser.add_argument('--baseline', default=None,
+                        help='json output of an earlier run, exit with 1 on runtime regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed runtime increase over the baseline')
+    args = parser.parse_args()
+
+    if shutil.which(args.cc) is None:
+        sys.exit(f'{args.cc} not found')
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.workdir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        print(f'{"shape":>7} {"backend":>14} {"actions":>8} {"threads":>8} {"runtime(us)":>12} '
+              f'{"dispatch(ns)":>13} {"wait(ns)":>9} {"p50":>8} {"p99":>8}')
+        for size in args.sizes:
+            for shape in args.shapes:
+                graph = BenchGraph(shape, size, args.num_cores, args.seed)
+                for backend in args.backends:
+                    r = RunBackend(graph, shape, backend, workdir, args.repeat,
+                                   args.cc, args.cflags, args.timeout, args.seed)
+                    results.append(r)
+                    print(f'{r.shape:>7} {r.backend:>14} {r.num_actions:>8} {r.num_threads:>8} '
+                          f'{r.runtime_ns / 1000:>12.1f} {r.dispatch_ns:>13.1f} {_Ns(r.wait_mean_ns):>9} '
+                          f'{_Ns(r.wait_p50_ns):>8} {_Ns(r.wait_p99_ns):>8}')
+
+    if args.json_output is not None:
+        with open(args.json_output, 'w') as f:
+            json.dump({r.key: dataclasses.asdict(r) for r in results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = Compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f'regression: {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
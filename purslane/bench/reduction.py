@@ -0,0 +1,109 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+# 
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+# 
+#  https://www.apache.org/licenses/LICENSE-2.0
+# 
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# scaling benchmark of Graph.TransitiveReduction
+# python -m purslane.bench.reduction --sizes 1000 10000 50000 200000
+
+import argparse
+import time
+import tracemalloc
+import typing
+from purslane import dag
+from purslane.bench.graphs import LayeredGraph, ChainsGraph, NumEdges
+
+
+def NaiveTransitiveReduction(graph: dag.Graph):
+    # reference, the dict based implementation reduction used to be
+    all_preds: typing.Dict[int, typing.Dict[int, dag.Node]] = {}
+    for node in graph.NodesInTopoOrder():
+        aps = {p.sn: p for p in node.predecessors}
+        for p in node.predecessors:
+            aps.update(all_preds[p.sn])
+        all_preds[node.sn] = aps
+
+    for node in graph.nodes:
+        preds = list(node.predecessors)
+        for pr in node.predecessors:
+            for ppr in node.predecessors:
+                if pr.sn in all_preds[ppr.sn]:
+                    preds.remove(pr)
+                    break
+        node.predecessors = dict.fromkeys(preds)
+
+
+def Edges(graph: dag.Graph) -> typing.List[typing.Tuple[int, int]]:
+    return [(p.sn, n.sn) for n in graph.Nodes() for p in n.predecessors]
+
+
+def Measure(func, trace_memory: bool) -> typing.Tuple[float, int]:
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def Main():
+    parser = argparse.ArgumentParser(
+        description='transitive reduction scaling benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 50000, 200000])
+    parser.add_argument('--shape', choices=['layered', 'chains'], default='layered',
+                        help='layered random graph or long chains with cross edges')
+    parser.add_argument('--width', type=int, default=64,
+                        help='number of nodes in a layer, or number of chains')
+    parser.add_argument('--fan_in', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--naive_limit', type=int, default=20000,
+                        help='run the naive reference only up to this size')
+    parser.add_argument('--chain_limit', type=int, default=10000,
+                        help='run the chain mode only up to this size')
+    parser.add_argument('--trace_memory', action='store_true',
+                        help='record peak memory, much slower')
+    args = parser.parse_args()
+
+    print(f'{"nodes":>8} {"edges":>8} {"reduced":>8} {"mode":>6} {"time(s)":>9} {"peak(MB)":>9}')
+    for size in args.sizes:
+        modes = []
+        if size <= args.naive_limit:
+            modes.append(('naive', NaiveTransitiveReduction))
+        modes.append(('bitset', lambda g: g.TransitiveReduction(
+            dag.ReachabilityMode.BITSET)))
+        if size <= args.chain_limit:
+            modes.append(('chain', lambda g: g.TransitiveReduction(
+                dag.ReachabilityMode.CHAIN)))
+
+        reference = None
+        for name, func in modes:
+            if args.shape == 'layered':
+                graph = LayeredGraph(size, args.width, args.fan_in, seed=args.seed)
+            else:
+                graph = ChainsGraph(size, args.width, seed=args.seed)
+            num_edges = NumEdges(graph)
+            elapsed, peak = Measure(lambda: func(graph), args.trace_memory)
+            edges = Edges(graph)
+            if reference is None:
+                reference = edges
+            elif edges != reference:
+                raise RuntimeError(f'{name} reduction differs at size {size}')
+            print(f'{size:>8} {num_edges:>8} {len(edges):>8} {name:>6} {elapsed:>9.3f} {peak/2**20:>9.1f}')
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,132 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+# 
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+# 
+#  https://www.apache.org/licenses/LICENSE-2.0
+# 
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# scaling benchmark of dag.CBackendThreadAssign
+# rounds/polls simulate the cooperative runtime: every round each core calls the
+# switch function of all its threads once, polls counts the calls
+# python -m purslane.bench.thread_assign --sizes 1000 10000 50000 --num_executors 16
+
+import argparse
+import random
+import typing
+from purslane import dag
+from purslane.bench.graphs import LayeredGraph, ChainsGraph
+from purslane.bench.reduction import Measure
+
+
+def NaiveCBackendThreadAssign(graph: dag.Graph) -> typing.List[dag.Core]:
+    # reference, scans all threads of the core and keeps ancestors of all nodes
+    graph.UpdateAllPredecessors()
+    cores = [dag.Core(id=i) for i in range(graph.num_executors)]
+    for node in graph.NodesInTopoOrder(in_random=True):
+        core = cores[node.executor_id]
+        for thd in core.threads:
+            if node.HasAncestor(thd.nodes[-1]):
+                break
+        else:
+            thd = dag.Thread(len(core.threads))
+            core.threads.append(thd)
+        node.thread_id = thd.id
+        node.sn_in_thread = len(thd.nodes)
+        thd.nodes.append(node)
+    return cores
+
+
+def Threads(cores: typing.List[dag.Core]) -> typing.List[typing.List[typing.List[int]]]:
+    return [[[n.sn for n in thd.nodes] for thd in core.threads] for core in cores]
+
+
+def Rounds(cores: typing.List[dag.Core]) -> typing.Tuple[int, int]:
+    # actions finished in a round are visible to other cores in the next round
+    done: typing.Set[dag.Node] = set()
+    pos = [[0] * len(core.threads) for core in cores]
+    left = sum(len(thd.nodes) for core in cores for thd in core.threads)
+    rounds = polls = 0
+    while left > 0:
+        rounds += 1
+        finished = []
+        for core in cores:
+            for thd in core.threads:
+                i = pos[core.id][thd.id]
+                if i >= len(thd.nodes):
+                    continue
+                polls += 1
+                node = thd.nodes[i]
+                if all(p in done or (p.executor_id == core.id and p.thread_id == thd.id)
+                       for p in node.predecessors):
+                    pos[core.id][thd.id] = i + 1
+                    finished.append(node)
+        if not finished:
+            raise RuntimeError('threads deadlock')
+        done.update(finished)
+        left -= len(finished)
+    return rounds, polls
+
+
+def Main():
+    parser = argparse.ArgumentParser(
+        description='c backend thread assignment scaling benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 50000])
+    parser.add_argument('--shape', choices=['layered', 'chains'], default='layered',
+                        help='layered random graph or long chains with cross edges')
+    parser.add_argument('--width', type=int, default=64,
+                        help='number of nodes in a layer, or number of chains')
+    parser.add_argument('--num_executors', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--naive_limit', type=int, default=20000,
+                        help='run the naive reference only up to this size')
+    parser.add_argument('--chain_cover_limit', type=int, default=50000,
+                        help='run the chain cover mode only up to this size')
+    parser.add_argument('--trace_memory', action='store_true',
+                        help='record peak memory, much slower')
+    args = parser.parse_args()
+
+    print(f'{"nodes":>8} {"threads":>8} {"mode":>11} {"time(s)":>9} {"peak(MB)":>9} {"rounds":>8} {"polls":>10}')
+    for size in args.sizes:
+        modes = []
+        if size <= args.naive_limit:
+            modes.append(('naive', NaiveCBackendThreadAssign))
+        modes.append(('greedy', dag.CBackendThreadAssign))
+        if size <= args.chain_cover_limit:
+            modes.append(('chain_cover', lambda g: dag.CBackendThreadAssign(
+                g, dag.ThreadAssignMode.CHAIN_COVER)))
+
+        if args.shape == 'layered':
+            graph = LayeredGraph(size, args.width, seed=args.seed)
+        else:
+            graph = ChainsGraph(size, args.width, seed=args.seed)
+        graph.TransitiveReduction()
+        graph.num_executors = args.num_executors
+        graph.AssignExecutorSpread()
+
+        reference = None
+        for name, func in modes:
+            # 相同的随机拓扑序
+            random.seed(args.seed)
+            cores = []
+            elapsed, peak = Measure(lambda: cores.extend(func(graph)), args.trace_memory)
+            threads = Threads(cores)
+            if name == 'chain_cover':
+                pass
+            elif reference is None:
+                reference = threads
+            elif threads != reference:
+                raise RuntimeError(f'{name} thread assignment differs at size {size}')
+            num_threads = sum(len(core.threads) for core in cores)
+            rounds, polls = Rounds(cores)
+            print(f'{size:>8} {num_threads:>8} {name:>11} {elapsed:>9.3f} {peak/2**20:>9.1f} {rounds:>8} {polls:>10}')
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,162 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 生成结果缓存
+# key 为场景源码（所有已加载的非标准库模块，包括 purslane 自身和 ivy_app_cfg）、随机种子和参数的 sha256，
+# 命中时直接恢复上次生成的文件，不再运行场景
+# 每个条目一个目录，目录中 manifest.json 记录输出文件的绝对路径，其 mtime 作为最近使用时间，超出容量时按 LRU 淘汰
+# 条目先写入临时目录再重命名，多个生成进程可以共享同一个缓存目录
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import sysconfig
+import typing
+logger = logging.getLogger(__name__)
+
+# 缓存格式或生成语义变化时修改，使旧条目失效
+CACHE_VERSION = 2
+
+_MANIFEST = 'manifest.json'
+
+
+def _FileDigest(fname: str) -> str:
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def LocalModules() -> typing.Dict[str, str]:
+    # 已加载模块中不属于 python 安装的模块名 -> 源文件
+    # purslane 即使安装到 site-packages 也计入，升级 purslane 后缓存失效
+    skip = {os.path.realpath(p) for p in (sysconfig.get_path('stdlib'), sysconfig.get_path('platstdlib'),
+                                          sysconfig.get_path('purelib'), sysconfig.get_path('platlib'))}
+    modules = {}
+    for name, mod in list(sys.modules.items()):
+        fname = getattr(mod, '__file__', None)
+        if fname is None or not fname.endswith('.py') or not os.path.isfile(fname):
+            continue
+        fname = os.path.realpath(fname)
+        if name.split('.')[0] != 'purslane' and any(fname.startswith(p + os.sep) for p in skip):
+            continue
+        modules[name] = fname
+    return modules
+
+
+def SourceFiles() -> typing.List[str]:
+    # 本地模块的源文件，以及入口脚本
+    files = set(LocalModules().values())
+    if sys.argv and sys.argv[0].endswith('.py') and os.path.isfile(sys.argv[0]):
+        files.add(os.path.realpath(sys.argv[0]))
+    return sorted(files)
+
+
+def Key(params: dict, sources: typing.Iterable[str]) -> str:
+    # params 需要能 json 序列化，包括随机种子和所有影响生成结果的参数
+    h = hashlib.sha256()
+    h.update(json.dumps({'version': CACHE_VERSION, 'params': params},
+                        sort_keys=True, default=str).encode())
+    for fname in sources:
+        h.update(f'\n{fname}:{_FileDigest(fname)}'.encode())
+    return h.hexdigest()
+
+
+def _ReplaceIfChanged(src: str, dst: str) -> None:
+    # 内容相同的文件不重写，保持 mtime，避免触发重新编译
+    if os.path.isfile(dst) and os.path.getsize(dst) == os.path.getsize(src):
+        if _FileDigest(dst) == _FileDigest(src):
+            return
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    shutil.copyfile(src, tmp)
+    # 重命名替换，已经以写方式打开原文件的句柄不会影响恢复的内容
+    os.replace(tmp, dst)
+
+
+class GenerationCache:
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _EntryDir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def Restore(self, key: str) -> typing.Optional[typing.List[str]]:
+        # 命中时恢复到保存时的绝对路径并返回文件名列表，未命中返回 None
+        entry = self._EntryDir(key)
+        try:
+            with open(os.path.join(entry, _MANIFEST)) as f:
+                outputs = json.load(f)['outputs']
+            for i, fname in enumerate(outputs):
+                _ReplaceIfChanged(os.path.join(entry, str(i)), fname)
+        except (OSError, ValueError, KeyError) as e:
+            # 条目不存在，或者正在被其他进程淘汰
+            if os.path.isdir(entry):
+                logger.warning(f'broken cache entry {entry}: {e}')
+            return None
+        # 更新最近使用时间
+        os.utime(os.path.join(entry, _MANIFEST))
+        return outputs
+
+    def Store(self, key: str, outputs: typing.List[str]) -> None:
+        entry = self._EntryDir(key)
+        if os.path.isdir(entry):
+            return
+        # 恢复时与当前目录无关
+        outputs = [os.path.abspath(fname) for fname in outputs]
+        tmp = f'{entry}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for i, fname in enumerate(outputs):
+            shutil.copyfile(fname, os.path.join(tmp, str(i)))
+        with open(os.path.join(tmp, _MANIFEST), 'w') as f:
+            json.dump({'outputs': outputs}, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # 其他进程已经写入了相同的条目
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.Evict()
+
+    def Entries(self) -> typing.List[typing.Tuple[float, int, str]]:
+        # (最近使用时间, 字节数, 目录)，按最近使用时间从旧到新排序
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                continue
+            try:
+                atime = os.stat(os.path.join(entry, _MANIFEST)).st_mtime
+                size = sum(e.stat().st_size for e in os.scandir(entry))
+            except OSError:
+                continue
+            entries.append((atime, size, entry))
+        entries.sort()
+        return entries
+
+    def Evict(self) -> None:
+        entries = self.Entries()
+        total = sum(e[1] for e in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            logger.info(f'evicting cache entry {entry}')
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
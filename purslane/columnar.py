@@ -0,0 +1,75 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 图的列存储，保存为 numpy .npz
+# 本模块只负责格式版本和字符串表，各列的内容见 dag.Graph.DumpNpz
+# 整数列为 int64，字符串表的数据为 uint8
+
+import typing
+import numpy
+
+# 增加或修改列时递增，LoadNpz 拒绝不认识的版本
+NPZ_VERSION = 1
+
+
+class StringTable:
+    # 字符串去重，相同的 c_src/sv_src 只保存一次，None 的下标为 -1
+    def __init__(self):
+        self._index: typing.Dict[str, int] = {}
+        self.strings: typing.List[str] = []
+
+    def Add(self, s: typing.Optional[str]) -> int:
+        if s is None:
+            return -1
+        idx = self._index.get(s)
+        if idx is None:
+            idx = self._index[s] = len(self.strings)
+            self.strings.append(s)
+        return idx
+
+    def Arrays(self, prefix: str) -> typing.Dict[str, numpy.ndarray]:
+        encoded = [s.encode() for s in self.strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+        return {f'{prefix}_offsets': offsets, f'{prefix}_data': blob}
+
+    @staticmethod
+    def Load(arrays: typing.Dict[str, numpy.ndarray], prefix: str) -> typing.List[str]:
+        offsets = arrays[f'{prefix}_offsets'].tolist()
+        blob = arrays[f'{prefix}_data'].tobytes()
+        return [blob[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+
+def Column(values: typing.Iterable[int]) -> numpy.ndarray:
+    return numpy.fromiter(values, dtype=numpy.int64)
+
+
+def WriteNpz(fname: str, arrays: typing.Dict[str, numpy.ndarray], compress: bool = False) -> None:
+    # meta 列的第一个数为版本号，之后是调用者的 meta
+    arrays = dict(arrays)
+    arrays['meta'] = numpy.concatenate([Column([NPZ_VERSION]), arrays.get('meta', Column([]))])
+    with open(fname, 'wb') as f:
+        (numpy.savez_compressed if compress else numpy.savez)(f, **arrays)
+
+
+def ReadNpz(fname: str) -> typing.Dict[str, numpy.ndarray]:
+    # 返回的 meta 不包含版本号
+    with numpy.load(fname) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    version = int(arrays['meta'][0])
+    if version != NPZ_VERSION:
+        raise RuntimeError(f'unsupported npz version {version} of {fname}, {NPZ_VERSION} expected')
+    arrays['meta'] = arrays['meta'][1:]
+    return arrays
@@ -14,6 +14,7 @@
 
 
 from enum import Enum
+import collections
 import io
 import typing
 import typing_extensions
@@ -22,7 +23,12 @@ import json
 import re
 import logging
 import random
+import array
+import heapq
+import math
 from typing import List
+from purslane import columnar
+from purslane import profiler
 logger = logging.getLogger(__name__)
 
 
@@ -32,17 +38,29 @@ class Executor:
 
 
 class Node:
+    # 使用 __slots__ 减少每个节点的内存占用
+    # 前序、后继使用 dict 作为有序集合，保持插入顺序，插入、删除、查询都是 O(1)
+    __slots__ = ('name', 'sn', 'executor_id', 'is_target', 'c_src', 'sv_src',
+                 'predecessors', 'successors', 'ancestors', 'preds_left',
+                 'uvm_name', 'uvm_class_name',
+                 'sn_in_thread', 'thread_id', 'body_func_name', 'body_args',
+                 'executor_assigned', 'cost')
+
     def __init__(self, name: str, preds: typing.List[typing_extensions.Self] = None, pred: typing_extensions.Self = None):
         self.name = name
         self.sn = 0
         self.executor_id = None
+        # executor 由 Graph.AssignExecutor 分配，而不是由 action 指定
+        self.executor_assigned = False
+        # action 的估计耗时，整数，单位由场景自定，None 表示使用默认值，见 purslane.makespan
+        self.cost = None
         self.is_target = False
         self.c_src = None
         self.sv_src = None
-        self.predecessors: typing.List[Node] = []
-        self.successors: typing.List[Node] = []
-        self.all_predecessors: typing.Dict[int, Node] = []
-        self.all_predecessor_hops: typing.Dict[int, int] = []
+        self.predecessors: typing.Dict[Node, None] = {}
+        self.successors: typing.Dict[Node, None] = {}
+        # bitset of all predecessors (recursively), bit i stands for node with sn i
+        self.ancestors = 0
 
         # for traversing in topological order
         self.preds_left = 0
@@ -55,22 +73,23 @@ class Node:
         self.sn_in_thread = 0
         self.thread_id = 0
         self.body_func_name = ''
+        # 调用 body 函数时附加的参数，参数化 body 的常量表项
+        self.body_args = ''
 
         if preds:
-            self.predecessors = preds
+            self.predecessors = dict.fromkeys(preds)
 
         if pred:
-            self.predecessors.append(pred)
+            self.predecessors[pred] = None
 
     def AddPredecessor(self, act: typing_extensions.Self):
         if act is None:
             return
 
-        if act not in self.predecessors:
-            self.predecessors.append(act)
+        self.predecessors[act] = None
 
     def DelPredecessor(self, act: typing_extensions.Self):
-        self.predecessors.remove(act)
+        del self.predecessors[act]
 
     def Predecessors(self) -> typing.Generator[typing_extensions.Self, None, None]:
         for p in self.predecessors:
@@ -86,13 +105,14 @@ class Node:
     #     yield back
 
     def UpdateAllPredecessors(self):
-        self.all_predecessors = {node.sn: node for node in self.predecessors}
+        ancestors = 0
         for pred in self.predecessors:
-            self.all_predecessors.update(pred.all_predecessors)
+            ancestors |= pred.ancestors | (1 << pred.sn)
+        self.ancestors = ancestors
 
-        # self.all_predecessor_hops = {node.sn:1 for node in self.predecessors}
-        # for pred in self.predecessors:
-        #     pass
+    def HasAncestor(self, node: typing_extensions.Self) -> bool:
+        # valid after UpdateAllPredecessors
+        return (self.ancestors >> node.sn) & 1 == 1
 
     def NumPredecessors(self) -> int:
         return len(self.predecessors)
@@ -102,12 +122,10 @@ class Node:
             p.AddSuccessor(self)
 
     def AddSuccessor(self, act: typing_extensions.Self):
-        if act not in self.successors:
-            self.successors.append(act)
+        self.successors[act] = None
 
     def DelSuccessor(self, node: typing_extensions.Self):
-        if node in self.successors:
-            self.successors.remove(node)
+        self.successors.pop(node, None)
 
     def Successors(self) -> typing.Generator[typing_extensions.Self, None, None]:
         for s in self.successors:
@@ -117,9 +135,143 @@ class Node:
         return len(self.successors)
 
 
+class ReachabilityMode(Enum):
+    # 以 sn 为下标的整数 bitset，适合节点数较少或者依赖稀疏的图
+    BITSET = 1
+    # 链分解，每个节点记录每条链上可达的最大位置，内存为 节点数 x 链数
+    CHAIN = 2
+
+
+class Reachability:
+    '''
+    ancestor labels of nodes computed in topological order
+
+    BITSET: label is an int, bit i set if node with sn i is an ancestor
+    CHAIN: nodes are decomposed into chains while visiting, label is a list
+    holding for every chain the max position reaching the node, -1 or missing
+    if none. a node extends the first chain whose tail is one of its ancestors
+    '''
+
+    def __init__(self, graph: 'Graph', mode: ReachabilityMode = ReachabilityMode.BITSET):
+        self.graph = graph
+        self.mode = mode
+        # labels of all ancestors of nodes (excluding the node itself), indexed by sn
+        self._labels: typing.Dict[int, typing.Any] = {}
+        # number of successors not visited yet, labels are released when it reaches 0
+        self._succs_left: typing.Dict[int, int] = {}
+
+        # chain decomposition
+        self._chain_of: typing.Dict[int, int] = {}
+        self._pos_of: typing.Dict[int, int] = {}
+        self._chain_lens: typing.List[int] = []
+
+    def NumChains(self) -> int:
+        return len(self._chain_lens)
+
+    def _Union(self, labels: typing.Iterable[typing.Any]):
+        if self.mode == ReachabilityMode.BITSET:
+            union = 0
+            for label in labels:
+                union |= label
+            return union
+
+        union = []
+        for label in labels:
+            if len(label) > len(union):
+                union, label = label, union
+            union = list(map(max, union, label)) + union[len(label):]
+        return union
+
+    def _Closure(self, node: Node):
+        # label of the node and all its ancestors
+        label = self._labels[node.sn]
+        if self.mode == ReachabilityMode.BITSET:
+            return label | (1 << node.sn)
+        chain = self._chain_of[node.sn]
+        closure = label + [-1] * (chain + 1 - len(label))
+        closure[chain] = self._pos_of[node.sn]
+        return closure
+
+    def _AssignChain(self, node: Node, label: typing.List[int]):
+        chain = None
+        for c, pos in enumerate(label):
+            if pos >= 0 and pos == self._chain_lens[c] - 1:
+                chain = c
+                break
+        if chain is None:
+            chain = len(self._chain_lens)
+            self._chain_lens.append(0)
+        self._chain_of[node.sn] = chain
+        self._pos_of[node.sn] = self._chain_lens[chain]
+        self._chain_lens[chain] += 1
+
+    def Contains(self, label, node: Node) -> bool:
+        if self.mode == ReachabilityMode.BITSET:
+            return (label >> node.sn) & 1 == 1
+        chain = self._chain_of[node.sn]
+        return chain < len(label) and label[chain] >= self._pos_of[node.sn]
+
+    def Label(self, node: Node):
+        return self._labels[node.sn]
+
+    def AncestorsUnion(self, nodes: typing.Iterable[Node]):
+        # union of all ancestors of nodes, nodes themselves are not included
+        return self._Union(self._labels[n.sn] for n in nodes)
+
+    def Visit(self, node: Node):
+        # all predecessors must have been visited, returns label of ancestors
+        label = self._Union(self._Closure(p) for p in node.predecessors)
+        if self.mode == ReachabilityMode.CHAIN:
+            self._AssignChain(node, label)
+        self._labels[node.sn] = label
+        self._succs_left[node.sn] = len(node.successors)
+        return label
+
+    def Release(self, node: Node, preds: typing.Iterable[Node]):
+        # the node and its predecessors(before any change) have been visited,
+        # labels are no longer needed once all successors are visited
+        for pred in dict.fromkeys(preds):
+            self._succs_left[pred.sn] -= 1
+            if self._succs_left[pred.sn] <= 0:
+                del self._labels[pred.sn]
+        if self._succs_left[node.sn] <= 0:
+            del self._labels[node.sn]
+
+    def Build(self):
+        # keep labels of all nodes
+        for node in self.graph.NodesInTopoOrder():
+            self.Visit(node)
+
+    def Reaches(self, src: Node, dst: Node) -> bool:
+        # valid after Build, True if src is an ancestor of dst
+        return self.Contains(self._labels[dst.sn], src)
+
+
+class _Junction:
+    # non-target node kept during transitive reduction
+    def __init__(self, reach: Reachability, node: Node, label, preds: typing.List[Node]):
+        # expanded predecessors, all targets and not reachable from each other
+        self.preds = preds
+        if reach.mode == ReachabilityMode.BITSET:
+            self.mask = 0
+            for pr in preds:
+                self.mask |= 1 << pr.sn
+            # ancestors of preds
+            self.ancestors = label & ~self.mask
+        else:
+            self.members = set(preds)
+            self.label = label
+
+
 class ExecutorAssignPolicy(Enum):
     SPREAD = 1
     RANDOM = 2
+    # 按关键路径的列表调度，长依赖链尽量留在同一个处理核上，同时平衡各处理核的负载
+    CRITICAL_PATH = 3
+
+
+# CRITICAL_PATH 的代价模型，每个 action 耗时为 1，跨核依赖额外等待的时间
+CROSS_CORE_WAIT_COST = 1
 
 
 class Graph:
@@ -128,6 +280,10 @@ class Graph:
         self.num_executors = num_executors
         self.c_headers: typing.List[str] = []
         self.c_decls: typing.List[str] = []
+        # node.thread_id、sn_in_thread 已由 CBackendThreadAssign 划分，或者从保存的图中读出
+        self.threads_assigned = False
+        # 旧版本保存的图没有 executor_assigned，无法区分 action 指定的 executor，不能重新分配
+        self.executor_assigned_known = True
 
     def AddNode(self, node):
         self.nodes.append(node)
@@ -157,11 +313,16 @@ class Graph:
             if node.preds_left <= 0:
                 ready_nodes.append(node)
 
+        if not in_random:
+            # deque keeps the same order as popping from the front of a list
+            ready_nodes = collections.deque(ready_nodes)
+
         while len(ready_nodes) > 0:
-            ridx = 0
             if in_random:
                 ridx = random.randrange(0, len(ready_nodes))
-            front = ready_nodes.pop(ridx)
+                front = ready_nodes.pop(ridx)
+            else:
+                front = ready_nodes.popleft()
             yield front
             for succ in front.Successors():
                 succ.preds_left -= 1
@@ -181,24 +342,44 @@ class Graph:
         for node in self.NodesInTopoOrder():
             node.UpdateAllPredecessors()
 
-    def RemoveNonTargetNodes(self):
+    def _TopoSortedNodes(self) -> typing.List[Node]:
+        # nodes added by dsl scopes are already in topological order
+        pos = {node: i for i, node in enumerate(self.nodes)}
+        for i, node in enumerate(self.nodes):
+            for pred in node.predecessors:
+                if pos.get(pred, -1) >= i:
+                    return list(self.NodesInTopoOrder())
+        return self.nodes
+
+    def RemoveNonTargetNodes(self, keep_junctions: bool = False):
+        # 按拓扑序收缩非目标节点，把非目标节点的每个后继连接到其每个前序
+        # keep_junctions 时保留前序和后继都较多的非目标节点（纯汇聚/分发点），
+        # 用 m+n 条边代替 m*n 条边，由 TransitiveReduction 展开
         self.UpdateSuccessors()
 
-        for node in self.nodes:
-            if not node.is_target:
-                for succ in node.Successors():
-                    succ.DelPredecessor(node)
-                    for pred in node.predecessors:
-                        succ.AddPredecessor(pred)
-
-        nodes = []
-        for node in self.nodes:
+        removed = set()
+        for node in self._TopoSortedNodes():
             if node.is_target:
-                logger.debug(f'append target {node.name}')
-                nodes.append(node)
-            else:
-                logger.debug(f'remove node {node.name}')
-        self.nodes = nodes
+                continue
+
+            ps = node.predecessors
+            ss = node.successors
+            if keep_junctions and len(ps) > 1 and len(ss) > 1 and len(ps) * len(ss) > len(ps) + len(ss):
+                continue
+
+            for succ in ss:
+                succ_preds = succ.predecessors
+                del succ_preds[node]
+                for pred in ps:
+                    succ_preds[pred] = None
+            for pred in ps:
+                pred_succs = pred.successors
+                del pred_succs[node]
+                for succ in ss:
+                    pred_succs[succ] = None
+            removed.add(node)
+
+        self.nodes = [node for node in self.nodes if node not in removed]
 
     def AssignSN(self):
         sn = 0
@@ -206,26 +387,103 @@ class Graph:
             n.sn = sn
             sn = sn + 1
 
-    def TransitiveReduction(self):
-        # TODO
-        # naive implemetation
-        self.UpdateAllPredecessors()
+    def TransitiveReduction(self, mode: ReachabilityMode = ReachabilityMode.BITSET,
+                            expand_junctions: bool = False):
+        # sn must be assigned and unique
+        # 按拓扑序计算每个节点所有前序的集合（bitset 或 chain 标签），
+        # 一个直接前序如果是另一个直接前序的祖先，则是冗余边
+        # 前序的标签在其所有后继处理完毕以后立即释放，避免保存完整传递闭包
+        # 默认不删除任何节点；expand_junctions 时 RemoveNonTargetNodes(keep_junctions=True)
+        # 保留的非目标节点在此展开并删除，删除以后重新 AssignSN
+        reach = Reachability(self, mode)
+        junctions: typing.Dict[Node, _Junction] = {}
+        for node in self.NodesInTopoOrder():
+            label = reach.Visit(node)
+            preds = node.predecessors
+            # 直接前序不可能是自身的祖先，所以无需排除自身
+            redundant = reach.AncestorsUnion(preds)
+            reduced = [pr for pr in preds if not reach.Contains(redundant, pr)]
+            if not expand_junctions:
+                node.predecessors = dict.fromkeys(reduced)
+                reach.Release(node, preds)
+                continue
+
+            if any(not pr.is_target for pr in reduced):
+                reduced = self._ExpandJunctions(reach, reduced, junctions)
 
-        for node in self.nodes:
-            preds = node.predecessors[:]
-            for pr in node.predecessors:
-                for ppr in node.predecessors:
-                    if pr.sn in ppr.all_predecessors:
-                        preds.remove(pr)
-                        break
-            node.predecessors = preds
-
-    def AssignExecutor(self, num_executors: int = 2, policy: ExecutorAssignPolicy = ExecutorAssignPolicy.SPREAD):
+            if node.is_target:
+                node.predecessors = dict.fromkeys(reduced)
+            else:
+                junctions[node] = _Junction(reach, node, label, reduced)
+            reach.Release(node, preds)
+
+        if len(junctions) > 0:
+            self.nodes = [node for node in self.nodes if node.is_target]
+            self.AssignSN()
+
+    def _ExpandJunctions(self, reach: Reachability, reduced: typing.List[Node],
+                         junctions: typing.Dict[Node, '_Junction']) -> typing.List[Node]:
+        # 把约简后的前序中的汇聚点替换为其（已展开、约简的）前序
+        # 普通前序不会变成冗余：如果它是某个汇聚点前序的祖先，则也是汇聚点的祖先，已经被约简
+        # 汇聚点的前序之间互不可达，只需要检查是否为普通前序或其他汇聚点的祖先
+        regular = [pr for pr in reduced if pr.is_target]
+        juncs = [junctions[pr] for pr in reduced if not pr.is_target]
+        redundant = reach.AncestorsUnion(regular)
+
+        candidates = {}
+        for junc in juncs:
+            for pr in junc.preds:
+                candidates[pr] = None
+
+        if reach.mode == ReachabilityMode.BITSET:
+            mask = 0
+            for junc in juncs:
+                mask |= junc.mask
+                redundant |= junc.ancestors
+            if mask & redundant == 0:
+                return regular + list(candidates)
+            return regular + [pr for pr in candidates if not reach.Contains(redundant, pr)]
+
+        def IsRedundant(pr: Node) -> bool:
+            if reach.Contains(redundant, pr):
+                return True
+            for junc in juncs:
+                if pr not in junc.members and reach.Contains(junc.label, pr):
+                    return True
+            return False
+
+        return regular + [pr for pr in candidates if not IsRedundant(pr)]
+
+    def AssignExecutor(self, num_executors: int = 2, policy: ExecutorAssignPolicy = ExecutorAssignPolicy.SPREAD,
+                       cross_fraction: float = 0.0):
+        # cross_fraction 只用于 CRITICAL_PATH
+        self.num_executors = num_executors
         if policy == ExecutorAssignPolicy.SPREAD:
-            self.AssignExeuctorSpread()
+            self.AssignExecutorSpread()
+        elif policy == ExecutorAssignPolicy.CRITICAL_PATH:
+            self.AssignExecutorCriticalPath(cross_fraction)
         else:
             self.AssignExecutorRandom()
 
+    def ReassignExecutors(self, num_executors: int, policy: ExecutorAssignPolicy = ExecutorAssignPolicy.SPREAD,
+                          cross_fraction: float = 0.0):
+        # 重新分配所有不是由 action 指定的 executor
+        if not self.executor_assigned_known:
+            logger.critical('the graph is saved without executor_assigned, '
+                            'executors bound by actions are unknown, generate the graph again to reassign')
+            raise RuntimeError('executor_assigned unknown')
+        # 原来的线程划分不再适用
+        self.threads_assigned = False
+        for node in self.nodes:
+            if node.executor_assigned:
+                node.executor_id = None
+                node.executor_assigned = False
+            elif node.executor_id is not None and node.executor_id >= num_executors:
+                logger.critical(
+                    f'{node.name} is bound to executor {node.executor_id}, only {num_executors} executors')
+                raise RuntimeError('executor bound by action out of range')
+        self.AssignExecutor(num_executors, policy, cross_fraction)
+
     def AssignExecutorSpread(self):
         seq = []
 
@@ -235,11 +493,103 @@ class Graph:
                     seq = random.sample(
                         range(self.num_executors), self.num_executors)
                 node.executor_id = seq.pop()
+                node.executor_assigned = True
 
     def AssignExecutorRandom(self):
         for node in self.nodes:
             if node.executor_id is None:
                 node.executor_id = random.randrange(0, self.num_executors)
+                node.executor_assigned = True
+
+    def AssignExecutorCriticalPath(self, cross_fraction: float = 0.0):
+        # 类似 HEFT 的列表调度
+        # 1. 计算每个节点到出口的最长路径长度（bottom level），就绪节点中 bottom level 最大的先分配
+        # 2. 选择最早完成的处理核，前序在其他处理核上时需要额外等待 CROSS_CORE_WAIT_COST，
+        #    因此关键路径上的依赖倾向于留在同一个处理核，完成时间相同时选择负载较小的处理核
+        # 3. 跨核依赖的比例低于 cross_fraction 时，把部分节点移到其他处理核，保持一定的一致性压力
+        # action 指定了 executor 的节点保持不变
+        order = list(self.NodesInTopoOrder())
+        level = {}
+        for node in reversed(order):
+            level[node] = 1 + max((level[s] for s in node.Successors()), default=0)
+
+        finish = {}
+        core_ready = [0] * self.num_executors
+        preds_left = {}
+        ready = []
+        for i, node in enumerate(order):
+            preds_left[node] = len(node.predecessors)
+            if preds_left[node] == 0:
+                ready.append((-level[node], i, node))
+        heapq.heapify(ready)
+        index = {node: i for i, node in enumerate(order)}
+
+        while ready:
+            _, _, node = heapq.heappop(ready)
+            if node.executor_id is None:
+                cores = range(self.num_executors)
+            else:
+                cores = (node.executor_id,)
+            best = None
+            for core in cores:
+                start = core_ready[core]
+                for p in node.predecessors:
+                    arrival = finish[p] if p.executor_id == core else finish[p] + CROSS_CORE_WAIT_COST
+                    if arrival > start:
+                        start = arrival
+                key = (start, core_ready[core], random.random(), core)
+                if best is None or key < best:
+                    best = key
+            start, core = best[0], best[3]
+            if node.executor_id is None:
+                node.executor_id = core
+                node.executor_assigned = True
+            finish[node] = start + 1
+            core_ready[core] = start + 1
+            for succ in node.Successors():
+                preds_left[succ] -= 1
+                if preds_left[succ] == 0:
+                    heapq.heappush(ready, (-level[succ], index[succ], succ))
+
+        num_edges = sum(len(node.predecessors) for node in self.nodes)
+        num_cross = self._RaiseCrossEdges(math.ceil(cross_fraction * num_edges))
+        logger.info(f'critical path {max(level.values(), default=0)}, estimated makespan {max(core_ready, default=0)}, '
+                    f'{num_cross}/{num_edges} cross-core edges')
+
+    def _RaiseCrossEdges(self, target: int) -> int:
+        # 把节点移到其他处理核，直到跨核依赖数量达到 target，返回跨核依赖数量
+        num_cross = sum(1 for node in self.nodes for p in node.predecessors
+                        if p.executor_id != node.executor_id)
+        if num_cross >= target:
+            return num_cross
+
+        load = [0] * self.num_executors
+        for node in self.nodes:
+            load[node.executor_id] += 1
+        candidates = [node for node in self.nodes if node.executor_assigned]
+        random.shuffle(candidates)
+        for node in candidates:
+            if num_cross >= target:
+                break
+            # 每个处理核上的相邻节点数
+            neighbors = [0] * self.num_executors
+            for n in node.predecessors:
+                neighbors[n.executor_id] += 1
+            for n in node.Successors():
+                neighbors[n.executor_id] += 1
+            cur = node.executor_id
+            core = min((c for c in range(self.num_executors) if c != cur),
+                       key=lambda c: (neighbors[c], load[c]), default=None)
+            if core is None or neighbors[core] >= neighbors[cur]:
+                continue
+            num_cross += neighbors[cur] - neighbors[core]
+            load[cur] -= 1
+            load[core] += 1
+            node.executor_id = core
+
+        if num_cross < target:
+            logger.warning(f'only {num_cross} cross-core edges, {target} required')
+        return num_cross
 
     def DumpJson(self, fname: str):
         json_dict = {
@@ -257,12 +607,18 @@ class Graph:
             node_dict = {
                 'sn': node.sn,
                 'executor_id': node.executor_id,
+                'executor_assigned': node.executor_assigned,
+                'cost': node.cost,
                 # 'executor_id': 0,
                 'c_src': node.c_src,
                 'sv_src': node.sv_src,
                 'name': node.name,
                 'predecessors': []
             }
+            if self.threads_assigned:
+                # soc 后端的线程划分，purslane.makespan 按此估计
+                node_dict['thread_id'] = node.thread_id
+                node_dict['sn_in_thread'] = node.sn_in_thread
             for pred in node.predecessors:
                 node_dict['predecessors'].append(pred.sn)
 
@@ -271,8 +627,120 @@ class Graph:
         with open(fname, 'w') as f:
             json.dump(json_dict, f, indent=2)
 
-    def LoadJson(fname: str):
-        pass
+    @staticmethod
+    def LoadJson(fname: str) -> 'Graph':
+        with open(fname) as f:
+            json_dict = json.load(f)
+
+        graph = Graph(len(json_dict['executors']))
+        graph.c_headers = json_dict['c_headers']
+        graph.c_decls = json_dict['c_decls']
+
+        nodes = {}
+        for node_dict in json_dict['actions']:
+            node = Node(node_dict['name'])
+            node.sn = node_dict['sn']
+            node.executor_id = node_dict['executor_id']
+            node.executor_assigned = node_dict.get('executor_assigned', False)
+            if 'executor_assigned' not in node_dict:
+                graph.executor_assigned_known = False
+            node.cost = node_dict.get('cost')
+            node.c_src = node_dict['c_src']
+            node.sv_src = node_dict['sv_src']
+            node.is_target = True
+            if 'thread_id' in node_dict:
+                node.thread_id = node_dict['thread_id']
+                node.sn_in_thread = node_dict['sn_in_thread']
+            nodes[node.sn] = node
+            graph.AddNode(node)
+        graph.threads_assigned = len(graph.nodes) > 0 and all('thread_id' in d for d in json_dict['actions'])
+
+        for node_dict, node in zip(json_dict['actions'], graph.nodes):
+            for pred_sn in node_dict['predecessors']:
+                node.predecessors[nodes[pred_sn]] = None
+
+        return graph
+
+    # 紧凑的列存储格式，与 DumpJson 内容相同，格式版本见 columnar.NPZ_VERSION
+    # 每个 action 的 sn、executor、名字和源码下标各一列，前序展开成一列并记录每个 action 的起始位置，
+    # 名字和源码放在去重的字符串表中，没有值（None）时为 -1
+    def DumpNpz(self, fname: str, compress: bool = False):
+        strings = columnar.StringTable()
+        pred_offsets = [0]
+        preds = []
+        for node in self.nodes:
+            preds.extend([pred.sn for pred in node.predecessors])
+            pred_offsets.append(len(preds))
+
+        Column = columnar.Column
+        arrays = {
+            'meta': Column([self.num_executors]),
+            'sn': Column(node.sn for node in self.nodes),
+            'executor_id': Column(-1 if node.executor_id is None else node.executor_id for node in self.nodes),
+            'executor_assigned': Column(node.executor_assigned for node in self.nodes),
+            'cost': Column(-1 if node.cost is None else node.cost for node in self.nodes),
+            'name': Column(strings.Add(node.name) for node in self.nodes),
+            'c_src': Column(strings.Add(node.c_src) for node in self.nodes),
+            'sv_src': Column(strings.Add(node.sv_src) for node in self.nodes),
+            'pred_offsets': Column(pred_offsets),
+            'preds': Column(preds),
+            'c_headers': Column(strings.Add(h) for h in self.c_headers),
+            'c_decls': Column(strings.Add(d) for d in self.c_decls),
+        }
+        if self.threads_assigned:
+            arrays['thread_id'] = Column(node.thread_id for node in self.nodes)
+            arrays['sn_in_thread'] = Column(node.sn_in_thread for node in self.nodes)
+        arrays.update(strings.Arrays('strings'))
+        columnar.WriteNpz(fname, arrays, compress)
+
+    @staticmethod
+    def LoadNpz(fname: str) -> 'Graph':
+        arrays = columnar.ReadNpz(fname)
+        num_executors, = arrays['meta'].tolist()
+        strings = columnar.StringTable.Load(arrays, 'strings')
+
+        def String(idx: int) -> typing.Optional[str]:
+            return None if idx < 0 else strings[idx]
+
+        graph = Graph(num_executors)
+        graph.c_headers = [strings[i] for i in arrays['c_headers'].tolist()]
+        graph.c_decls = [strings[i] for i in arrays['c_decls'].tolist()]
+
+        # 逐个元素访问 python 列表比 ndarray 快，元素也是 int 而不是 numpy 标量
+        nodes = {}
+        for sn, eid, name, c_src, sv_src in zip(*(arrays[k].tolist() for k in
+                                                  ['sn', 'executor_id', 'name', 'c_src', 'sv_src'])):
+            node = Node(strings[name])
+            node.sn = sn
+            node.executor_id = None if eid < 0 else eid
+            node.c_src = String(c_src)
+            node.sv_src = String(sv_src)
+            node.is_target = True
+            nodes[sn] = node
+            graph.AddNode(node)
+
+        if 'executor_assigned' in arrays:
+            for node, assigned in zip(graph.nodes, arrays['executor_assigned'].tolist()):
+                node.executor_assigned = bool(assigned)
+        else:
+            graph.executor_assigned_known = False
+        if 'cost' in arrays:
+            for node, cost in zip(graph.nodes, arrays['cost'].tolist()):
+                node.cost = None if cost < 0 else cost
+        if 'thread_id' in arrays:
+            for node, thread_id, sn_in_thread in zip(graph.nodes, arrays['thread_id'].tolist(),
+                                                     arrays['sn_in_thread'].tolist()):
+                node.thread_id = thread_id
+                node.sn_in_thread = sn_in_thread
+            graph.threads_assigned = True
+
+        pred_offsets = arrays['pred_offsets'].tolist()
+        preds = arrays['preds'].tolist()
+        for i, node in enumerate(graph.nodes):
+            node.predecessors = dict.fromkeys(
+                nodes[sn] for sn in preds[pred_offsets[i]:pred_offsets[i + 1]])
+
+        return graph
 
 
 class Thread:
@@ -287,10 +755,52 @@ class Core:
         self.threads: List[Thread] = []
 
 
-def CBackendThreadAssign(graph: Graph) -> typing.List[Core]:
-    graph.UpdateAllPredecessors()
+class ThreadAssignMode(Enum):
+    # 按随机拓扑序，每个 action 加入线程号最小的、末尾为其祖先的线程
+    GREEDY = 1
+    # 在 GREEDY 的基础上求每个处理核的最小链覆盖（Dilworth），线程数最少，
+    # 每轮调度轮询的线程更少，需要保存处理核内所有 action 的祖先，图很大时较慢
+    CHAIN_COVER = 2
+    # 使用保存的图中的线程划分，见 SavedThreadAssign
+    SAVED = 3
+
+
+def CBackendThreadAssign(graph: Graph, mode: ThreadAssignMode = ThreadAssignMode.GREEDY) -> typing.List[Core]:
+    if mode == ThreadAssignMode.SAVED:
+        return SavedThreadAssign(graph)
+    with profiler.Phase('thread assign'):
+        cores = _CBackendThreadAssign(graph)
+        if mode == ThreadAssignMode.CHAIN_COVER:
+            _MinimumChainCover(graph, cores)
+        graph.threads_assigned = True
+        return cores
+
+
+def SavedThreadAssign(graph: Graph) -> typing.List[Core]:
+    # 按保存的 thread_id、sn_in_thread 重建 CBackendThreadAssign 的结果，
+    # 线程划分依赖随机拓扑序，从保存的图重新划分一般与生成时不同
+    if not graph.threads_assigned:
+        raise ValueError('the graph has no saved threads, run the soc backend when generating')
+    cores = [Core(id=i) for i in range(graph.num_executors)]
+    for node in sorted(graph.nodes, key=lambda n: (n.executor_id, n.thread_id, n.sn_in_thread)):
+        threads = cores[node.executor_id].threads
+        while len(threads) <= node.thread_id:
+            threads.append(Thread(len(threads)))
+        thd = threads[node.thread_id]
+        if node.sn_in_thread != len(thd.nodes):
+            raise ValueError(f'saved thread partition of {node.name} is not contiguous, '
+                             f'core {node.executor_id} thread {node.thread_id} position {node.sn_in_thread}')
+        thd.nodes.append(node)
+    return cores
 
+
+def _CBackendThreadAssign(graph: Graph) -> typing.List[Core]:
     cores = [Core(id=i) for i in range(graph.num_executors)]
+    # 按拓扑序计算祖先 bitset，所有后继访问之后即释放，不需要保存全部节点的祖先
+    reach = Reachability(graph, ReachabilityMode.BITSET)
+    # 每个处理核所有线程最末 action 的 bitset，以及最末 action 的 sn 到线程的索引
+    tails = [0] * graph.num_executors
+    tail_threads: typing.List[typing.Dict[int, Thread]] = [{} for _ in cores]
 
     # 随机序遍历，使得无关 action 在线程内的排序随机
     logger.info(
@@ -299,6 +809,8 @@ def CBackendThreadAssign(graph: Graph) -> typing.List[Core]:
         logger.debug(f'thread assign node {node.name} {id(node):#x}')
         eid = node.executor_id
         core = cores[eid]
+        ancestors = reach.Visit(node)
+        reach.Release(node, node.predecessors)
 
         # 必须满足条件:
         # 所分配线程的最后一个 action 必须为当前 action的前序（递归）
@@ -311,423 +823,1280 @@ def CBackendThreadAssign(graph: Graph) -> typing.List[Core]:
         # 1. 加入同一个线程，约束了执行顺序，所以必须有依赖
         # 2. 之所以不要求是直接前序，是因为其直接前序可能 executor 不同
 
-        # 总是先线程号 0 开始查找，尽量都分配到线程 0
+        # 祖先与线程末尾求交，得到所有可以加入的线程，选择线程号最小的，尽量都分配到线程 0
         # 如果不存在符合条件的，则必须新建线程
-
-        assigned_in_existing_thread = False
-        for thd in core.threads:
-            assert (len(thd.nodes) > 0)
+        hits = ancestors & tails[eid]
+        thd = None
+        if hits.bit_count() * 4 >= len(core.threads):
+            # 可以加入的线程很多时，线程号小的线程大概率可以加入，按线程号顺序检查
+            for cand in core.threads:
+                if (hits >> cand.nodes[-1].sn) & 1:
+                    thd = cand
+                    break
+        else:
+            while hits:
+                low = hits & -hits
+                cand = tail_threads[eid][low.bit_length() - 1]
+                if thd is None or cand.id < thd.id:
+                    thd = cand
+                hits ^= low
+
+        if thd is None:
+            thd = Thread(len(core.threads))
+            core.threads.append(thd)
+        else:
             back = thd.nodes[-1]
+            tails[eid] &= ~(1 << back.sn)
+            del tail_threads[eid][back.sn]
 
-            # logger.debug(f'thd nodes {thd.nodes}')
-            if back.sn in node.all_predecessors:
-                assigned_in_existing_thread = True
+        node.thread_id = thd.id
+        node.sn_in_thread = len(thd.nodes)
+        thd.nodes.append(node)
+        tails[eid] |= 1 << node.sn
+        tail_threads[eid][node.sn] = thd
 
-                node.thread_id = thd.id
-                node.sn_in_thread = len(thd.nodes)
+    return cores
 
-                thd.nodes.append(node)
 
-            if assigned_in_existing_thread:
+def _MinimumChainCover(graph: Graph, cores: typing.List[Core]) -> None:
+    # 线程是处理核内 action 在祖先关系上的链，最小链覆盖即二分图最大匹配：
+    # 匹配 u -> v 表示 v 在线程中紧跟 u，线程数 = action 数 - 匹配数
+    # 以贪心结果中线程内相邻的 action 作为初始匹配，从每个线程头部寻找增广路，
+    # 增广路不存在的头部之后也不会再有增广路，所以每个头部只需要查找一次
+
+    # 同一处理核的 action 连续编号，处理核 c 占 [offsets[c], offsets[c] + len(core_nodes[c])) 位，
+    # 处理核内的祖先 bitset 以处理核内编号表示，位数只有处理核内的 action 数
+    core_nodes = [[node for thd in core.threads for node in thd.nodes] for core in cores]
+    offsets = [0] * len(cores)
+    index: typing.Dict[Node, int] = {}
+    offset = 0
+    for core, nodes in zip(cores, core_nodes):
+        offsets[core.id] = offset
+        for i, node in enumerate(nodes):
+            index[node] = offset + i
+        offset += len(nodes)
+
+    ancestors = [[0] * len(nodes) for nodes in core_nodes]
+    # 按拓扑序计算祖先，所有后继访问之后释放
+    labels: typing.Dict[Node, int] = {}
+    succs_left: typing.Dict[Node, int] = {}
+    for node in graph.NodesInTopoOrder():
+        label = 0
+        for p in node.predecessors:
+            label |= labels[p] | (1 << index[p])
+            succs_left[p] -= 1
+            if succs_left[p] <= 0:
+                del labels[p]
+        eid = node.executor_id
+        local = index[node] - offsets[eid]
+        ancestors[eid][local] = (label >> offsets[eid]) & ((1 << len(core_nodes[eid])) - 1)
+        if node.successors:
+            labels[node] = label
+            succs_left[node] = len(node.successors)
+
+    for core, nodes in zip(cores, core_nodes):
+        # 没有 action 的处理核
+        if not nodes:
+            continue
+        num_threads = len(core.threads)
+        _CoverCore(core, nodes, ancestors[core.id])
+        logger.info(f'core {core.id} chain cover threads {num_threads} -> {len(core.threads)}')
+
+
+def _CoverCore(core: Core, nodes: typing.List[Node], ancestors: typing.List[int]) -> None:
+    # nodes 为处理核内编号到 action，ancestors 为处理核内编号的祖先 bitset
+    next_of: typing.Dict[int, int] = {}
+    prev_of: typing.Dict[int, int] = {}
+    heads = []
+    i = 0
+    for thd in core.threads:
+        heads.append(i)
+        for j in range(i, i + len(thd.nodes) - 1):
+            next_of[j] = j + 1
+            prev_of[j + 1] = j
+        i += len(thd.nodes)
+    # 线程末尾
+    tails = 0
+    for j in heads[1:] + [len(nodes)]:
+        tails |= 1 << (j - 1)
+
+    for head in heads:
+        # 深度优先查找增广路，栈中为 (v, 尚未尝试的 u 的 bitset)，path[i] 为 stack[i] 选择的 u
+        # 每次查找中每个 u 最多尝试一次
+        seen = 0
+        stack = [(head, ancestors[head])]
+        path = []
+        while stack:
+            v, cands = stack[-1]
+            cands &= ~seen
+            if cands == 0:
+                stack.pop()
+                if path:
+                    path.pop()
+                continue
+            # 优先选择线程末尾，直接完成增广
+            free = cands & tails
+            u = (free or cands).bit_length() - 1
+            seen |= 1 << u
+            path.append(u)
+            w = next_of.get(u)
+            if w is None:
+                # 沿路径重新匹配，head 所在线程接到 u 所在线程之后
+                tails &= ~(1 << u)
+                for (v, _), u in zip(stack, path):
+                    next_of[u] = v
+                    prev_of[v] = u
                 break
-
-        if not assigned_in_existing_thread:
-            core.threads.append(Thread(len(core.threads)))
-            thd = core.threads[-1]
+            stack[-1] = (v, cands)
+            stack.append((w, ancestors[w]))
+
+    # 仍然是头部的 action 保持原来的线程顺序
+    core.threads = []
+    for head in heads:
+        if head in prev_of:
+            continue
+        thd = Thread(len(core.threads))
+        i = head
+        while i is not None:
+            node = nodes[i]
+            node.thread_id = thd.id
+            node.sn_in_thread = len(thd.nodes)
             thd.nodes.append(node)
+            i = next_of.get(i)
+        core.threads.append(thd)
+
+
+# c backend 输出
+# 每个生成器按照 section 逐段产生字符串，由 _WriteChunks 攒成大块以后再写文件，
+# 固定格式的代码段预先写成模板，生成时只填入名字
+
+
+# 缓冲区达到该大小以后写一次文件
+C_BACKEND_CHUNK_SIZE = 1 << 16
+
+
+def _WriteChunks(f: io.TextIOBase, chunks: typing.Iterable[str], chunk_size: int = C_BACKEND_CHUNK_SIZE) -> None:
+    buf = []
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            f.write(''.join(buf))
+            buf.clear()
+            size = 0
+    if buf:
+        f.write(''.join(buf))
+
+
+def _BodyFuncName(node: Node) -> str:
+    node.body_func_name = f'{node.name.replace(".", "_")}_body_func'
+    node.body_args = ''
+    return node.body_func_name
+
+
+def _ThreadName(core_id: int, thread_id: int) -> str:
+    return f'core_{core_id}_thread_{thread_id}'
+
+
+def _CrossThreadPredecessors(node: Node, core_id: int, thread_id: int) -> typing.Generator[Node, None, None]:
+    # 所有与自身不在同一线程的前序 action，不在同一个处理核，或是线程不同
+    for pred in node.predecessors:
+        if pred.executor_id != core_id or pred.thread_id != thread_id:
+            yield pred
+
+
+def _SplitUnitNames(fname: str) -> typing.Tuple[str, str]:
+    # a.c -> a.h, a_core_{id}.c
+    stem = fname[:-2] if fname.endswith('.c') else fname
+    return f'{stem}.h', stem + '_core_{}.c'
+
+
+_COOP_HOSTED_BARRIERS = (
+    # defined by gcc builtins
+    # portable among different processors
+    '#define smp_mb() __atomic_thread_fence(__ATOMIC_ACQ_REL)\n'
+    '#define smp_rmb() __atomic_thread_fence(__ATOMIC_ACQUIRE)\n'
+    '#define smp_wmb() __atomic_thread_fence(__ATOMIC_RELEASE)\n')
+
+_COOP_AARCH64_BARRIERS = (
+    #  aarch64 only
+    '#define dmb(opt) asm volatile("dmb " #opt : : : "memory")\n'
+    '#define smp_mb() dmb(ish)\n'
+    '#define smp_rmb() dmb(ishld)\n'
+    '#define smp_wmb() dmb(ishst)\n')
+
+_HOSTED_INCLUDES = (
+    '#include <pthread.h>\n'
+    '#include <sched.h>\n'
+    '#include <unistd.h>\n'
+    '#include <stdio.h>\n')
+
+_COOP_THREAD_VARS_TMPL = (
+    # 线程状态变量，核间通信，使用 volatile 修饰
+    '{storage}volatile uint32_t {thd}_thread_state{init};\n'
+    # 线程内当前 action 状态，不需要 volatile 修饰
+    '{storage}uint32_t {thd}_action_state{init};\n')
+
+_COOP_THREAD_TAIL_TMPL = (
+    # 最后一个 action 结束以后
+    'case {num_nodes}:\n'
+    # 标志线程结束，允许状态再次增加，以便下次进入 default
+    'num_active_threads_core_{core}--;\n'
+    'break;\n'
+    'default:\n'
+    '{ret}'
+    '}}\n'
+    # 如果 action 完成，线程状态+1，执行下一个 action
+    # dmb st，调用 store 的 dmb 维持存储序
+    'if({thd}_action_state == 0){{\n'
+    '{thd}_thread_state++;\n'
+    'smp_wmb();\n'
+    '{publish}'
+    '}}\n'
+    '{progress}'
+    '}}\n\n')
+
+_CREATE_THREAD_CHECK = (
+    'if(ret != 0){\n'
+    'printf("failed to pthread_create\\n");\n'
+    'exit(1);\n'
+    '}\n')
+
+
+class CooperativeWait(Enum):
+    # 前序未完成时线程立即返回，处理核马上重新轮询所有线程
+    SPIN = 1
+    # 一轮轮询没有任何线程前进时空转等待，等待时间指数增长，直到 MANGO_BACKOFF_MAX，有进展后恢复
+    BACKOFF = 2
+    # 一轮轮询没有任何线程前进时 wfe 等待事件，线程状态前进并 smp_wmb 之后 sev 唤醒其他处理核，只支持 aarch64
+    # 上一次 wfe 之后的 sev 都会留在事件寄存器中，下一次 wfe 立即返回，不会丢失唤醒
+    # hosted 时以 sched_yield 代替 wfe
+    WFE = 3
+
+
+def _CooperativeWaitRuntime(hosted: bool, wait: CooperativeWait, poll_count: bool) -> str:
+    # 线程等待时的计数，处理核一轮轮询之后的等待，以及线程状态前进之后的通知
+    out = ['// wait strategy\n']
+    if poll_count:
+        # 每个线程前序未完成而返回的次数
+        out.append('#define MANGO_POLL(counter) (counter)++\n')
+    else:
+        out.append('#define MANGO_POLL(counter)\n')
+
+    if wait == CooperativeWait.BACKOFF:
+        out.append('#ifndef MANGO_BACKOFF_MAX\n#define MANGO_BACKOFF_MAX 1024\n#endif\n'
+                   'static inline void mango_cpu_relax(void){\n')
+        if hosted:
+            out.append('#if defined(__aarch64__)\n'
+                       'asm volatile("yield" ::: "memory");\n'
+                       '#elif defined(__x86_64__) || defined(__i386__)\n'
+                       '__builtin_ia32_pause();\n'
+                       '#else\n'
+                       '__atomic_signal_fence(__ATOMIC_SEQ_CST);\n'
+                       '#endif\n')
+        else:
+            out.append('asm volatile("yield" ::: "memory");\n')
+        out.append('}\n')
+
+    out.append('static inline void mango_idle(uint32_t progress, uint32_t *backoff){\n')
+    if wait == CooperativeWait.BACKOFF:
+        out.append('if(progress){\n*backoff = 1;\nreturn;\n}\n'
+                   'for(uint32_t i = 0; i < *backoff; i++){\nmango_cpu_relax();\n}\n'
+                   'if(*backoff < MANGO_BACKOFF_MAX){\n*backoff <<= 1;\n}\n')
+    elif wait == CooperativeWait.WFE:
+        idle = 'sched_yield();' if hosted else 'asm volatile("wfe" ::: "memory");'
+        out.append(f'(void)backoff;\nif(!progress){{\n{idle}\n}}\n')
+    else:
+        out.append('(void)progress;\n(void)backoff;\n')
+    out.append('}\n')
 
-            node.thread_id = thd.id
-            node.sn_in_thread = 0
+    out.append('static inline void mango_publish(void){\n')
+    if wait == CooperativeWait.WFE and not hosted:
+        out.append('asm volatile("sev" ::: "memory");\n')
+    out.append('}\n\n')
+    return ''.join(out)
 
-    return cores
 
+def _UseWaitRuntime(scheduler: 'CooperativeScheduler', wait: CooperativeWait, poll_count: bool) -> bool:
+    # SPIN 且不计数时 switch 输出与没有等待策略时相同
+    return scheduler == CooperativeScheduler.TABLE or wait != CooperativeWait.SPIN or poll_count
 
-def CooperativeCBackendGenF(graph: Graph, hosted: bool, core_binding: bool, fname: str, debug: bool):
-    with open(fname, 'w') as f:
-        CooperativeCBackendGen(graph, hosted, core_binding, f, debug)
 
+class TraceEvent(Enum):
+    # 环形缓冲区记录的事件，值与生成代码中的 MANGO_TRACE_* 相同
+    START = 0
+    END = 1
+    # 跨线程前序全部完成，第一次通过等待条件
+    WAIT_EXIT = 2
 
-def CooperativeCBackendGen(graph: Graph, hosted: bool, core_binding: bool, f: io.TextIOWrapper, debug: bool):
-    logger.info('cooperative backend generating')
 
-    cores = CBackendThreadAssign(graph)
+# 环形缓冲区头部 magic、num_entries（uint32），head（uint64，已写入的记录总数），
+# 之后为 num_entries 条记录，每条 ts（uint64）、sn、event（uint32），小端
+TRACE_MAGIC = 0x4352544d
+TRACE_HEADER_SIZE = 16
+TRACE_ENTRY_SIZE = 16
+
+
+@dataclasses.dataclass
+class SocTrace:
+    # 每个处理核环形缓冲区的记录数，必须是 2 的幂，写满以后覆盖最早的记录
+    entries: int = 4096
+    # 处理核 0 缓冲区的地址，其他处理核依次紧随其后，None 时为全局数组 mango_trace_rings
+    addr: typing.Optional[int] = None
+
+    def __post_init__(self):
+        if self.entries <= 0 or self.entries & (self.entries - 1) != 0:
+            raise ValueError(f'trace entries {self.entries} is not a power of 2')
+
+    @property
+    def ring_size(self) -> int:
+        return TRACE_HEADER_SIZE + TRACE_ENTRY_SIZE * self.entries
 
-    f.write('// generated by mango\n')
-    f.write('\n')
 
+def _CooperativeTraceRuntime(hosted: bool, trace: SocTrace, num_cores: int, extern: bool) -> str:
+    # 每个处理核一个环形缓冲区，只有该处理核写入，不需要原子操作
+    # 裸机时间戳为 cntvct_el0，hosted 时为 CLOCK_MONOTONIC 纳秒
+    out = ['// trace\n']
     if hosted:
-        # defined by gcc builtins
-        # portable among different processors
-        f.write('#define smp_mb() __atomic_thread_fence(__ATOMIC_ACQ_REL)\n')
-        f.write('#define smp_rmb() __atomic_thread_fence(__ATOMIC_ACQUIRE)\n')
-        f.write('#define smp_wmb() __atomic_thread_fence(__ATOMIC_RELEASE)\n')
+        out.append('#include <time.h>\n')
+    out.append(f'#define MANGO_TRACE_START {TraceEvent.START.value}\n'
+               f'#define MANGO_TRACE_END {TraceEvent.END.value}\n'
+               f'#define MANGO_TRACE_WAIT_EXIT {TraceEvent.WAIT_EXIT.value}\n'
+               f'#define MANGO_TRACE_ENTRIES {trace.entries}\n'
+               'struct mango_trace_entry {\n'
+               'uint64_t ts;\n'
+               'uint32_t sn;\n'
+               'uint32_t event;\n'
+               '};\n'
+               'struct mango_trace_ring {\n'
+               'uint32_t magic;\n'
+               'uint32_t num_entries;\n'
+               'uint64_t head;\n'
+               'struct mango_trace_entry entries[MANGO_TRACE_ENTRIES];\n'
+               '};\n')
+    if trace.addr is None or hosted:
+        storage = 'extern ' if extern else ''
+        out.append(f'{storage}volatile struct mango_trace_ring mango_trace_rings[{max(num_cores, 1)}];\n'
+                   '#define MANGO_TRACE_RING(core) (&mango_trace_rings[core])\n')
     else:
-        #  aarch64 only
-        f.write('#define dmb(opt) asm volatile(\"dmb \" #opt : : : \"memory\")\n')
-        f.write('#define smp_mb() dmb(ish)\n')
-        f.write('#define smp_rmb() dmb(ishld)\n')
-        f.write('#define smp_wmb() dmb(ishst)\n')
-
-    f.write('#include <stdint.h>\n')
+        out.append('#define MANGO_TRACE_RING(core) ((volatile struct mango_trace_ring *)'
+                   f'(uintptr_t)({trace.addr:#x}ull + (core) * sizeof(struct mango_trace_ring)))\n')
 
+    out.append('static inline uint64_t mango_trace_now(void){\n')
+    if hosted:
+        out.append('struct timespec t;\n'
+                   'clock_gettime(CLOCK_MONOTONIC, &t);\n'
+                   'return (uint64_t)t.tv_sec * 1000000000ull + t.tv_nsec;\n')
+    else:
+        out.append('uint64_t t;\n'
+                   'asm volatile("isb\\n\\tmrs %0, cntvct_el0" : "=r"(t) : : "memory");\n'
+                   'return t;\n')
+    out.append('}\n'
+               'static inline void mango_trace_init(uint32_t core){\n'
+               'volatile struct mango_trace_ring *ring = MANGO_TRACE_RING(core);\n'
+               'ring->head = 0;\n'
+               'ring->num_entries = MANGO_TRACE_ENTRIES;\n'
+               f'ring->magic = {TRACE_MAGIC:#x};\n'
+               '}\n'
+               'static inline void mango_trace(uint32_t core, uint32_t sn, uint32_t event){\n'
+               'volatile struct mango_trace_ring *ring = MANGO_TRACE_RING(core);\n'
+               'uint64_t head = ring->head;\n'
+               'volatile struct mango_trace_entry *e = &ring->entries[head & (MANGO_TRACE_ENTRIES - 1)];\n'
+               'e->ts = mango_trace_now();\n'
+               'e->sn = sn;\n'
+               'e->event = event;\n'
+               'ring->head = head + 1;\n'
+               '}\n')
+    if hosted:
+        # 所有处理核结束以后由 mango_main 写出，格式与裸机下 dump 的内存相同
+        out.append('static inline void mango_trace_dump(const char *fname){\n'
+                   'FILE *f = fopen(fname, "wb");\n'
+                   'if(f == NULL){\n'
+                   'printf("failed to open %s\\n", fname);\n'
+                   'return;\n'
+                   '}\n'
+                   f'fwrite((const void *)mango_trace_rings, sizeof(struct mango_trace_ring), {max(num_cores, 1)}, f);\n'
+                   'fclose(f);\n'
+                   '}\n')
+    out.append('\n')
+    return ''.join(out)
+
+
+def _CooperativeTraceRings(trace: SocTrace, hosted: bool, num_cores: int) -> typing.Generator[str, None, None]:
+    # 分文件输出时缓冲区数组定义在公共编译单元中
+    if trace.addr is None or hosted:
+        yield f'volatile struct mango_trace_ring mango_trace_rings[{max(num_cores, 1)}];\n'
+
+
+def _CooperativePrologue(graph: Graph, hosted: bool) -> typing.Generator[str, None, None]:
+    yield '// generated by mango\n\n'
+    yield _COOP_HOSTED_BARRIERS if hosted else _COOP_AARCH64_BARRIERS
+    yield '#include <stdint.h>\n'
     if hosted:
-        f.write('#include <pthread.h>\n')
-        f.write('#include <sched.h>\n')
-        f.write('#include <unistd.h>\n')
-        f.write('#include <stdio.h>\n')
+        yield _HOSTED_INCLUDES
 
     #  headers
     if len(graph.c_headers) > 0:
-        f.write('// headers\n')
+        yield '// headers\n'
         for header in graph.c_headers:
-            f.write(f'{header}\n')
+            yield f'{header}\n'
 
     if len(graph.c_decls) > 0:
-        f.write('// declarations\n')
+        yield '// declarations\n'
         for decl in graph.c_decls:
-            f.write(f'{decl}\n')
-
-    f.write('\n')
-
-    # 生成所有 action 的 body 函数
-    logger.info('generate body functions of all actions')
-    f.write('// body functions of actions\n\n')
-    for node in graph.nodes:
-        f.write(f'// body function of action {node.name}\n')
-
-        name = re.sub('\\.', '_',  node.name)
-        node.body_func_name = f'{name}_body_func'
-        f.write(f'static uint32_t {node.body_func_name}(uint32_t state){{\n')
-        if debug:
-            f.write(f'printf("{node.name}\\n");')
-        f.write(f'{node.c_src}')
-        f.write('\n')
-        f.write('return 0;\n')
-        f.write('}\n')
-
-    f.write('\n\n')
-
+            yield f'{decl}\n'
+
+    yield '\n'
+
+
+class BodyInterning(Enum):
+    # 每个 action 一个 body 函数
+    NONE = 1
+    # c_src 完全相同的 action 共用一个 body 函数
+    IDENTICAL = 2
+    # 在 IDENTICAL 基础上，只有整数常量不同的 action 共用一个带参数的 body 函数，
+    # 常量放在生成的常量表中
+    PARAMETERIZED = 3
+
+
+# 注释、字符串、字符、标识符、浮点数原样保留，只匹配出整数常量
+_C_TOKEN_RE = re.compile(r"""
+    //[^\n]*|/\*.*?\*/
+    |"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'
+    |[A-Za-z_]\w*
+    |\d*\.\d+(?:[eE][+-]?\d+)?[fFlL]?|\d+\.(?:[eE][+-]?\d+)?[fFlL]?|\d+[eE][+-]?\d+[fFlL]?
+    |(?P<int>0[xX][0-9a-fA-F]+[uUlL]*|\d+[uUlL]*)
+""", re.X | re.S)
+
+# 可能要求编译期常量的上下文，出现时不参数化：
+# 内嵌汇编的立即数操作数、case、预处理、static 初始化、类型定义、属性、builtin 等
+_C_CONST_CONTEXT_RE = re.compile(
+    r'\b(?:asm|__asm__|__asm|case|static|enum|typedef|__attribute__|_Alignas|_Static_assert)\b'
+    r'|\b__builtin_\w+|#|\b(?:struct|union)\s*\w*\s*\{')
+
+# 声明 static 局部变量的 body 共用以后变量也被共用，相同也不能合并
+_C_STATIC_RE = re.compile(r'\bstatic\b')
+
+# LP64 下整数常量的类型候选，按照 C 标准依次选择第一个能表示该值的类型
+_C_INT_TYPES = {
+    'int': (1 << 31) - 1,
+    'unsigned int': (1 << 32) - 1,
+    'long': (1 << 63) - 1,
+    'unsigned long': (1 << 64) - 1,
+    'long long': (1 << 63) - 1,
+    'unsigned long long': (1 << 64) - 1,
+}
+
+
+def _IntLiteralType(tok: str) -> typing.Optional[str]:
+    digits = tok.rstrip('uUlL')
+    suffix = tok[len(digits):].lower()
+    decimal = not digits.startswith('0') or digits == '0'
+    try:
+        if digits[:2] in ('0x', '0X'):
+            value = int(digits, 16)
+        elif decimal:
+            value = int(digits)
+        else:
+            value = int(digits, 8)
+    except ValueError:
+        return None
+
+    longs = suffix.count('l')
+    if 'u' in suffix:
+        cands = ['unsigned int', 'unsigned long', 'unsigned long long'][longs:]
+    elif decimal:
+        cands = ['int', 'long', 'long long'][longs:]
+    else:
+        cands = ['int', 'unsigned int', 'long', 'unsigned long',
+                 'long long', 'unsigned long long'][2 * longs:]
+
+    for c in cands:
+        if value <= _C_INT_TYPES[c]:
+            return c
+    return None
+
+
+def _BodyTemplate(src: str) -> typing.Optional[typing.Tuple[typing.Tuple, typing.Tuple[str, ...]]]:
+    # 把 c_src 中的整数常量抽出来，返回 (模板, 常量)
+    # 模板由常量之间的源码片段和每个常量的类型组成，类型相同保证共用以后语义不变
+    # 数组下标位置的常量保留在模板中
+    if _C_CONST_CONTEXT_RE.search(src):
+        return None
+
+    pieces = []
+    types = []
+    values = []
+    last = 0
+    for m in _C_TOKEN_RE.finditer(src):
+        if m.group('int') is None:
+            continue
+        start, end = m.span()
+        if src[:start].rstrip().endswith('[') and src[end:].lstrip().startswith(']'):
+            continue
+        t = _IntLiteralType(m.group())
+        if t is None:
+            return None
+        pieces.append(src[last:start])
+        types.append(t)
+        values.append(m.group())
+        last = end
+
+    if len(values) == 0:
+        return None
+
+    pieces.append(src[last:])
+    return (tuple(pieces), tuple(types)), tuple(values)
+
+
+def _CooperativeBodies(nodes: typing.Iterable[Node], debug: bool,
+                       interning: BodyInterning = BodyInterning.NONE) -> typing.Generator[str, None, None]:
+    # 模板使用 f-string，比 str.format 每次解析格式串快
+    if interning != BodyInterning.NONE and debug:
+        # debug 时每个 body 打印自己的名字，不能共用
+        logger.warning('body interning is disabled in debug mode')
+        interning = BodyInterning.NONE
+
+    if interning == BodyInterning.NONE:
+        for node in nodes:
+            debug_src = f'printf("{node.name}\\n");' if debug else ''
+            yield (f'// body function of action {node.name}\n'
+                   f'static uint32_t {_BodyFuncName(node)}(uint32_t state){{\n'
+                   f'{debug_src}{node.c_src}\n'
+                   'return 0;\n'
+                   '}\n')
+        return
+
+    # c_src 相同的 action 归为一组，第一个 action 的 body 函数为整组共用
+    identical: typing.Dict[str, typing.List[Node]] = {}
+    unshared: typing.List[Node] = []
+    for node in nodes:
+        if node.c_src and _C_STATIC_RE.search(node.c_src):
+            unshared.append(node)
+        else:
+            identical.setdefault(node.c_src, []).append(node)
+
+    # 只有常量不同的组再按模板归并
+    templates: typing.Dict[typing.Any, typing.List[str]] = {}
+    values_of: typing.Dict[str, typing.Tuple[str, ...]] = {}
+    if interning == BodyInterning.PARAMETERIZED:
+        for src in identical:
+            tmpl = _BodyTemplate(src) if src else None
+            if tmpl is not None:
+                templates.setdefault(tmpl[0], []).append(src)
+                values_of[src] = tmpl[1]
+
+    num_tmpls = 0
+    for (pieces, types), srcs in templates.items():
+        if len(srcs) < 2:
+            continue
+        tmpl_name = f'body_tmpl_{num_tmpls}'
+        num_tmpls += 1
+
+        fields = ' '.join(f'{t} a{i};' for i, t in enumerate(types))
+        body = ''.join(f'{pieces[i]}(imm->a{i})' for i in range(len(types))) + pieces[-1]
+        rows = ',\n'.join(f'{{{", ".join(values_of[src])}}}' for src in srcs)
+        names = ' '.join(identical[src][0].name for src in srcs)
+        yield (f'// body function of actions {names}\n'
+               f'struct {tmpl_name}_imm {{{fields}}};\n'
+               f'static uint32_t {tmpl_name}_body_func(uint32_t state, const struct {tmpl_name}_imm *imm){{\n'
+               f'{body}\n'
+               'return 0;\n'
+               '}\n'
+               f'static const struct {tmpl_name}_imm {tmpl_name}_imm_table[] = {{\n{rows}\n}};\n')
+
+        for row, src in enumerate(srcs):
+            for node in identical.pop(src):
+                node.body_func_name = f'{tmpl_name}_body_func'
+                node.body_args = f', &{tmpl_name}_imm_table[{row}]'
+
+    for src, group in identical.items():
+        func = _BodyFuncName(group[0])
+        for node in group[1:]:
+            node.body_func_name = func
+            node.body_args = ''
+        shared = f'// shared by {len(group)} actions\n' if len(group) > 1 else ''
+        yield (f'// body function of action {group[0].name}\n{shared}'
+               f'static uint32_t {func}(uint32_t state){{\n'
+               f'{src}\n'
+               'return 0;\n'
+               '}\n')
+
+    for node in unshared:
+        yield (f'// body function of action {node.name}\n'
+               f'static uint32_t {_BodyFuncName(node)}(uint32_t state){{\n'
+               f'{node.c_src}\n'
+               'return 0;\n'
+               '}\n')
+
+
+def _CooperativeStateVars(cores: typing.List['Core'], extern: bool,
+                          poll_count: bool = False) -> typing.Generator[str, None, None]:
     # 线程、action状态变量声明
+    # 每个线程两个全局状态变量，线程状态，action状态，计数时还有轮询次数
+    storage = 'extern ' if extern else ''
     for core in cores:
-        num_active_threads_var = f'num_active_threads_core_{core.id}'
-        f.write(f'uint32_t {num_active_threads_var} = {len(core.threads)};\n')
+        init = '' if extern else f' = {len(core.threads)}'
+        yield f'{storage}uint32_t num_active_threads_core_{core.id}{init};\n'
+        init = '' if extern else ' = 0'
         for thd in core.threads:
-            # 每个线程两个全局状态变量
-            # 线程状态
-            # action状态
-            thd_name = f'core_{core.id}_thread_{thd.id}'
-            thread_state_var = f'{thd_name}_thread_state'
-            action_state_var = f'{thd_name}_action_state'
-            # 线程状态变量，核间通信，使用 volatile 修饰
-            f.write(f'volatile uint32_t {thread_state_var} = 0;\n')
-            # 线程内当前 action 状态，不需要 volatile 修饰
-            f.write(f'uint32_t {action_state_var} = 0;\n')
-
-    f.write('\n\n')
-
-    logger.info('generate thread functions of all cores')
-    # 为每个线程生成函数
-    for cc in cores:
-        # 记录目前剩余活跃线程数 n+1，使用无符号整数，判断大于 0
-        num_active_threads_var = f'num_active_threads_core_{cc.id}'
-
-        # 生成处理核内每个线程主函数
-        for thd in cc.threads:
-            # 每个线程两个全局状态变量
-            # 线程状态
-            # action状态
-            thd_name = f'core_{cc.id}_thread_{thd.id}'
-            thread_state_var = f'{thd_name}_thread_state'
-            action_state_var = f'{thd_name}_action_state'
-
-            # 线程主函数
-            f.write(f'void {thd_name}_func(){{\n')
-
-            # switch，根据状态调用指定 action body 函数
-            f.write(f'switch({thread_state_var}){{\n')
-
-            for act in thd.nodes:
-                f.write(f'case {act.sn_in_thread}:\n')
-                # 等待前序条件，所有与自身不在同一线程的前序 action，
-                # 不在同一个处理核，或是线程不同
-                conds = []
-                for pred in act.predecessors:
-                    if pred.executor_id != cc.id or pred.thread_id != thd.id:
-                        pred_thread_state_var = f'core_{pred.executor_id}_thread_{pred.thread_id}_thread_state'
-                        f.write(
-                            f'// wait for {pred.name} @ core {pred.executor_id} thread {pred.thread_id}\n')
-                        conds.append(
-                            f'{pred_thread_state_var} <= {pred.sn_in_thread}')
-
-                if len(conds) > 0:
-                    f.write('if(')
-                    # 只要一个条件满足，即有前序 action 未完成，立即 return
-                    # 释放控制权，后续重试
-                    first = True
-                    for c in conds:
-                        if not first:
-                            f.write(' || ')
-
-                        f.write(c)
-                        first = False
-
-                    f.write('){\n')
-                    f.write('return;\n')
-                    f.write('}\n')
-
-                    # 使用 dmb ld
-                    # 否则需要对所有判断的线程状态变量使用有 aquire 语义的 load 指令
-                    # barrier 只需要一个
-                    f.write('smp_rmb();\n')
-
-                f.write(
-                    f'{action_state_var} = {act.body_func_name}({action_state_var});\n')
-                f.write('break;\n')
-
-            # 最后一个 action 结束以后
-            f.write(f'case {len(thd.nodes)}:\n')
-            # 标志线程结束
-            f.write(f'{num_active_threads_var}--;\n')
-            # 允许状态再次增加，以便下次进入 default
-            f.write('break;\n')
-
-            f.write('default:\n')
-            f.write('return;\n')
-
-            f.write('}\n')
-
-            # 如果 action 完成，线程状态+1，执行下一个 action
-            f.write(f'if({action_state_var} == 0){{\n')
-            # 调用特殊写函数，支持核间同步
-            f.write(f'{thread_state_var}++;\n')
-            f.write('smp_wmb();\n')
-            # dmb st，调用 store 的 dmb 维持存储序
-            # 或者对 thread_state_var 的修改使用 store release 语义的保存指令
-            f.write('}\n')
-
-            f.write('}\n\n')
+            yield _COOP_THREAD_VARS_TMPL.format(storage=storage, thd=_ThreadName(core.id, thd.id), init=init)
+            if poll_count:
+                yield f'{storage}uint64_t {_ThreadName(core.id, thd.id)}_polls{init};\n'
+
+
+def _CooperativeWaits(nodes: typing.Iterable[Node]) -> typing.Dict[Node, typing.Tuple[str, str]]:
+    # 同一个前序可能被多个 action 等待，等待注释和条件按前序只生成一次
+    return {node: (f'// wait for {node.name} @ core {node.executor_id} thread {node.thread_id}\n',
+                   f'core_{node.executor_id}_thread_{node.thread_id}_thread_state <= {node.sn_in_thread}')
+            for node in nodes}
+
+
+def _CooperativeThreadFuncs(core: 'Core', waits: typing.Dict[Node, typing.Tuple[str, str]],
+                            wait: CooperativeWait = CooperativeWait.SPIN,
+                            poll_count: bool = False, trace: bool = False) -> typing.Generator[str, None, None]:
+    # 生成处理核内每个线程主函数，每个线程一段
+    # SPIN 以外的等待策略需要知道一轮轮询是否有进展，线程函数返回是否执行了 action
+    # trace 时 action 第一次进入（action 状态为 0）记录等待结束和开始，body 返回 0 时记录结束
+    spin = wait == CooperativeWait.SPIN
+    ret = 'return;\n' if spin else 'return 0;\n'
+    for thd in core.threads:
+        thd_name = _ThreadName(core.id, thd.id)
+        action_state_var = f'{thd_name}_action_state'
+        poll = f'MANGO_POLL({thd_name}_polls);\n' if poll_count else ''
+
+        # 线程主函数，switch，根据状态调用指定 action body 函数
+        out = [f'{"void" if spin else "uint32_t"} {thd_name}_func(){{\nswitch({thd_name}_thread_state){{\n']
+
+        for act in thd.nodes:
+            out.append(f'case {act.sn_in_thread}:\n')
+            # 等待前序条件，所有与自身不在同一线程的前序 action，不在同一个处理核，或是线程不同
+            cross = [waits[pred] for pred in act.predecessors
+                     if pred.thread_id != thd.id or pred.executor_id != core.id]
+            if len(cross) > 0:
+                out.extend([wait[0] for wait in cross])
+                # 只要一个条件满足，即有前序 action 未完成，立即 return
+                # 释放控制权，后续重试
+                # 使用 dmb ld，否则需要对所有判断的线程状态变量使用有 aquire 语义的 load 指令
+                # barrier 只需要一个
+                out.append(
+                    f'if({" || ".join([wait[1] for wait in cross])}){{\n{poll}{ret}}}\nsmp_rmb();\n')
+
+            if trace:
+                wait_exit = f'mango_trace({core.id}, {act.sn}, MANGO_TRACE_WAIT_EXIT);\n' if cross else ''
+                out.append(f'if({action_state_var} == 0){{\n{wait_exit}'
+                           f'mango_trace({core.id}, {act.sn}, MANGO_TRACE_START);\n}}\n')
+            out.append(
+                f'{action_state_var} = {act.body_func_name}({action_state_var}{act.body_args});\n')
+            if trace:
+                out.append(f'if({action_state_var} == 0){{\n'
+                           f'mango_trace({core.id}, {act.sn}, MANGO_TRACE_END);\n}}\n')
+            out.append('break;\n')
+
+        out.append(_COOP_THREAD_TAIL_TMPL.format(
+            num_nodes=len(thd.nodes), core=core.id, thd=thd_name, ret=ret,
+            publish='' if spin else 'mango_publish();\n', progress='' if spin else 'return 1;\n'))
+        yield ''.join(out)
+
+
+def _CooperativeCoreFunc(core: 'Core', wait: CooperativeWait = CooperativeWait.SPIN,
+                        trace: bool = False) -> typing.Generator[str, None, None]:
+    # main function of the core
+    trace_init = f'mango_trace_init({core.id});\n' if trace else ''
+    if wait == CooperativeWait.SPIN:
+        yield f'void core_{core.id}_func(){{\n{trace_init}while(num_active_threads_core_{core.id} > 0){{\n'
+        for thd in core.threads:
+            yield f'{_ThreadName(core.id, thd.id)}_func();\n'
+        yield '}\n}\n\n'
+        return
 
-    for cc in cores:
-        # 记录目前剩余活跃线程数 n+1，使用无符号整数，判断大于 0
-        num_active_threads_var = f'num_active_threads_core_{cc.id}'
-        # main function of the core
-        f.write(f'void core_{cc.id}_func(){{\n')
+    # 一轮所有线程都没有进展时按等待策略等待
+    yield (f'void core_{core.id}_func(){{\n{trace_init}uint32_t backoff = 1;\n'
+           f'while(num_active_threads_core_{core.id} > 0){{\nuint32_t progress = 0;\n')
+    for thd in core.threads:
+        yield f'progress |= {_ThreadName(core.id, thd.id)}_func();\n'
+    yield 'mango_idle(progress, &backoff);\n}\n}\n\n'
 
-        f.write(f'while({num_active_threads_var} > 0){{\n')
-
-        # 生成处理核内每个线程主函数
-        for thd in cc.threads:
-            f.write(f'core_{cc.id}_thread_{thd.id}_func();\n')
-
-        f.write("}\n")
-        f.write("}\n\n")
 
+def _CooperativeEntry(cores: typing.List['Core'], hosted: bool, core_binding: bool,
+                      trace: bool = False) -> typing.Generator[str, None, None]:
     # 生成一个根据输入 core id 自动进入不同函数的函数，便于裸机环境自动调用
-    f.write('void mango_core_main_func(uint64_t core_id){\n')
-    f.write('switch(core_id){\n')
-
+    yield 'void mango_core_main_func(uint64_t core_id){\nswitch(core_id){\n'
     for cc in cores:
-        f.write(f'case {cc.id}:\n')
-        f.write(f'core_{cc.id}_func();\n')
-        f.write('break;\n')
-
-    f.write('default:\n')
-    f.write('break;\n')
-    f.write('}\n')
-
-    f.write('}\n\n')
+        yield f'case {cc.id}:\ncore_{cc.id}_func();\nbreak;\n'
+    yield 'default:\nbreak;\n}\n}\n\n'
 
     # hosted 环境一并将启动代码生成完毕
     # 主函数 mango_main
     # 每个处理核一个线程
-    if hosted:
-        f.write('#include <stdlib.h>\n')
+    if not hosted:
+        return
+
+    yield '#include <stdlib.h>\n'
+    yield 'void mango_main(){\nint ret;\n'
+
+    # 每个处理核建立一个线程，绑定到指定处理核，入口函数为对应处理核函数
+    for i in range(len(cores)):
+        yield f'pthread_t thread_id_{i};\npthread_attr_t attr_{i};\ncpu_set_t cpu_set_{i};\n'
+
+    yield '\n'
+
+    for i in range(len(cores)):
+        yield f'pthread_attr_init(&attr_{i});\n'
+        if core_binding:
+            yield (f'CPU_ZERO(&cpu_set_{i});\n'
+                   f'CPU_SET({i}, &cpu_set_{i});\n'
+                   f'pthread_attr_setaffinity_np(&attr_{i}, sizeof(cpu_set_t), &cpu_set_{i});\n')
+        yield f'ret = pthread_create(&thread_id_{i}, &attr_{i}, (void*(*)(void*))core_{i}_func, NULL);\n'
+        yield _CREATE_THREAD_CHECK
+
+    yield '\n'
+
+    for i in range(len(cores)):
+        yield f'pthread_join(thread_id_{i}, NULL);\n'
+
+    if trace:
+        yield 'mango_trace_dump("mango_trace.bin");\n'
+    yield '}\n'
+
+
+class CooperativeScheduler(Enum):
+    # 每个线程一个 switch 函数，前序条件硬编码在每个 case 中
+    SWITCH = 1
+    # action 和前序条件生成常量表，由固定的运行时循环遍历，代码大小与 action 数量基本无关
+    TABLE = 2
+
+
+# 表驱动调度的运行时，所有处理核共用
+# 线程状态的含义与 switch 版本相同：等于 action 数量时线程结束，大于时不再执行
+def _CooperativeTableRuntime(trace: bool = False) -> str:
+    # trace 时 action 多一个 sn 字段，运行时函数多一个处理核编号参数
+    sn_field = 'uint32_t sn;\n' if trace else ''
+    core_param = ', uint32_t core' if trace else ''
+    core_arg = ', core' if trace else ''
+    trace_start = trace_end = ''
+    if trace:
+        trace_start = ('if(*action_state == 0){\n'
+                       'if(act->num_waits > 0){\n'
+                       'mango_trace(core, act->sn, MANGO_TRACE_WAIT_EXIT);\n'
+                       '}\n'
+                       'mango_trace(core, act->sn, MANGO_TRACE_START);\n'
+                       '}\n')
+        trace_end = ('if(*action_state == 0){\n'
+                     'mango_trace(core, act->sn, MANGO_TRACE_END);\n'
+                     '}\n')
+    return (
+        'struct mango_wait {\n'
+        'volatile uint32_t *thread_state;\n'
+        'uint32_t sn_in_thread;\n'
+        '};\n'
+        'struct mango_action {\n'
+        'uint32_t (*body)(uint32_t);\n'
+        'uint32_t wait_begin;\n'
+        'uint32_t num_waits;\n'
+        f'{sn_field}'
+        '};\n'
+        'struct mango_thread {\n'
+        'const struct mango_action *actions;\n'
+        'uint32_t num_actions;\n'
+        '};\n'
+        # 返回是否有进展，等待策略见 _CooperativeWaitRuntime
+        'static inline uint32_t mango_thread_step(const struct mango_thread *thd, const struct mango_wait *waits,\n'
+        'volatile uint32_t *thread_state, uint32_t *action_state, uint32_t *num_active_threads, uint64_t *polls'
+        f'{core_param}){{\n'
+        'uint32_t ts = *thread_state;\n'
+        'if(ts > thd->num_actions){\n'
+        'return 0;\n'
+        '}\n'
+        'if(ts == thd->num_actions){\n'
+        '(*num_active_threads)--;\n'
+        '}else{\n'
+        'const struct mango_action *act = &thd->actions[ts];\n'
+        'const struct mango_wait *w = &waits[act->wait_begin];\n'
+        # 只要有一个前序 action 未完成，立即 return，释放控制权，后续重试
+        'for(uint32_t i = 0; i < act->num_waits; i++){\n'
+        'if(*w[i].thread_state <= w[i].sn_in_thread){\n'
+        'MANGO_POLL(*polls);\n'
+        'return 0;\n'
+        '}\n'
+        '}\n'
+        'if(act->num_waits > 0){\n'
+        'smp_rmb();\n'
+        '}\n'
+        f'{trace_start}'
+        '*action_state = act->body(*action_state);\n'
+        f'{trace_end}'
+        '}\n'
+        # 如果 action 完成，线程状态+1，执行下一个 action
+        'if(*action_state == 0){\n'
+        '(*thread_state)++;\n'
+        'smp_wmb();\n'
+        'mango_publish();\n'
+        '}\n'
+        'return 1;\n'
+        '}\n'
+        'static inline void mango_run_core(const struct mango_thread *threads, uint32_t num_threads,\n'
+        'const struct mango_wait *waits, volatile uint32_t *thread_state, uint32_t *action_state,\n'
+        f'uint32_t *num_active_threads, uint64_t *polls{core_param}){{\n'
+        'uint32_t backoff = 1;\n'
+        'while(*num_active_threads > 0){\n'
+        'uint32_t progress = 0;\n'
+        'for(uint32_t i = 0; i < num_threads; i++){\n'
+        'progress |= mango_thread_step(&threads[i], waits, &thread_state[i], &action_state[i],\n'
+        f'num_active_threads, &polls[i]{core_arg});\n'
+        '}\n'
+        'mango_idle(progress, &backoff);\n'
+        '}\n'
+        '}\n\n')
+
+
+def _CooperativeTableStateVars(cores: typing.List['Core'], extern: bool) -> typing.Generator[str, None, None]:
+    # 每个处理核一组线程状态数组，下标为线程号
+    storage = 'extern ' if extern else ''
+    for core in cores:
+        # 没有线程的处理核也保留一个元素，C 不允许长度为 0 的数组
+        size = max(len(core.threads), 1)
+        init = '' if extern else f' = {len(core.threads)}'
+        # 轮询次数，只有 MANGO_POLL 计数时才会写入
+        yield (f'{storage}uint32_t num_active_threads_core_{core.id}{init};\n'
+               f'{storage}volatile uint32_t core_{core.id}_thread_state[{size}];\n'
+               f'{storage}uint32_t core_{core.id}_action_state[{size}];\n'
+               f'{storage}uint64_t core_{core.id}_polls[{size}];\n')
+
+
+def _CooperativeTables(core: 'Core', trace: bool = False) -> typing.Generator[str, None, None]:
+    # 前序条件按 action 顺序展开到一个数组，action 记录自己的起始下标和数量
+    waits = []
+    actions = []
+    for thd in core.threads:
+        rows = []
+        for act in thd.nodes:
+            begin = len(waits)
+            for pred in act.predecessors:
+                if pred.thread_id != thd.id or pred.executor_id != core.id:
+                    waits.append(
+                        f'{{&core_{pred.executor_id}_thread_state[{pred.thread_id}], {pred.sn_in_thread}}}, // {pred.name}\n')
+            sn = f', {act.sn}' if trace else ''
+            rows.append(f'{{{act.body_func_name}, {begin}, {len(waits) - begin}{sn}}}, // {act.name}\n')
+        actions.append(
+            f'static const struct mango_action {_ThreadName(core.id, thd.id)}_actions[] = {{\n{"".join(rows)}}};\n')
+
+    if len(waits) == 0:
+        waits.append('{0, 0},\n')
+    yield f'static const struct mango_wait core_{core.id}_waits[] = {{\n{"".join(waits)}}};\n'
+    yield from actions
+
+    threads = ''.join(
+        f'{{{_ThreadName(core.id, thd.id)}_actions, {len(thd.nodes)}}},\n' for thd in core.threads)
+    if len(core.threads) == 0:
+        threads = '{0, 0},\n'
+    yield f'static const struct mango_thread core_{core.id}_threads[] = {{\n{threads}}};\n\n'
+
+
+def _CooperativeTableCoreFunc(core: 'Core', trace: bool = False) -> typing.Generator[str, None, None]:
+    trace_init = f'mango_trace_init({core.id});\n' if trace else ''
+    yield (f'void core_{core.id}_func(){{\n{trace_init}'
+           f'mango_run_core(core_{core.id}_threads, {len(core.threads)}, core_{core.id}_waits,\n'
+           f'core_{core.id}_thread_state, core_{core.id}_action_state, &num_active_threads_core_{core.id},\n'
+           f'core_{core.id}_polls{f", {core.id}" if trace else ""});\n'
+           '}\n\n')
+
+
+def _TableInterning(interning: BodyInterning) -> BodyInterning:
+    # 表中 body 函数指针类型统一，参数化 body 多一个参数，退化为只合并相同 body
+    if interning == BodyInterning.PARAMETERIZED:
+        logger.warning('parameterized bodies are not supported by the table scheduler, use identical')
+        return BodyInterning.IDENTICAL
+    return interning
+
+
+def CooperativeCBackendChunks(graph: Graph, cores: typing.List['Core'], hosted: bool, core_binding: bool,
+                              debug: bool, interning: BodyInterning = BodyInterning.NONE,
+                              scheduler: CooperativeScheduler = CooperativeScheduler.SWITCH,
+                              wait: CooperativeWait = CooperativeWait.SPIN,
+                              poll_count: bool = False,
+                              trace: typing.Optional[SocTrace] = None) -> typing.Generator[str, None, None]:
+    table = scheduler == CooperativeScheduler.TABLE
+    if table:
+        interning = _TableInterning(interning)
+    tracing = trace is not None
+
+    yield from _CooperativePrologue(graph, hosted)
+    if _UseWaitRuntime(scheduler, wait, poll_count):
+        yield _CooperativeWaitRuntime(hosted, wait, poll_count)
+    if tracing:
+        yield _CooperativeTraceRuntime(hosted, trace, len(cores), extern=False)
+    if table:
+        yield _CooperativeTableRuntime(tracing)
 
-        f.write('void mango_main(){\n')
-        f.write('int ret;\n')
+    # 生成所有 action 的 body 函数
+    logger.info('generate body functions of all actions')
+    yield '// body functions of actions\n\n'
+    yield from _CooperativeBodies(graph.nodes, debug, interning)
+    yield '\n\n'
+
+    if table:
+        yield from _CooperativeTableStateVars(cores, extern=False)
+        yield '\n\n'
+
+        logger.info('generate tables of all cores')
+        for cc in cores:
+            yield from _CooperativeTables(cc, tracing)
+            yield from _CooperativeTableCoreFunc(cc, tracing)
+    else:
+        yield from _CooperativeStateVars(cores, extern=False, poll_count=poll_count)
+        yield '\n\n'
 
-        # 每个处理核建立一个线程，绑定到指定处理核，入口函数为对应处理核函数
-        for i in range(len(cores)):
-            f.write(f'pthread_t thread_id_{i};\n')
-            f.write(f'pthread_attr_t attr_{i};\n')
-            f.write(f'cpu_set_t cpu_set_{i};\n')
+        logger.info('generate thread functions of all cores')
+        waits = _CooperativeWaits(graph.nodes)
+        for cc in cores:
+            yield from _CooperativeThreadFuncs(cc, waits, wait, poll_count, tracing)
 
-        f.write('\n')
+        for cc in cores:
+            yield from _CooperativeCoreFunc(cc, wait, tracing)
 
-        for i in range(len(cores)):
-            f.write(f"pthread_attr_init(&attr_{i});\n")
-            if core_binding:
-                f.write(f"CPU_ZERO(&cpu_set_{i});\n")
-                f.write(f"CPU_SET({i}, &cpu_set_{i});\n")
-                f.write(
-                    f'pthread_attr_setaffinity_np(&attr_{i}, sizeof(cpu_set_t), &cpu_set_{i});\n')
+    yield from _CooperativeEntry(cores, hosted, core_binding, tracing)
 
-            f.write(
-                f'ret = pthread_create(&thread_id_{i}, &attr_{i}, (void*(*)(void*))core_{i}_func, NULL);\n')
-            f.write('if(ret != 0){\n')
-            f.write('printf(\"failed to pthread_create\\n\");\n')
-            f.write('exit(1);\n')
-            f.write('}\n')
 
-        f.write('\n')
+def CooperativeCBackendGenF(graph: Graph, hosted: bool, core_binding: bool, fname: str, debug: bool,
+                            interning: BodyInterning = BodyInterning.NONE,
+                            scheduler: CooperativeScheduler = CooperativeScheduler.SWITCH,
+                            thread_assign: ThreadAssignMode = ThreadAssignMode.GREEDY,
+                            wait: CooperativeWait = CooperativeWait.SPIN, poll_count: bool = False,
+                            trace: typing.Optional[SocTrace] = None):
+    with open(fname, 'w') as f:
+        CooperativeCBackendGen(graph, hosted, core_binding, f, debug, interning, scheduler, thread_assign,
+                               wait, poll_count, trace)
 
-        for i in range(len(cores)):
-            f.write(f'pthread_join(thread_id_{i}, NULL);\n')
 
-        f.write('}\n')
+def CooperativeCBackendGen(graph: Graph, hosted: bool, core_binding: bool, f: io.TextIOWrapper, debug: bool,
+                           interning: BodyInterning = BodyInterning.NONE,
+                           scheduler: CooperativeScheduler = CooperativeScheduler.SWITCH,
+                           thread_assign: ThreadAssignMode = ThreadAssignMode.GREEDY,
+                           wait: CooperativeWait = CooperativeWait.SPIN, poll_count: bool = False,
+                           trace: typing.Optional[SocTrace] = None):
+    logger.info('cooperative backend generating')
 
+    cores = CBackendThreadAssign(graph, thread_assign)
+    _WriteChunks(f, CooperativeCBackendChunks(
+        graph, cores, hosted, core_binding, debug, interning, scheduler, wait, poll_count, trace))
+
+
+def CooperativeCBackendGenSplitF(graph: Graph, hosted: bool, core_binding: bool, fname: str,
+                                 debug: bool, interning: BodyInterning = BodyInterning.NONE,
+                                 scheduler: CooperativeScheduler = CooperativeScheduler.SWITCH,
+                                 thread_assign: ThreadAssignMode = ThreadAssignMode.GREEDY,
+                                 wait: CooperativeWait = CooperativeWait.SPIN,
+                                 poll_count: bool = False,
+                                 trace: typing.Optional[SocTrace] = None) -> typing.List[str]:
+    # 每个处理核一个编译单元，便于并行编译
+    # fname 为公共部分（状态变量定义、入口函数），同名 .h 为共享头文件，
+    # 处理核 i 的 body 函数和线程函数输出到 *_core_i.c
+    # 注意 c_decls 会出现在每个编译单元中
+    logger.info('cooperative backend generating, one unit per core')
+
+    cores = CBackendThreadAssign(graph, thread_assign)
+    header_fname, core_fname_tmpl = _SplitUnitNames(fname)
+    table = scheduler == CooperativeScheduler.TABLE
+    tracing = trace is not None
+    if table:
+        interning = _TableInterning(interning)
+        StateVars = _CooperativeTableStateVars
+    else:
+        waits = _CooperativeWaits(graph.nodes)
+
+        def StateVars(cores: typing.List[Core], extern: bool) -> typing.Generator[str, None, None]:
+            return _CooperativeStateVars(cores, extern, poll_count)
+    header_include = header_fname.replace('\\', '/').rsplit('/', 1)[-1]
+    guard = re.sub('[^0-9A-Za-z]', '_', header_include).upper()
+
+    def Header() -> typing.Generator[str, None, None]:
+        yield f'#ifndef {guard}\n#define {guard}\n'
+        yield from _CooperativePrologue(graph, hosted)
+        if _UseWaitRuntime(scheduler, wait, poll_count):
+            yield _CooperativeWaitRuntime(hosted, wait, poll_count)
+        if tracing:
+            yield _CooperativeTraceRuntime(hosted, trace, len(cores), extern=True)
+        if table:
+            yield _CooperativeTableRuntime(tracing)
+        yield from StateVars(cores, extern=True)
+        for cc in cores:
+            yield f'void core_{cc.id}_func();\n'
+        yield '\n#endif\n'
+
+    def CoreUnit(cc: Core) -> typing.Generator[str, None, None]:
+        yield f'// generated by mango\n#include "{header_include}"\n\n'
+        yield '// body functions of actions\n\n'
+        yield from _CooperativeBodies((node for thd in cc.threads for node in thd.nodes), debug, interning)
+        yield '\n\n'
+        if table:
+            yield from _CooperativeTables(cc, tracing)
+            yield from _CooperativeTableCoreFunc(cc, tracing)
+        else:
+            yield from _CooperativeThreadFuncs(cc, waits, wait, poll_count, tracing)
+            yield from _CooperativeCoreFunc(cc, wait, tracing)
+
+    def Common() -> typing.Generator[str, None, None]:
+        yield f'// generated by mango\n#include "{header_include}"\n\n'
+        yield from StateVars(cores, extern=False)
+        if tracing:
+            yield from _CooperativeTraceRings(trace, hosted, len(cores))
+        yield '\n\n'
+        yield from _CooperativeEntry(cores, hosted, core_binding, tracing)
+
+    units = [(header_fname, Header()), (fname, Common())]
+    units.extend((core_fname_tmpl.format(cc.id), CoreUnit(cc)) for cc in cores)
+    for unit_fname, chunks in units:
+        _WriteUnitIfChanged(unit_fname, chunks)
+
+    return [unit_fname for unit_fname, _ in units]
+
+
+def _WriteUnitIfChanged(fname: str, chunks: typing.Iterable[str]) -> bool:
+    # 内容不变的编译单元不重写，保留修改时间，make 只重新编译变化的处理核
+    buf = io.StringIO()
+    _WriteChunks(buf, chunks)
+    src = buf.getvalue()
+    try:
+        with open(fname) as f:
+            if f.read() == src:
+                logger.debug(f'{fname} unchanged')
+                return False
+    except FileNotFoundError:
+        pass
 
-def PreemptiveCBackendGenF(graph: Graph, core_binding: bool, fname: str):
     with open(fname, 'w') as f:
-        PreemptiveCBackenGen(graph, core_binding, f)
-
-
-def PreemptiveCBackenGen(graph: Graph, core_binding: bool, f: io.TextIOWrapper):
-    cores = CBackendThreadAssign(graph)
-    f.write('// generated by mango\n')
-    f.write('\n')
-
-    f.write('#include <stdint.h>\n')
-    f.write('#include <pthread.h>\n')
-    f.write('#include <sched.h>\n')
-    f.write('#include <unistd.h>\n')
-    f.write('#include <stdio.h>\n')
-    f.write('#include <stdlib.h>\n')
+        f.write(src)
+    return True
+
+
+_PREEMPTIVE_INCLUDES = (
+    '#include <stdint.h>\n'
+    '#include <pthread.h>\n'
+    '#include <sched.h>\n'
+    '#include <unistd.h>\n'
+    '#include <stdio.h>\n'
+    '#include <stdlib.h>\n')
+
+_PREEMPTIVE_BODY_TMPL = (
+    '// body function of action {name}\n'
+    'static void {func}(){{\n'
+    '{src}'
+    '}}\n')
+
+_PREEMPTIVE_THREAD_SYNC_TMPL = (
+    # 锁
+    'pthread_mutex_t {prefix}mutex = PTHREAD_MUTEX_INITIALIZER;\n'
+    # 条件变量
+    'pthread_cond_t {prefix}cond = PTHREAD_COND_INITIALIZER;\n'
+    # 线程状态变量，不需要 volatile，通过 mutex 保护
+    'uint64_t {prefix}state = 0;\n'
+    # 等待线程状态
+    'static void {prefix}wait(uint64_t ts){{\n'
+    'pthread_mutex_lock(&{prefix}mutex);\n'
+    'while({prefix}state <= ts){{\n'
+    'pthread_cond_wait(&{prefix}cond, &{prefix}mutex);\n'
+    '}}\n'
+    'pthread_mutex_unlock(&{prefix}mutex);\n'
+    '}}\n'
+    # 线程状态前进
+    'static void {prefix}advance(){{\n'
+    'pthread_mutex_lock(&{prefix}mutex);\n'
+    '{prefix}state++;\n'
+    'pthread_cond_broadcast(&{prefix}cond);\n'
+    'pthread_mutex_unlock(&{prefix}mutex);\n'
+    '}}\n')
+
+
+class PreemptiveSync(Enum):
+    # 每个线程一个 mutex 和条件变量，advance 加锁后 broadcast
+    MUTEX = 1
+    # 线程状态原子读写（load-acquire/store-release），等待时先自旋，之后以 futex 阻塞在状态变量上，
+    # advance 只在有阻塞的等待者时 futex wake，只唤醒等待刚完成的 action 的线程，只支持 linux
+    FUTEX = 2
+
+
+_PREEMPTIVE_FUTEX_RUNTIME = (
+    '#include <limits.h>\n'
+    '#include <linux/futex.h>\n'
+    '#include <sys/syscall.h>\n'
+    # 等待线程状态时自旋检查的次数，之后 futex 阻塞，编译时可以用 -D 修改
+    '#ifndef MANGO_SPIN_COUNT\n'
+    '#define MANGO_SPIN_COUNT 256\n'
+    '#endif\n'
+    # 只有一个处理器时自旋只会推迟被等待的线程，不自旋，在 mango_main 中设置
+    'static int mango_spin_count = MANGO_SPIN_COUNT;\n'
+    'static inline void mango_cpu_relax(void){\n'
+    '#if defined(__aarch64__)\n'
+    '__asm__ __volatile__("yield" ::: "memory");\n'
+    '#elif defined(__x86_64__) || defined(__i386__)\n'
+    '__builtin_ia32_pause();\n'
+    '#endif\n'
+    '}\n'
+    # 等待线程状态大于 ts
+    # 每个等待者以 futex bitset 标记所等待的状态值 ts + 1（模 32），advance 到状态 s 时
+    # 只唤醒 bitset 为 s 的等待者，即前序刚刚完成的线程，不唤醒还要继续等待的线程；
+    # 相差 32 的倍数的等待者也会被唤醒，重新检查状态后继续等待
+    'static inline uint32_t mango_futex_bit(uint32_t s){\n'
+    'return 1u << (s & 31);\n'
+    '}\n'
+    'static void mango_futex_wait(uint32_t *state, uint32_t *waiters, uint32_t ts){\n'
+    'for(int i = 0; i < mango_spin_count; i++){\n'
+    'if(__atomic_load_n(state, __ATOMIC_ACQUIRE) > ts){\n'
+    'return;\n'
+    '}\n'
+    'mango_cpu_relax();\n'
+    '}\n'
+    # 先登记等待者再读状态，与 advance 先写状态再读等待者配对（都是 seq_cst），
+    # 两者至少有一个看到对方的写，不会丢失唤醒；futex 在状态已经改变时立即返回
+    '__atomic_fetch_add(waiters, 1, __ATOMIC_SEQ_CST);\n'
+    'uint32_t s;\n'
+    'while((s = __atomic_load_n(state, __ATOMIC_SEQ_CST)) <= ts){\n'
+    'syscall(SYS_futex, state, FUTEX_WAIT_BITSET_PRIVATE, s, NULL, NULL, mango_futex_bit(ts + 1));\n'
+    '}\n'
+    '__atomic_fetch_sub(waiters, 1, __ATOMIC_RELAXED);\n'
+    '}\n'
+    # 线程状态前进，只有线程自己写状态，只在有阻塞的等待者时唤醒
+    'static void mango_futex_advance(uint32_t *state, uint32_t *waiters){\n'
+    'uint32_t s = __atomic_add_fetch(state, 1, __ATOMIC_SEQ_CST);\n'
+    'if(__atomic_load_n(waiters, __ATOMIC_SEQ_CST) > 0){\n'
+    # 同一 action 可能有多个线程等待，唤醒 bitset 匹配的全部等待者
+    'syscall(SYS_futex, state, FUTEX_WAKE_BITSET_PRIVATE, INT_MAX, NULL, NULL, mango_futex_bit(s));\n'
+    '}\n'
+    '}\n')
+
+_PREEMPTIVE_FUTEX_SYNC_TMPL = (
+    # 线程状态变量，futex 只支持 32 位
+    'uint32_t {prefix}state = 0;\n'
+    # 在 futex 上阻塞的等待者数量
+    'uint32_t {prefix}waiters = 0;\n'
+    'static void {prefix}wait(uint32_t ts){{\n'
+    'mango_futex_wait(&{prefix}state, &{prefix}waiters, ts);\n'
+    '}}\n'
+    'static void {prefix}advance(){{\n'
+    'mango_futex_advance(&{prefix}state, &{prefix}waiters);\n'
+    '}}\n')
+
+_PREEMPTIVE_BIND_TMPL = (
+    'CPU_ZERO(&{prefix}cpu_set);\n'
+    'CPU_SET({core}, &{prefix}cpu_set);\n')
+
+_PREEMPTIVE_CREATE_TMPL = (
+    'pthread_attr_init(&{prefix}attr);\n'
+    '{affinity}'
+    'ret = pthread_create(&{prefix}id, &{prefix}attr, (void*(*)(void*)){prefix}func, NULL);\n')
+
+_PREEMPTIVE_AFFINITY_TMPL = 'pthread_attr_setaffinity_np(&{prefix}attr, sizeof(cpu_set_t), &{prefix}cpu_set);\n'
+
+
+def PreemptiveCBackendChunks(graph: Graph, cores: typing.List['Core'], core_binding: bool,
+                             sync: PreemptiveSync = PreemptiveSync.MUTEX) -> typing.Generator[str, None, None]:
+    yield '// generated by mango\n\n'
+    yield _PREEMPTIVE_INCLUDES
+    if sync == PreemptiveSync.FUTEX:
+        yield _PREEMPTIVE_FUTEX_RUNTIME
 
     # headers
     if len(graph.c_headers) > 0:
-        f.write('// headers\n')
+        yield '// headers\n'
         for h in graph.c_headers:
-            f.write(f'{h}\n')
+            yield f'{h}\n'
+
+    if len(graph.c_decls) > 0:
+        yield '// declarations\n'
+        for decl in graph.c_decls:
+            yield f'{decl}\n'
 
     # 生成所有 action 的 body 函数
-    f.write('// body functions of actions\n\n')
+    yield '// body functions of actions\n\n'
     for aa in graph.nodes:
-        f.write(f'// body function of action {aa.name}\n')
-
-        name = re.sub('\\.', '_', aa.name)
-        aa.body_func_name = f'{name}_body_func'
-        f.write(f'static void {aa.body_func_name}(){{\n')
-        f.write(f'{aa.c_src}')
-        f.write('}\n')
-    f.write('\n\n')
+        yield _PREEMPTIVE_BODY_TMPL.format(name=aa.name, func=_BodyFuncName(aa), src=aa.c_src)
+    yield '\n\n'
 
     # 线程、action状态变量声明
+    sync_tmpl = _PREEMPTIVE_FUTEX_SYNC_TMPL if sync == PreemptiveSync.FUTEX else _PREEMPTIVE_THREAD_SYNC_TMPL
     for cc in cores:
         for thd in cc.threads:
-            prefix = f'core_{cc.id}_thread_{thd.id}_'
-            # 每个线程
-            # 锁
-            f.write(
-                f'pthread_mutex_t {prefix}mutex = PTHREAD_MUTEX_INITIALIZER;\n')
-            # 条件变量
-            f.write(
-                f"pthread_cond_t {prefix}cond = PTHREAD_COND_INITIALIZER;\n")
-            # 线程状态变量，不需要 volatile，通过 mutex 保护
-            f.write(f"uint64_t {prefix}state = 0;\n")
-
-            # 生成一个函数用于等待线程状态
-            f.write(f"static void {prefix}wait(uint64_t ts){{\n")
-
-            f.write(f'pthread_mutex_lock(&{prefix}mutex);\n')
-            f.write(f'while({prefix}state <= ts){{\n')
-            f.write(f'pthread_cond_wait(&{prefix}cond, &{prefix}mutex);\n')
-            f.write('}\n')
-            f.write(f'pthread_mutex_unlock(&{prefix}mutex);\n')
-
-            f.write('}\n')
+            yield sync_tmpl.format(prefix=f'{_ThreadName(cc.id, thd.id)}_')
 
-            # 生成线程状态前进函数
-            f.write(f'static void {prefix}advance(){{\n')
-
-            f.write(f'pthread_mutex_lock(&{prefix}mutex);\n')
-            f.write(f'{prefix}state++;\n')
-            f.write(f'pthread_cond_broadcast(&{prefix}cond);\n')
-            f.write(f'pthread_mutex_unlock(&{prefix}mutex);\n')
-
-            f.write('}\n')
-
-    f.write('\n\n')
+    yield '\n\n'
 
     # 生成线程函数
     for cc in cores:
         # 生成处理核内每个线程主函数
         for thd in cc.threads:
-            prefix = f'core_{cc.id}_thread_{thd.id}_'
+            prefix = f'{_ThreadName(cc.id, thd.id)}_'
 
             # 线程主函数
-            f.write(f'static void {prefix}func(){{\n')
+            yield f'static void {prefix}func(){{\n'
 
             # 从前向后执行每个 action 函数即可
             for act in thd.nodes:
-                f.write(f'// action {act.name}\n')
-
-                # 等待前序条件，所有与自身不在同一线程的前序 action，只需要等待之间前序
-                # 不在同一个处理核，或是线程不同
-                conds = []
-                for pred in act.predecessors():
-                    # 等待与当前 action 处于不同线程的的前序 action
-                    if pred.executor_id != cc.id or pred.thread_id != thd.id:
-                        pred_prefix = f'core_{pred.executor_id}_thread_{pred.thread_id}_'
-                        f.write(
-                            f'// wait for {pred.name} @ core {pred.executor_id} thread {pred.thread_id}\n')
-                        f.write(f'{pred_prefix}wait({pred.sn_in_thread});\n')
+                yield f'// action {act.name}\n'
 
-                # 调用 action body 函数
-                f.write(f'{act.body_func_name}();\n')
+                # 等待与当前 action 处于不同线程的的前序 action，只需要等待直接前序
+                for pred in _CrossThreadPredecessors(act, cc.id, thd.id):
+                    yield (f'// wait for {pred.name} @ core {pred.executor_id} thread {pred.thread_id}\n'
+                           f'{_ThreadName(pred.executor_id, pred.thread_id)}_wait({pred.sn_in_thread});\n')
 
-                # 线程状态前进
-                f.write(f'{prefix}advance();\n')
+                # 调用 action body 函数，线程状态前进
+                yield f'{act.body_func_name}();\n{prefix}advance();\n'
 
-            f.write('}\n\n')
+            yield '}\n\n'
 
-    f.write('\n')
+    yield '\n'
 
     # 建立主入口函数，为每个线程建立一个 linux 线程，并绑定对应处理核
-    f.write('void mango_main(){\n')
-    f.write('int ret;\n')
+    yield 'void mango_main(){\nint ret;\n'
+    if sync == PreemptiveSync.FUTEX:
+        yield 'if(sysconf(_SC_NPROCESSORS_ONLN) <= 1){\nmango_spin_count = 0;\n}\n'
 
     # 每个线程 id、attr、cpu_set
     for cc in cores:
         for thd in cc.threads:
-            prefix = f'core_{cc.id}_thread_{thd.id}_'
-            f.write(f"pthread_t {prefix}id;\n")
-            f.write(f"pthread_attr_t {prefix}attr;\n")
-            f.write(f"cpu_set_t {prefix}cpu_set;\n")
+            prefix = f'{_ThreadName(cc.id, thd.id)}_'
+            yield f'pthread_t {prefix}id;\npthread_attr_t {prefix}attr;\ncpu_set_t {prefix}cpu_set;\n'
 
-    f.write('\n')
-    # 建立线程
+    yield '\n'
 
+    # 建立线程
     for cc in cores:
-        # 生成处理核内每个线程主函数
         for thd in cc.threads:
-            prefix = f"core_{cc.id}_thread_{thd.id}_"
+            prefix = f'{_ThreadName(cc.id, thd.id)}_'
+            affinity = ''
+            if core_binding:
+                yield _PREEMPTIVE_BIND_TMPL.format(prefix=prefix, core=cc.id)
+                affinity = _PREEMPTIVE_AFFINITY_TMPL.format(prefix=prefix)
+            yield _PREEMPTIVE_CREATE_TMPL.format(prefix=prefix, affinity=affinity)
+            yield _CREATE_THREAD_CHECK
 
-            f.write(f'CPU_ZERO(&{prefix}cpu_set);\n')
-            f.write(f'CPU_SET({cc.id}, &{prefix}cpu_set);\n')
-            f.write(f'pthread_attr_init(&{prefix}attr);\n')
-            f.write(
-                f'pthread_attr_setaffinity_np(&{prefix}attr, sizeof(cpu_set_t), &{prefix}cpu_set);\n')
-            f.write(
-                f'ret = pthread_create(&{prefix}id, &{prefix}attr, (void*(*)(void*)){prefix}func, NULL);\n')
-            f.write('if(ret != 0){\n')
-            f.write('printf(\"failed to pthread_create\\n\");\n')
-            f.write('exit(1);\n')
-            f.write('}\n')
+    yield '\n'
 
-    f.write('\n')
     # 等待线程结束
     for cc in cores:
-        # 生成处理核内每个线程主函数
         for thd in cc.threads:
-            prefix = f'core_{cc.id}_thread_{thd.id}_'
-            f.write(f'pthread_join({prefix}id, NULL);\n')
+            yield f'pthread_join({_ThreadName(cc.id, thd.id)}_id, NULL);\n'
 
-    f.write('}\n')
+    yield '}\n'
+
+
+def PreemptiveCBackendGenF(graph: Graph, core_binding: bool, fname: str,
+                           sync: PreemptiveSync = PreemptiveSync.MUTEX,
+                           thread_assign: ThreadAssignMode = ThreadAssignMode.GREEDY):
+    with open(fname, 'w') as f:
+        PreemptiveCBackenGen(graph, core_binding, f, sync, thread_assign)
+
+
+def PreemptiveCBackenGen(graph: Graph, core_binding: bool, f: io.TextIOWrapper,
+                         sync: PreemptiveSync = PreemptiveSync.MUTEX,
+                         thread_assign: ThreadAssignMode = ThreadAssignMode.GREEDY):
+    cores = CBackendThreadAssign(graph, thread_assign)
+    _WriteChunks(f, PreemptiveCBackendChunks(graph, cores, core_binding, sync))
 
 
 #  把 scheduler 也放进生成代码中，便于版本一致维护
-UVM_ACTION_SCHEDULER_TMPL = """
+_UVM_ACTION_TMPL = """
 class Action;
   int sn;
   string name;
@@ -745,7 +2114,10 @@ class Action;
   virtual task ExecBody({executor} exec);
   endtask
 endclass
+"""
 
+# 每个 ready 的 action fork 一个进程，开始和结束都立即写入 mango_progress.txt
+_UVM_FORK_SCHEDULER_TMPL = """
 class ActionScheduler;
   {executor} executors[];
   Action actions[];
@@ -808,13 +2180,159 @@ class ActionScheduler;
 endclass
 """
 
+UVM_ACTION_SCHEDULER_TMPL = _UVM_ACTION_TMPL + _UVM_FORK_SCHEDULER_TMPL
+
+# 每个 executor 一个 ready 队列和固定数量的工作进程，同时执行的 action 数量有上限
+# 进度先写入缓冲，满 progress_flush 行或者工作进程没有 ready 的 action 时写出，
+# 卡住时所有工作进程都在等待，缓冲中的进度已经写出
+_UVM_QUEUE_SCHEDULER_TMPL = """
+class ActionScheduler;
+  {executor} executors[];
+  Action actions[];
+  int num_action_left;
+  int progress_fd;
+  // 每个 executor 同时执行的 action 数量，+mango_max_outstanding=<n> 覆盖
+  int max_outstanding;
+  // 进度缓冲的行数，+mango_progress_flush=<n> 覆盖，1 时与每行立即写出相同
+  int progress_flush;
+  mailbox #(Action) ready[];
+  string progress_buf[$];
+
+  function new({executor} executors[], Action actions[]);
+    this.executors = executors;
+    this.actions = actions;
+    this.num_action_left = actions.size();
+    this.progress_fd = $fopen("./mango_progress.txt", "w");
+    this.max_outstanding = {max_outstanding};
+    void'($value$plusargs("mango_max_outstanding=%d", this.max_outstanding));
+    if(this.max_outstanding < 1) this.max_outstanding = 1;
+    this.progress_flush = {progress_flush};
+    void'($value$plusargs("mango_progress_flush=%d", this.progress_flush));
+    this.ready = new[executors.size()];
+    foreach(this.ready [ i ]) begin
+      this.ready[i] = new;
+    end
+  endfunction
+
+  function void Log(string line);
+    this.progress_buf.push_back(line);
+    if(this.progress_buf.size() >= this.progress_flush) begin
+      this.Flush();
+    end
+  endfunction
+
+  function void Flush();
+    foreach(this.progress_buf [ i ]) begin
+      $fdisplay(this.progress_fd, "%s", this.progress_buf[i]);
+    end
+    $fflush(this.progress_fd);
+    this.progress_buf.delete();
+  endfunction
+
+  task Worker(int executor_id);
+    forever begin
+      Action act;
+      if(this.ready[executor_id].num() == 0) begin
+        this.Flush();
+      end
+      this.ready[executor_id].get(act);
+      this.Log($sformatf("start %d", act.sn));
+      act.ExecBody(executors[executor_id]);
+      this.Log($sformatf("end %d", act.sn));
+      // 完毕以后，所有后继 action 标记本 action 完成
+      // ready 的后继放入其 executor 的队列
+      foreach(act.successors [ i ]) begin
+          Action succ = act.successors[i];
+          succ.num_predecessors--;
+          if(succ.num_predecessors <= 0) begin
+              void'(this.ready[succ.executor_id].try_put(succ));
+          end
+      end
+
+      // 修改未完成 action 数量
+      num_action_left--;
+    end
+  endtask
+
+  task Run();
+      // 初始 action 放入队列，工作进程尚未启动，不会发生竞争
+      foreach(this.actions [ i ]) begin
+          Action act = this.actions[i];
+          if(act.num_predecessors <= 0) begin
+              void'(this.ready[act.executor_id].try_put(act));
+          end
+      end
+
+      // 外层 fork join 隔离，disable fork 只结束这里启动的工作进程，不影响调用者启动的其他进程
+      fork begin
+          foreach(this.ready [ i ]) begin
+              for(int j = 0; j < this.max_outstanding; j++) begin
+                  fork
+                      automatic int executor_id = i;
+                      this.Worker(executor_id);
+                  join_none
+              end
+          end
+
+          // 等待所有 action 完成，结束工作进程
+          wait(num_action_left <= 0);
+          disable fork;
+      end join
+
+      this.Flush();
+      $fclose(this.progress_fd);
+  endtask
+endclass
+"""
+
+
+class UvmScheduler(Enum):
+    # 每个 ready 的 action 一个进程，并发数量没有上限
+    FORK = 1
+    # 每个 executor 一个 ready 队列，固定数量的工作进程
+    QUEUE = 2
+
+
+def _UvmRuntime(executor_name: str, scheduler: UvmScheduler, max_outstanding: int, progress_flush: int) -> str:
+    if scheduler == UvmScheduler.FORK:
+        return UVM_ACTION_SCHEDULER_TMPL.format(executor=executor_name)
+    return (_UVM_ACTION_TMPL.format(executor=executor_name) +
+            _UVM_QUEUE_SCHEDULER_TMPL.format(executor=executor_name, max_outstanding=max_outstanding,
+                                             progress_flush=progress_flush))
+
+
+def UvmBackendGenF(graph: Graph, executor_name: str, fname: str, pkg_name: str = None,
+                   compact: bool = False, scheduler: UvmScheduler = UvmScheduler.FORK,
+                   max_outstanding: int = 1, progress_flush: int = 64) -> None:
+    if compact:
+        # 每个 action 的数据写到同名 .hex 文件，仿真时以 $readmemh 读入，名字写到同名 .names 文件
+        data_fname, names_fname = UvmDataFileNames(fname)
+        with open(fname, 'w') as f, open(data_fname, 'w') as data_f, open(names_fname, 'w') as names_f:
+            UvmCompactBackendGen(graph, executor_name, f, data_f, names_f,
+                                 fname.replace('\\', '/').rsplit('/', 1)[-1], pkg_name,
+                                 scheduler, max_outstanding, progress_flush)
+        return
 
-def UvmBackendGenF(graph: Graph, executor_name: str, fname: str, pkg_name: str = None) -> None:
     with open(fname, 'w') as f:
-        UvmBackendGen(graph, executor_name, f, pkg_name)
+        UvmBackendGen(graph, executor_name, f, pkg_name, scheduler, max_outstanding, progress_flush)
+
+
+def UvmDataFileNames(fname: str) -> typing.Tuple[str, str]:
+    # 紧凑 uvm 输出的数据文件和名字文件
+    return f'{fname}.hex', f'{fname}.names'
+
+
+def _SetUvmNames(graph: Graph) -> None:
+    # set action class name
+    for node in graph.Nodes():
+        uvm_name = re.sub(r'\.', '_', node.name)
+        node.uvm_name = uvm_name
+        node.uvm_class_name = f'{uvm_name}_Action'
 
 
-def UvmBackendGen(graph: Graph, executor_name: str, f, pkg_name: str = None) -> None:
+def UvmBackendGen(graph: Graph, executor_name: str, f, pkg_name: str = None,
+                  scheduler: UvmScheduler = UvmScheduler.FORK,
+                  max_outstanding: int = 1, progress_flush: int = 64) -> None:
     f.write('// generated by mango\n')
     f.write('\n')
 
@@ -824,17 +2342,13 @@ def UvmBackendGen(graph: Graph, executor_name: str, f, pkg_name: str = None) ->
     f.write('import uvm_pkg::*;\n')
     f.write('`include \"uvm_macros.svh\"\n')
 
-    f.write(UVM_ACTION_SCHEDULER_TMPL.format(executor=executor_name))
+    f.write(_UvmRuntime(executor_name, scheduler, max_outstanding, progress_flush))
 
     f.write('\n')
 
     graph.UpdateSuccessors()
 
-    # set action class name
-    for node in graph.Nodes():
-        uvm_name = re.sub('\.', '_', node.name)
-        node.uvm_name = uvm_name
-        node.uvm_class_name = f'{uvm_name}_Action'
+    _SetUvmNames(graph)
 
     # declare all actions
     for node in graph.Nodes():
@@ -897,3 +2411,328 @@ def UvmBackendGen(graph: Graph, executor_name: str, f, pkg_name: str = None) ->
 
     if pkg_name is not None:
         f.write('endpackage\n')
+
+
+# 注释、字符串、标识符、实数、时间常量原样保留，只匹配出整数常量
+# based 为带进制的常量（8'hff、'd10、16'sd5），int 为不带进制的十进制常量
+_SV_TOKEN_RE = re.compile(r"""
+    //[^\n]*|/\*.*?\*/
+    |"(?:\\.|[^"\\\n])*"
+    |\\\S+
+    |[A-Za-z_$][\w$]*
+    |(?P<based>(?P<size>\d[\d_]*)?\s*'(?P<signed>[sS]?)(?P<base>[hHdDbBoO])\s*(?P<digits>[0-9a-fA-FxXzZ?_]+))
+    |'[01xXzZ]
+    |\d[\d_]*\.\d[\d_]*(?:[eE][+-]?\d+)?|\d[\d_]*[eE][+-]?\d+
+    |\d[\d_]*(?:fs|ps|ns|us|ms|s)\b
+    |(?P<int>\d[\d_]*)
+    |[\[\]]
+""", re.X | re.S)
+
+# 要求常量的上下文，出现时不参数化
+_SV_CONST_CONTEXT_RE = re.compile(
+    r'\b(?:parameter|localparam|typedef|enum|struct|union|generate|genvar|class|function|task|'
+    r'covergroup|constraint|module|interface|package|import|bind)\b|`|#\s*\(')
+
+_SV_BASES = {'h': 16, 'd': 10, 'b': 2, 'o': 8}
+
+
+def _SvLiteral(m: re.Match) -> typing.Optional[typing.Tuple[str, int, int]]:
+    # 返回 (类型, 位宽, 值)，值中有 x/z 等不能参数化时返回 None
+    if m.group('int') is not None:
+        value = int(m.group('int').replace('_', ''))
+        if value > (1 << 31) - 1:
+            return None
+        return 'int', 32, value
+
+    digits = m.group('digits').replace('_', '')
+    try:
+        value = int(digits, _SV_BASES[m.group('base').lower()])
+    except ValueError:
+        return None
+    signed = ' signed' if m.group('signed') else ''
+    if m.group('size') is None:
+        # 不指定位宽时为 32 位
+        if value >= 1 << 32:
+            return None
+        width = 32
+    else:
+        width = int(m.group('size').replace('_', ''))
+        if width == 0:
+            return None
+        value &= (1 << width) - 1
+    return f'bit{signed} [{width - 1}:0]', width, value
+
+
+def _SvBodyTemplate(src: str) -> typing.Optional[typing.Tuple[typing.Tuple, typing.Tuple[typing.Tuple[int, int], ...]]]:
+    # 与 _BodyTemplate 相同，把 sv_src 中的整数常量抽出来，返回 (模板, ((位宽, 值), ...))
+    # 常量替换为同样位宽和符号的成员变量，表达式的位宽和符号不变
+    # 方括号内（位宽、下标）、复制次数、位宽转换中的常量保留在模板中
+    if _SV_CONST_CONTEXT_RE.search(src):
+        return None
+
+    pieces = []
+    types = []
+    values = []
+    last = 0
+    depth = 0
+    for m in _SV_TOKEN_RE.finditer(src):
+        tok = m.group()
+        if tok == '[':
+            depth += 1
+            continue
+        if tok == ']':
+            depth -= 1
+            continue
+        if depth > 0 or (m.group('int') is None and m.group('based') is None):
+            continue
+        start, end = m.span()
+        after = src[end:].lstrip()
+        if m.group('int') is not None and (after.startswith("'") or
+                                           (src[:start].rstrip().endswith('{') and after.startswith('{'))):
+            continue
+        lit = _SvLiteral(m)
+        if lit is None:
+            continue
+        pieces.append(src[last:start])
+        types.append(lit[0])
+        values.append(lit[1:])
+        last = end
+
+    if len(values) == 0:
+        return None
+
+    pieces.append(src[last:])
+    return (tuple(pieces), tuple(types)), tuple(values)
+
+
+def _SvArgWords(values: typing.Tuple[typing.Tuple[int, int], ...]) -> typing.List[int]:
+    # 每个参数占 (位宽 + 31) / 32 个字，低位在前
+    words = []
+    for width, value in values:
+        for _ in range((width + 31) // 32):
+            words.append(value & 0xffffffff)
+            value >>= 32
+    return words
+
+
+def _SvSetArgs(types: typing.Tuple[str, ...], values: typing.Tuple[typing.Tuple[int, int], ...]) -> str:
+    # 从数据文件的 pos 开始读出所有参数
+    lines = []
+    pos = 0
+    for i, (width, _) in enumerate(values):
+        num = (width + 31) // 32
+        words = ', '.join(f'data[pos + {pos + k}]' for k in reversed(range(num)))
+        lines.append(f'    mango_a{i} = {words if num == 1 else "{" + words + "}"};\n')
+        pos += num
+    fields = ''.join(f'  {t} mango_a{i};\n' for i, t in enumerate(types))
+    return (f'{fields}\n'
+            '  virtual function void SetArgs(const ref int data[], input int pos);\n'
+            f'{"".join(lines)}'
+            '  endfunction\n')
+
+
+# 紧凑 uvm 输出中类的公共基类，参数化的类从数据文件读出自己的常量
+_UVM_ARGS_ACTION = (
+    'class MangoArgsAction extends Action;\n'
+    '  virtual function void SetArgs(const ref int data[], input int pos);\n'
+    '  endfunction\n'
+    'endclass\n'
+    '\n')
+
+# 紧凑 uvm 输出中数据文件的布局，每个数为一个 32 位字：
+# 头部 action 数量、后继下标数量、参数字数
+# 每个 action 一行：类编号、sn、executor_id、前序数量、后继下标起始位置、后继数量、参数起始位置、名字下标
+# 之后为所有 action 的后继在 actions 数组中的下标，再之后为所有 action 的参数
+# 名字文件每行一个名字
+_UVM_DATA_HEADER_WORDS = 3
+_UVM_DATA_ROW_WORDS = 8
+
+
+def UvmCompactBackendGen(graph: Graph, executor_name: str, f, data_f, names_f, base_fname: str,
+                         pkg_name: str = None, scheduler: UvmScheduler = UvmScheduler.FORK,
+                         max_outstanding: int = 1, progress_flush: int = 64) -> None:
+    # sv_src 相同，或者只有整数常量不同的 action 共用一个类，
+    # 每个 action 的 sn、前序数量、后继、常量等数据放在 data_f 中，名字放在 names_f 中，
+    # TestCase 构造时读入再建立 action 对象，
+    # 生成代码的大小、编译和 elaboration 时间只与不同 body 的数量有关
+    # 仿真时默认读当前目录下的 <base_fname>.hex 和 <base_fname>.names，
+    # 可以用 +mango_uvm_data=<path>、+mango_uvm_names=<path> 指定
+    f.write('// generated by mango\n')
+    f.write('\n')
+
+    if pkg_name is not None:
+        f.write(f'package {pkg_name};\n')
+
+    f.write('import uvm_pkg::*;\n')
+    f.write('`include \"uvm_macros.svh\"\n')
+
+    f.write(_UvmRuntime(executor_name, scheduler, max_outstanding, progress_flush))
+
+    f.write('\n')
+    f.write(_UVM_ARGS_ACTION)
+
+    graph.UpdateSuccessors()
+    _SetUvmNames(graph)
+
+    # sv_src 相同的 action 归为一组
+    identical: typing.Dict[str, typing.List[Node]] = {}
+    for node in graph.Nodes():
+        assert (node.is_target)
+        identical.setdefault(node.sv_src or '', []).append(node)
+
+    # 只有常量不同的组再按模板归并
+    templates: typing.Dict[typing.Any, typing.List[str]] = {}
+    values_of: typing.Dict[str, typing.Tuple] = {}
+    for src in identical:
+        tmpl = _SvBodyTemplate(src) if src else None
+        if tmpl is not None:
+            templates.setdefault(tmpl[0], []).append(src)
+            values_of[src] = tmpl[1]
+
+    class_ids: typing.Dict[Node, int] = {}
+    args: typing.Dict[Node, typing.List[int]] = {}
+    class_names = []
+
+    def WriteClass(group: typing.List[Node], body: str, members: str) -> None:
+        class_name = group[0].uvm_class_name
+        for node in group:
+            node.uvm_class_name = class_name
+            class_ids[node] = len(class_names)
+        class_names.append(class_name)
+
+        if len(group) > 1:
+            f.write(f'// shared by {len(group)} actions\n')
+        f.write(f'class {class_name} extends MangoArgsAction;\n')
+        f.write(members)
+        f.write(f'  virtual task ExecBody({executor_name} exec);\n')
+        if body:
+            f.write(body)
+            f.write('\n')
+        f.write('  endtask\n')
+        f.write('endclass\n')
+        f.write('\n')
+
+    for (pieces, types), srcs in templates.items():
+        if len(srcs) < 2:
+            continue
+        group = []
+        for src in srcs:
+            words = _SvArgWords(values_of[src])
+            for node in identical.pop(src):
+                args[node] = words
+                group.append(node)
+        body = ''.join(f'{pieces[i]}mango_a{i}' for i in range(len(types))) + pieces[-1]
+        WriteClass(group, body, _SvSetArgs(types, values_of[srcs[0]]))
+
+    for sv_src, group in identical.items():
+        WriteClass(group, sv_src, '')
+
+    # 数据文件
+    index = {node: i for i, node in enumerate(graph.Nodes())}
+    names = columnar.StringTable()
+    succs = []
+    arg_words = []
+    rows = []
+    for node in graph.Nodes():
+        begin = len(succs)
+        succs.extend(index[succ] for succ in node.Successors())
+        arg_begin = len(arg_words)
+        arg_words.extend(args.get(node, ()))
+        rows.append(f'{class_ids[node]:x} {node.sn:x} {node.executor_id:x} {len(node.predecessors):x} '
+                    f'{begin:x} {len(succs) - begin:x} {arg_begin:x} {names.Add(node.name):x}\n')
+    data_f.write(f'// generated by mango\n{len(rows):x} {len(succs):x} {len(arg_words):x}\n')
+    data_f.write(''.join(rows))
+    data_f.write('// successors\n')
+    for i in range(0, len(succs), 16):
+        data_f.write(' '.join(f'{v:x}' for v in succs[i:i + 16]) + '\n')
+    data_f.write('// arguments\n')
+    for i in range(0, len(arg_words), 16):
+        data_f.write(' '.join(f'{v:x}' for v in arg_words[i:i + 16]) + '\n')
+    for name in names.strings:
+        names_f.write(f'{name}\n')
+
+    succ_base = _UVM_DATA_HEADER_WORDS + _UVM_DATA_ROW_WORDS * len(rows)
+    arg_base = succ_base + len(succs)
+    num_words = arg_base + len(arg_words)
+    f.write('class TestCase;\n')
+    f.write('  ActionScheduler action_scheduler;\n')
+    f.write('\n')
+    f.write(f'  function new({executor_name} execs[]);\n')
+    f.write('    MangoArgsAction actions[];\n')
+    f.write('    Action scheduled[];\n')
+    f.write('    int data[];\n')
+    f.write('    string names[$];\n')
+    f.write('    string line;\n')
+    f.write('    int names_fd;\n')
+    f.write(f'    string data_file = "{base_fname}.hex";\n')
+    f.write(f'    string names_file = "{base_fname}.names";\n')
+    f.write('\n')
+    f.write('    void\'($value$plusargs("mango_uvm_data=%s", data_file));\n')
+    f.write('    void\'($value$plusargs("mango_uvm_names=%s", names_file));\n')
+    f.write(f'    data = new[{num_words}];\n')
+    f.write('    $readmemh(data_file, data);\n')
+    f.write(f'    if(data[0] != {len(rows)} || data[1] != {len(succs)} || data[2] != {len(arg_words)}) begin\n')
+    f.write('      $fatal(1, "%s does not match the generated code", data_file);\n')
+    f.write('    end\n')
+    f.write('    names_fd = $fopen(names_file, "r");\n')
+    f.write('    if(names_fd == 0) begin\n')
+    f.write('      $fatal(1, "failed to open %s", names_file);\n')
+    f.write('    end\n')
+    f.write('    while($fgets(line, names_fd)) begin\n')
+    f.write('      names.push_back(line.substr(0, line.len() - 2));\n')
+    f.write('    end\n')
+    f.write('    $fclose(names_fd);\n')
+    f.write(f'    if(names.size() != {len(names.strings)}) begin\n')
+    f.write('      $fatal(1, "%s does not match the generated code", names_file);\n')
+    f.write('    end\n')
+    f.write('\n')
+    f.write(f'    actions = new[{len(rows)}];\n')
+    f.write('    foreach(actions [ i ]) begin\n')
+    f.write(f'      int row = {_UVM_DATA_HEADER_WORDS} + i * {_UVM_DATA_ROW_WORDS};\n')
+    f.write('      actions[i] = this.NewAction(data[row]);\n')
+    f.write('      actions[i].sn = data[row + 1];\n')
+    f.write('      actions[i].executor_id = data[row + 2];\n')
+    f.write('      actions[i].num_predecessors = data[row + 3];\n')
+    f.write(f'      actions[i].SetArgs(data, {arg_base} + data[row + 6]);\n')
+    f.write('      actions[i].name = names[data[row + 7]];\n')
+    f.write('    end\n')
+    f.write('\n')
+    # 所有 action 建立以后再设置后继
+    f.write('    foreach(actions [ i ]) begin\n')
+    f.write(f'      int row = {_UVM_DATA_HEADER_WORDS} + i * {_UVM_DATA_ROW_WORDS};\n')
+    f.write(f'      int succ_begin = {succ_base} + data[row + 4];\n')
+    f.write('      actions[i].successors = new[data[row + 5]];\n')
+    f.write('      foreach(actions[i].successors [ j ]) begin\n')
+    f.write('        actions[i].successors[j] = actions[data[succ_begin + j]];\n')
+    f.write('      end\n')
+    f.write('    end\n')
+    f.write('    scheduled = new[actions.size()];\n')
+    f.write('    foreach(actions [ i ]) begin\n')
+    f.write('      scheduled[i] = actions[i];\n')
+    f.write('    end\n')
+    f.write('    this.action_scheduler = new(execs, scheduled);\n')
+    f.write('  endfunction\n')
+    f.write('\n')
+
+    f.write('  function MangoArgsAction NewAction(int class_id);\n')
+    f.write('    case(class_id)\n')
+    for i, class_name in enumerate(class_names):
+        f.write(f'      {i}: begin\n')
+        f.write(f'        {class_name} act = new;\n')
+        f.write('        return act;\n')
+        f.write('      end\n')
+    f.write('    endcase\n')
+    f.write('    $fatal(1, "unknown action class %0d", class_id);\n')
+    f.write('    return null;\n')
+    f.write('  endfunction\n')
+    f.write('\n')
+
+    f.write('  task Run();\n')
+    f.write('    this.action_scheduler.Run();\n')
+    f.write('  endtask\n')
+
+    f.write('endclass\n')
+    f.write('\n')
+
+    if pkg_name is not None:
+        f.write('endpackage\n')
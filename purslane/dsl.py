@@ -15,10 +15,15 @@
 import random
 import logging
 import argparse
+import atexit
 import typing
 import sys
+import os
 from pathlib import Path
+from purslane import cache
 from purslane import dag
+from purslane import profiler
+from purslane import trace
 logger = logging.getLogger(__name__)
 
 
@@ -36,6 +41,42 @@ class NameResolver:
             return f'{name}_0'
 
 
+class ScopeIndex:
+    '''
+    records dependencies crossing sub-scopes of parallels when they are added
+
+    structural edges never leave the scope adding them, only deps may connect
+    different branches. a dependency between two scopes crosses the sub-scopes
+    of their lowest common ancestor, found by walking up parent scopes
+    '''
+
+    def __init__(self):
+        # first crossing edge of each parallel
+        self._crossings: typing.Dict[typing.Any, typing.Tuple[dag.Node, dag.Node]] = {}
+
+    def AddDependency(self, dep_scope, scope, pred: dag.Node, succ: dag.Node) -> None:
+        su = dep_scope
+        sv = scope
+        cu = None
+        cv = None
+        while su.depth > sv.depth:
+            cu, su = su, su.parent
+        while sv.depth > su.depth:
+            cv, sv = sv, sv.parent
+        while su is not sv:
+            cu, su = su, su.parent
+            cv, sv = sv, sv.parent
+            if su is None or sv is None:
+                # different root scopes
+                return
+
+        if cu is not None and cv is not None and isinstance(su, Parallel):
+            self._crossings.setdefault(su, (pred, succ))
+
+    def Crossing(self, scope) -> typing.Optional[typing.Tuple[dag.Node, dag.Node]]:
+        return self._crossings.pop(scope, None)
+
+
 class Context:
     def __init__(self):
         self.name_resolver = NameResolver()
@@ -44,11 +85,19 @@ class Context:
         self.pred = None
         self.parent_executor_id = None
         self.num_executors = 0
+        # 增量构建依赖图，scope 只记录首尾的目标节点集合，不生成 init/final 节点
+        self.incremental = False
+        self.scope_index = ScopeIndex()
 
     def PushScope(self, scope):
         # logger.debug(f'PushScope {scope.name}')
         if len(self.scopes) > 0:
             self.scopes[-1].SubScopeEnter(scope)
+            scope.parent = self.scopes[-1]
+            scope.depth = scope.parent.depth + 1
+        else:
+            scope.parent = None
+            scope.depth = 0
         self.scopes.append(scope)
 
     def PopScope(self, scope):
@@ -63,6 +112,27 @@ class Context:
 
 global_ctx = Context()
 
+# 场景直接写出的文件，例如 rand_proc.S，由 OpenOutput 打开，生成结果缓存会一并保存和恢复
+# 文件属于当前的 GenerationSession，session 结束或进程退出时关闭
+output_files: typing.Dict[str, typing.TextIO] = {}
+
+
+def OpenOutput(fname: str, header: str = '') -> typing.TextIO:
+    # 同一个 session 中重复打开返回同一个文件，header 只在第一次打开时写入
+    f = output_files.get(fname)
+    if f is None or f.closed:
+        f = output_files[fname] = open(fname, 'w')
+        f.write(header)
+    return f
+
+
+def _CloseOutputs() -> None:
+    for f in output_files.values():
+        f.close()
+
+
+atexit.register(_CloseOutputs)
+
 
 class Action:
     @classmethod
@@ -80,10 +150,15 @@ class Action:
         self.c_header = None
         self.c_decl = None
         self.executor_id = None
+        # 估计耗时，用于 purslane.makespan 估计执行时间，None 使用默认值
+        self.cost: int = None
 
         self.scope = None
         self.deps: typing.List[Action] = []
 
+        if profiler.active is not None:
+            profiler.active.ActionConstructed(self.GetClassName())
+
     # def Activity(self):
     #   with Parallel():
         # 内部每个 action 都是 parallel 的
@@ -97,16 +172,25 @@ class Action:
 class Sequence:
     def __init__(self) -> None:
         self.name = global_ctx.name_resolver.Resolve('seq')
-        self.init_node = dag.Node(f'{self.name}_init')
-        self.final_node = dag.Node(f'{self.name}_final')
+        if global_ctx.incremental:
+            _InitFrontier(self)
+        else:
+            self.init_node = dag.Node(f'{self.name}_init')
+            self.final_node = dag.Node(f'{self.name}_final')
         self.cur_pred = self.init_node
         self.sub_scopes = []
 
     def __enter__(self):
-        global_ctx.graph.AddNode(self.init_node)
+        if not global_ctx.incremental:
+            global_ctx.graph.AddNode(self.init_node)
         global_ctx.PushScope(self)
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if global_ctx.incremental:
+            _SequenceFrontier(self)
+            global_ctx.PopScope(self)
+            return
+
         cur_pred = self.init_node
         for ss in self.sub_scopes:
             ss.init_node.AddPredecessor(cur_pred)
@@ -130,14 +214,18 @@ class Sequence:
 class Parallel:
     def __init__(self) -> None:
         self.name = global_ctx.name_resolver.Resolve('para')
-        self.init_node = dag.Node(f'{self.name}_init')
-        self.final_node = dag.Node(f'{self.name}_final')
+        if global_ctx.incremental:
+            _InitFrontier(self)
+        else:
+            self.init_node = dag.Node(f'{self.name}_init')
+            self.final_node = dag.Node(f'{self.name}_final')
         # self._sub_scope_inits = []
         # self._sub_scope_finals = []
         self.sub_scopes = []
 
     def __enter__(self):
-        global_ctx.graph.AddNode(self.init_node)
+        if not global_ctx.incremental:
+            global_ctx.graph.AddNode(self.init_node)
         global_ctx.PushScope(self)
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -145,27 +233,19 @@ class Parallel:
         # check if there is any dependency between different sub scopes
         # a final node that can reach any other init nodes indicates a dependency across sub-scopes.
 
-        graph = dag.Graph()
-        scopes = self.sub_scopes[:]
+        # 依赖在添加时已经由 scope index 检查，这里只需要查询
+        crossing = global_ctx.scope_index.Crossing(self)
+        if crossing is not None:
+            pred, succ = crossing
+            logger.critical(
+                f'dependence across sub-scopes of a parallel {pred.name} {succ.name}')
+            global_ctx.PopScope(self)
+            raise RuntimeError('dependence across sub-scopes of a parallel')
 
-        while len(scopes) > 0:
-            ss = scopes.pop()
-            if ss.init_node is ss.final_node:
-                graph.AddNode(ss.init_node)
-            else:
-                graph.AddNode(ss.init_node)
-                graph.AddNode(ss.final_node)
-            scopes.extend(ss.sub_scopes[:])
-        
-        graph.AssignSN()
-        graph.UpdateAllPredecessors()
-
-        for i, ss in enumerate(self.sub_scopes):
-            cur_final = ss.final_node
-            for j, ss2 in enumerate(self.sub_scopes):
-                if i != j and ss2.init_node.sn in cur_final.all_predecessors:
-                    logger.critical(f'dependence across sub-scopes of a parallel {ss.final_node.name} {ss2.init_node.name}')
-                    raise 'dependence across sub-scopes of a parallel'
+        if global_ctx.incremental:
+            _ParallelFrontier(self)
+            global_ctx.PopScope(self)
+            return
 
         if len(self.sub_scopes) > 0:
             for ss in self.sub_scopes:
@@ -191,15 +271,24 @@ class Parallel:
 class Schedule:
     def __init__(self) -> None:
         self.name = global_ctx.name_resolver.Resolve('sched')
-        self.init_node = dag.Node(f'{self.name}_init')
-        self.final_node = dag.Node(f'{self.name}_final')
+        if global_ctx.incremental:
+            _InitFrontier(self)
+        else:
+            self.init_node = dag.Node(f'{self.name}_init')
+            self.final_node = dag.Node(f'{self.name}_final')
         self.sub_scopes = []
 
     def __enter__(self):
-        global_ctx.graph.AddNode(self.init_node)
+        if not global_ctx.incremental:
+            global_ctx.graph.AddNode(self.init_node)
         global_ctx.PushScope(self)
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if global_ctx.incremental:
+            _ParallelFrontier(self)
+            global_ctx.PopScope(self)
+            return
+
         if len(self.sub_scopes) > 0:
             for ss in self.sub_scopes:
                 ss.init_node.AddPredecessor(self.init_node)
@@ -224,14 +313,18 @@ class CompoundActionScope:
         self.name = act.name
         self.act = act
         act.scope = self
-        self.init_node = dag.Node(f'{self.name}_init')
-        self.final_node = dag.Node(f'{self.name}_final')
+        if global_ctx.incremental:
+            _InitFrontier(self)
+        else:
+            self.init_node = dag.Node(f'{self.name}_init')
+            self.final_node = dag.Node(f'{self.name}_final')
         self.cur_parent_executor_id = False
         self.sub_scopes = []
         # self.cur_pred = self.init_node
 
     def __enter__(self):
-        global_ctx.graph.AddNode(self.init_node)
+        if not global_ctx.incremental:
+            global_ctx.graph.AddNode(self.init_node)
         global_ctx.PushScope(self)
 
         if global_ctx.parent_executor_id is None:
@@ -247,13 +340,16 @@ class CompoundActionScope:
                 raise ('the executor id of a child must follow its parent')
 
     def __exit__(self, exc_type, exc_value, traceback):
-        global_ctx.graph.AddNode(self.final_node)
+        if global_ctx.incremental:
+            _SequenceFrontier(self)
+        else:
+            global_ctx.graph.AddNode(self.final_node)
 
-        cur_pred = self.init_node
-        for ss in self.sub_scopes:
-            ss.init_node.AddPredecessor(cur_pred)
-            cur_pred = ss.final_node
-        self.final_node.AddPredecessor(cur_pred)
+            cur_pred = self.init_node
+            for ss in self.sub_scopes:
+                ss.init_node.AddPredecessor(cur_pred)
+                cur_pred = ss.final_node
+            self.final_node.AddPredecessor(cur_pred)
 
         global_ctx.PopScope(self)
 
@@ -279,6 +375,9 @@ class AtomicActionScope:
         self.init_node = self.target_node
         self.final_node = self.target_node
         self.sub_scopes = []
+        if global_ctx.incremental:
+            self.heads = self.tails = [self.target_node]
+            self.aux_nodes = []
 
     def __enter__(self) -> dag.Node:
         global_ctx.PushScope(self)
@@ -298,6 +397,69 @@ class AtomicActionScope:
     def __exit__(self, exc_type, exc_value, traceback):
         global_ctx.PopScope(self)
 
+# incremental graph construction
+# scope 记录首节点集合 heads（没有 scope 内前序）和尾节点集合 tails（没有 scope 内后继），
+# 退出时直接在目标节点之间连边
+
+
+def _InitFrontier(scope) -> None:
+    scope.init_node = None
+    scope.final_node = None
+    scope.heads: typing.List[dag.Node] = []
+    scope.tails: typing.List[dag.Node] = []
+    # scope 自己生成的非目标节点（空 scope 占位节点、汇聚点）
+    scope.aux_nodes: typing.List[dag.Node] = []
+
+
+def _AuxNode(scope, name: str) -> dag.Node:
+    node = dag.Node(f'{scope.name}_{name}_{len(scope.aux_nodes)}')
+    global_ctx.graph.AddNode(node)
+    scope.aux_nodes.append(node)
+    return node
+
+
+def _Link(scope, preds: typing.List[dag.Node], succs: typing.List[dag.Node]) -> None:
+    # 前序和后继都较多时，经过一个非目标的汇聚点连接，m+n 条边代替 m*n 条边，
+    # 由 Graph.TransitiveReduction 展开
+    if len(preds) > 1 and len(succs) > 1 and len(preds) * len(succs) > len(preds) + len(succs):
+        junction = _AuxNode(scope, 'junction')
+        for pred in preds:
+            junction.AddPredecessor(pred)
+        preds = [junction]
+
+    for succ in succs:
+        for pred in preds:
+            succ.AddPredecessor(pred)
+
+
+def _Placeholder(scope) -> None:
+    # 空 scope 使用一个非目标节点占位，依赖仍然可以穿过空 scope 传递
+    node = _AuxNode(scope, 'empty')
+    scope.heads = [node]
+    scope.tails = [node]
+
+
+def _SequenceFrontier(scope) -> None:
+    for ss in scope.sub_scopes:
+        if len(scope.heads) == 0:
+            scope.heads = ss.heads
+        else:
+            _Link(scope, scope.tails, ss.heads)
+        scope.tails = ss.tails
+
+    if len(scope.heads) == 0:
+        _Placeholder(scope)
+
+
+def _ParallelFrontier(scope) -> None:
+    for ss in scope.sub_scopes:
+        scope.heads.extend(ss.heads)
+        scope.tails.extend(ss.tails)
+
+    if len(scope.heads) == 0:
+        _Placeholder(scope)
+
+
 # behaviour
 
 
@@ -327,16 +489,22 @@ def PrepareArgParser(parser: argparse.ArgumentParser) -> None:
     # -F, --flist 源文件列表
     # --root 根组件名
     # --entry 入口action名
+    # --graph_npz_output 同时输出紧凑的列存储格式图文件，可以用 dag.Graph.LoadNpz 加载
     # --num_executors 指定 executors 数量，soc 中一般是指处理核数量，uvm 中一般指某种 agent 数量，例如 chi rnf
-
-    # --uvm_output 指定 uvm 输出文件
-    # --uvm_pkg_name 指定输出 uvm 源码的 package 名字，不指定则生成代码没有 package
-    # --uvm_executor_name 指定输出 uvm 源码中使用 executor 的类型名
-
-    # --soc_output 指定 c 语言输出文件
-    # --soc_cooperative 指定 c 语言输出线程框架为 cooperative 形式
-    # --soc_cooperative_hosted 指定 cooperative 多线程时是否运行在操作系统上，编译时必须增加 -D_GNU_SOURCE
-    # --soc_preemptive 指定 c 语言输出为抢占式多线程，基于 pthread，编译时必须增加 -D_GNU_SOURCE
+    # --executor_policy 没有指定 executor 的 action 的分配策略
+    #   spread 按拓扑顺序轮流分配
+    #   random 随机分配
+    #   critical_path 按关键路径列表调度，长依赖链留在同一个处理核上，减少跨核等待，同时平衡负载
+    # --cross_core_fraction critical_path 策略中跨核依赖至少占全部依赖的比例，用于控制一致性压力
+    # --profile 记录各个阶段的耗时、最大 rss，以及每个 Action 类的构造次数、Do 次数和耗时，
+    #   输出到 graph_output 同目录的 *_profile.json，以及 flamegraph.pl 可用的 *_profile.folded
+    # --profile_memory 同 --profile，另外使用 tracemalloc 记录每个阶段 python 内存分配峰值，生成会明显变慢
+    # --incremental_graph 增量构建依赖图，scope 退出时直接在目标节点之间连边，不生成 init/final 节点
+    # --cache_dir 生成结果缓存目录，默认取环境变量 PURSLANE_CACHE_DIR，不指定则不使用缓存
+    #   key 包括随机种子、所有参数以及已加载的场景源码（包括 purslane 和 ivy_app_cfg），命中时直接恢复输出文件
+    #   没有指定 --seed 或者启用 --profile 时不使用缓存
+    # --cache_max_size 生成结果缓存的容量，单位 MiB，超出时按最近使用时间淘汰
+    # 其余为后端选项，见 PrepareBackendArgParser
 
     # parser = argparse.ArgumentParser()
     # parser.add_argument("testcase", metavar='testcase',
@@ -344,13 +512,90 @@ def PrepareArgParser(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('-S', '--seed', help='random seed, default is random')
     parser.add_argument('--graph_output', default='graph.json',
                         help='graph output file name')
+    parser.add_argument('--graph_npz_output', default=None,
+                        help='compact columnar graph output file name (.npz)')
     parser.add_argument('--num_executors', default=2,
                         type=int, help='number of executors')
+    parser.add_argument('--executor_policy', default='spread',
+                        choices=[m.name.lower() for m in dag.ExecutorAssignPolicy],
+                        help='executor assign policy of actions without a bound executor')
+    parser.add_argument('--cross_core_fraction', default=0.0, type=float,
+                        help='minimum fraction of cross-core dependencies for the critical_path policy')
+    PrepareBackendArgParser(parser)
+    parser.add_argument('--profile', action='store_true',
+                        help='write a generation profile next to the graph output')
+    parser.add_argument('--profile_memory', action='store_true',
+                        help='like --profile, also trace peak python memory of each phase')
+    parser.add_argument('--incremental_graph', action='store_true',
+                        help='build the graph incrementally without init/final scaffolding nodes')
+    parser.add_argument('--cache_dir', default=os.environ.get('PURSLANE_CACHE_DIR'),
+                        help='generation cache directory, default is $PURSLANE_CACHE_DIR')
+    parser.add_argument('--cache_max_size', default=1024, type=int,
+                        help='generation cache size limit in MiB')
+    # return parser
+    # options = parser.parse_args()
+    # return options
+
+
+def PrepareBackendArgParser(parser: argparse.ArgumentParser) -> None:
+    # 后端选项，运行场景和从保存的图重新生成后端（purslane.backend）共用
+
+    # --uvm_output 指定 uvm 输出文件
+    # --uvm_pkg_name 指定输出 uvm 源码的 package 名字，不指定则生成代码没有 package
+    # --uvm_executor_name 指定输出 uvm 源码中使用 executor 的类型名
+    # --uvm_compact sv_src 相同或只有整数常量不同的 action 共用一个类，每个 action 的数据和常量输出到
+    #   <uvm_output>.hex，名字输出到 <uvm_output>.names，仿真时读入，默认在当前目录，
+    #   可以用 +mango_uvm_data=<path>、+mango_uvm_names=<path> 指定
+    # --uvm_scheduler uvm 输出中 ActionScheduler 的调度方式
+    #   fork 每个 ready 的 action fork 一个进程，每行进度立即写出
+    #   queue 每个 executor 一个 ready 队列和 --uvm_max_outstanding 个工作进程，进度缓冲 --uvm_progress_flush 行写出，
+    #   仿真时可以用 +mango_max_outstanding=<n>、+mango_progress_flush=<n> 覆盖
+
+    # --soc_output 指定 c 语言输出文件
+    # --soc_cooperative 指定 c 语言输出线程框架为 cooperative 形式
+    # --soc_cooperative_hosted 指定 cooperative 多线程时是否运行在操作系统上，编译时必须增加 -D_GNU_SOURCE
+    # --soc_preemptive 指定 c 语言输出为抢占式多线程，基于 pthread，编译时必须增加 -D_GNU_SOURCE
+    # --soc_preemptive_sync 抢占式多线程输出中线程状态的同步方式
+    #   mutex 每个线程一个 mutex 和条件变量
+    #   futex 原子读写线程状态，等待时先自旋再以 futex 阻塞，只支持 linux
+    # --soc_split cooperative 输出每个处理核一个 .c 文件，另有同名 .h 共享头文件，--soc_output 文件只包含状态变量和入口函数
+    #   内容不变的文件不会重写，c_decl 会出现在每个文件中，其中不能有非 static 的定义
+    # --soc_body_interning cooperative 输出中 body 函数的合并方式
+    #   none 每个 action 一个 body 函数
+    #   identical c_src 相同的 action 共用 body 函数
+    #   parameterized 只有整数常量不同的 action 也共用 body 函数，常量来自生成的常量表
+    # --soc_scheduler cooperative 输出的调度方式
+    #   switch 每个线程一个 switch 函数
+    #   table action 和前序条件生成常量表，由固定的运行时循环执行，不支持 parameterized
+    # --soc_wait cooperative 输出中一轮轮询没有线程前进时的等待方式
+    #   spin 立即重新轮询
+    #   backoff 指数增长的空转等待
+    #   wfe aarch64 wfe 等待，线程状态前进后 sev，hosted 时为 sched_yield
+    # --soc_poll_count cooperative 输出中记录每个线程因前序未完成而返回的次数，变量 core_<i>_thread_<j>_polls，
+    #   table 调度时为数组 core_<i>_polls
+    # --soc_thread_assign cooperative 输出中处理核内 action 划分为线程的方式
+    #   greedy 按随机拓扑序加入第一个可以加入的线程
+    #   chain_cover 每个处理核的最小链覆盖，线程数最少，图很大时较慢
+    #   saved 使用保存的图中的线程划分，只用于 purslane.backend，preemptive 输出也适用
+    # --soc_trace cooperative 输出中每个处理核在环形缓冲区记录 action 的等待结束、开始、结束时间戳，
+    #   另外输出 <soc_output>.trace.json，运行后 dump 的缓冲区由 python -m purslane.trace 解析
+    # --soc_trace_entries 每个处理核环形缓冲区的记录数，必须是 2 的幂
+    # --soc_trace_addr 裸机时环形缓冲区的地址，不指定时为全局数组 mango_trace_rings
     parser.add_argument('--uvm_output', default=None, help='uvm output')
     parser.add_argument('--uvm_pkg_name', default=None,
                         help='uvm package name')
     parser.add_argument('--uvm_executor_name',
                         default='uvm_executor', help='uvm executor name')
+    parser.add_argument('--uvm_compact', action='store_true',
+                        help='uvm classes shared by actions whose sv_src differs only in integer literals, '
+                             'action data in a $readmemh file')
+    parser.add_argument('--uvm_scheduler', default='fork',
+                        choices=[m.name.lower() for m in dag.UvmScheduler],
+                        help='uvm action scheduler, fork per ready action or per-executor ready queues')
+    parser.add_argument('--uvm_max_outstanding', type=int, default=1,
+                        help='uvm queue scheduler concurrent actions per executor')
+    parser.add_argument('--uvm_progress_flush', type=int, default=64,
+                        help='uvm queue scheduler progress lines buffered before writing')
     parser.add_argument('--soc_output', default=None,
                         help='soc output file name')
     parser.add_argument('--soc_cooperative',
@@ -358,16 +603,42 @@ def PrepareArgParser(parser: argparse.ArgumentParser) -> None:
     parser.add_argument('--soc_cooperative_hosted', action='store_true',
                         help='soc copoerative hosted based on pthread')
     parser.add_argument('--soc_preemptive', action='store_true')
+    parser.add_argument('--soc_preemptive_sync', default='mutex',
+                        choices=[m.name.lower() for m in dag.PreemptiveSync],
+                        help='soc preemptive thread state synchronization, mutex and condvar or atomics and futex')
+    parser.add_argument('--soc_split', action='store_true',
+                        help='soc cooperative output with one compilation unit per core')
+    parser.add_argument('--soc_body_interning', default='none',
+                        choices=[m.name.lower() for m in dag.BodyInterning],
+                        help='share body functions of actions with identical or constant-only different c_src')
+    parser.add_argument('--soc_scheduler', default='switch',
+                        choices=[m.name.lower() for m in dag.CooperativeScheduler],
+                        help='soc cooperative scheduler, per-thread switch functions or dependency tables')
+    parser.add_argument('--soc_wait', default='spin',
+                        choices=[m.name.lower() for m in dag.CooperativeWait],
+                        help='soc cooperative wait strategy when no thread makes progress in a round')
+    parser.add_argument('--soc_poll_count', action='store_true',
+                        help='soc cooperative per-thread counters of polls waiting for predecessors')
+    parser.add_argument('--soc_thread_assign', default='greedy',
+                        choices=[m.name.lower() for m in dag.ThreadAssignMode],
+                        help='soc cooperative thread assignment, greedy, minimum chain cover or saved in the graph')
+    parser.add_argument('--soc_trace', action='store_true',
+                        help='soc cooperative per-core trace ring buffers of action timestamps')
+    parser.add_argument('--soc_trace_entries', type=int, default=4096,
+                        help='soc trace records per core, a power of 2')
+    parser.add_argument('--soc_trace_addr', type=lambda x: int(x, 0), default=None,
+                        help='soc trace ring buffers address on bare metal')
     parser.add_argument('--debug', action='store_true')
-    # return parser
-    # options = parser.parse_args()
-    # return options
 
 # run action
 # more readable
 
 
 def Do(act: Action) -> None:
+    prof = profiler.active
+    if prof is not None:
+        prof.ActionEnter(act.GetClassName())
+
     if act.c_decl:
         global_ctx.graph.AddCDecl(act.c_decl)
     if act.c_headers:
@@ -387,44 +658,180 @@ def Do(act: Action) -> None:
             target_node.c_src = act.c_src
             target_node.sv_src = act.sv_src
             target_node.executor_id = act.executor_id
+            target_node.cost = act.cost
 
     for dep in act.deps:
-        act.scope.init_node.AddPredecessor(dep.scope.final_node)
+        if global_ctx.incremental:
+            _Link(act.scope, dep.scope.tails, act.scope.heads)
+            global_ctx.scope_index.AddDependency(
+                dep.scope, act.scope, dep.scope.tails[0], act.scope.heads[0])
+        else:
+            act.scope.init_node.AddPredecessor(dep.scope.final_node)
+            global_ctx.scope_index.AddDependency(
+                dep.scope, act.scope, dep.scope.final_node, act.scope.init_node)
+
+    if prof is not None:
+        prof.ActionExit()
 
 
 def Run(act, args: argparse.Namespace) -> None:
     global_ctx.num_executors = args.num_executors
-
+    global_ctx.incremental = args.incremental_graph
+
+    gen_cache, key = _OpenCache(args)
+    if key is not None:
+        outputs = gen_cache.Restore(key)
+        if outputs is not None:
+            # 命中时不运行场景，global_ctx.graph 为空
+            logger.info(f'generation cache hit {key}, restored {" ".join(outputs)}')
+            return
+        logger.info(f'generation cache miss {key}')
+
+    if args.profile or args.profile_memory:
+        profiler.active = profiler.Profiler(trace_memory=args.profile_memory)
+        # 最外层 action 在 Run 之前构造，此时补记
+        profiler.active.ActionConstructed(act.GetClassName())
+    try:
+        _Run(act, args)
+    finally:
+        if profiler.active is not None:
+            stem = os.path.splitext(args.graph_output)[0]
+            logger.info(f'profile report {stem}_profile.json')
+            profiler.active.Dump(f'{stem}_profile.json', f'{stem}_profile.folded')
+            profiler.active = None
+
+    if key is not None:
+        for f in output_files.values():
+            f.flush()
+        gen_cache.Store(key, _OutputFileNames(global_ctx.graph, args))
+
+
+# 不影响生成结果的参数
+_CACHE_IGNORED_ARGS = {'cache_dir', 'cache_max_size'}
+# 输出文件名参数，key 中使用绝对路径，输出到不同位置时不会命中其他位置的条目
+_CACHE_OUTPUT_ARGS = ['graph_output', 'graph_npz_output', 'uvm_output', 'soc_output']
+
+
+def _OpenCache(args: argparse.Namespace) -> typing.Tuple[typing.Optional[cache.GenerationCache], typing.Optional[str]]:
+    if args.cache_dir is None:
+        return None, None
+    if args.seed is None:
+        logger.info('no seed given, generation cache disabled')
+        return None, None
+    if args.profile or args.profile_memory:
+        logger.info('profiling, generation cache disabled')
+        return None, None
+    params = {k: v for k, v in vars(args).items() if k not in _CACHE_IGNORED_ARGS}
+    for k in _CACHE_OUTPUT_ARGS:
+        if params.get(k) is not None:
+            params[k] = os.path.abspath(params[k])
+    # 场景中 OpenOutput 的文件在运行场景时才知道，相对路径以当前目录为准
+    params['cwd'] = os.getcwd()
+    key = cache.Key(params, cache.SourceFiles())
+    return cache.GenerationCache(args.cache_dir, args.cache_max_size << 20), key
+
+
+def _OutputFileNames(graph: dag.Graph, args: argparse.Namespace) -> typing.List[str]:
+    fnames = [args.graph_output, args.graph_npz_output, args.uvm_output, args.soc_output]
+    if args.uvm_output is not None and args.uvm_compact:
+        fnames.extend(dag.UvmDataFileNames(args.uvm_output))
+    if args.soc_output is not None and args.soc_cooperative and args.soc_split:
+        header_fname, core_fname_tmpl = dag._SplitUnitNames(args.soc_output)
+        fnames.append(header_fname)
+        fnames.extend(core_fname_tmpl.format(i) for i in range(graph.num_executors))
+    if args.soc_output is not None and args.soc_cooperative and args.soc_trace:
+        fnames.append(f'{args.soc_output}.trace.json')
+    fnames.extend(output_files)
+    return [f for f in fnames if f is not None and os.path.isfile(f)]
+
+
+def _Run(act, args: argparse.Namespace) -> None:
     logger.info(f'Do {act.name}')
-    Do(act)
+    with profiler.Phase('do'):
+        Do(act)
 
     global_ctx.graph.num_executors = args.num_executors
 
     logger.info(f'removing non-target nodes')
-    global_ctx.graph.RemoveNonTargetNodes()
+    with profiler.Phase('remove non-target nodes'):
+        global_ctx.graph.RemoveNonTargetNodes(keep_junctions=True)
     logger.info(f'assigning sn')
-    global_ctx.graph.AssignSN()
+    with profiler.Phase('assign sn'):
+        global_ctx.graph.AssignSN()
     logger.info('transtive reducing')
-    global_ctx.graph.TransitiveReduction()
+    with profiler.Phase('transitive reduction'):
+        global_ctx.graph.TransitiveReduction(expand_junctions=True)
     # global_ctx.graph.AssignExecutorRandom()
     logger.info(f'assigning executor')
-    global_ctx.graph.AssignExecutorSpread()
+    with profiler.Phase('assign executor'):
+        global_ctx.graph.AssignExecutor(
+            args.num_executors, dag.ExecutorAssignPolicy[args.executor_policy.upper()],
+            args.cross_core_fraction)
+
+    RunBackends(global_ctx.graph, args)
+
+    # 在后端之后保存，soc 后端的线程划分一起保存，见 purslane.makespan
     logger.info(f'dump json')
-    global_ctx.graph.DumpJson(args.graph_output)
+    with profiler.Phase('dump json'):
+        global_ctx.graph.DumpJson(args.graph_output)
+    if args.graph_npz_output is not None:
+        logger.info(f'dump npz')
+        with profiler.Phase('dump npz'):
+            global_ctx.graph.DumpNpz(args.graph_npz_output)
 
+
+def RunBackends(graph: dag.Graph, args: argparse.Namespace) -> None:
+    # 根据 PrepareBackendArgParser 的选项生成 uvm/soc 输出
     if args.uvm_output is not None:
-        dag.UvmBackendGenF(global_ctx.graph, args.uvm_executor_name,
-                           f'{args.uvm_output}', args.uvm_pkg_name)
+        with profiler.Phase('uvm backend'):
+            dag.UvmBackendGenF(graph, args.uvm_executor_name,
+                               f'{args.uvm_output}', args.uvm_pkg_name, args.uvm_compact,
+                               dag.UvmScheduler[args.uvm_scheduler.upper()],
+                               args.uvm_max_outstanding, args.uvm_progress_flush)
 
     if args.soc_output is not None:
-        if args.soc_cooperative:
-            logger.debug(
-                f'soc cooperative hosted: {args.soc_cooperative_hosted}')
-            dag.CooperativeCBackendGenF(
-                global_ctx.graph, args.soc_cooperative_hosted, False, f'{args.soc_output}', args.debug)
+        with profiler.Phase('soc backend'):
+            _SocBackend(graph, args)
+
+
+def _SocBackend(graph: dag.Graph, args: argparse.Namespace) -> None:
+    if args.soc_cooperative:
+        logger.debug(
+            f'soc cooperative hosted: {args.soc_cooperative_hosted}')
+        interning = dag.BodyInterning[args.soc_body_interning.upper()]
+        scheduler = dag.CooperativeScheduler[args.soc_scheduler.upper()]
+        thread_assign = dag.ThreadAssignMode[args.soc_thread_assign.upper()]
+        wait = dag.CooperativeWait[args.soc_wait.upper()]
+        soc_trace = None
+        if args.soc_trace:
+            if args.soc_cooperative_hosted and args.soc_trace_addr is not None:
+                logger.warning('--soc_trace_addr is ignored when hosted')
+            soc_trace = dag.SocTrace(args.soc_trace_entries, args.soc_trace_addr)
+        if args.soc_split:
+            units = dag.CooperativeCBackendGenSplitF(
+                graph, args.soc_cooperative_hosted, False, f'{args.soc_output}', args.debug,
+                interning, scheduler, thread_assign, wait, args.soc_poll_count, soc_trace)
+            logger.info(f'soc units: {" ".join(units)}')
         else:
-            dag.PreemptiveCBackendGenF(
-                global_ctx.graph, True, f'{args.soc_output}')
+            dag.CooperativeCBackendGenF(
+                graph, args.soc_cooperative_hosted, False, f'{args.soc_output}', args.debug,
+                interning, scheduler, thread_assign, wait, args.soc_poll_count, soc_trace)
+        if soc_trace is not None:
+            trace.DumpMeta(graph, soc_trace, args.soc_cooperative_hosted, f'{args.soc_output}.trace.json')
+    else:
+        if args.soc_split:
+            logger.warning('--soc_split only applies to the cooperative backend')
+        thread_assign = dag.ThreadAssignMode.GREEDY
+        if args.soc_thread_assign == 'saved':
+            thread_assign = dag.ThreadAssignMode.SAVED
+        elif args.soc_thread_assign != 'greedy':
+            logger.warning('--soc_thread_assign only applies to the cooperative backend')
+        if args.soc_trace:
+            logger.warning('--soc_trace only applies to the cooperative backend')
+        dag.PreemptiveCBackendGenF(
+            graph, True, f'{args.soc_output}', dag.PreemptiveSync[args.soc_preemptive_sync.upper()],
+            thread_assign)
+
 
 def num_executors() -> int:
     return global_ctx.num_executors
@@ -0,0 +1,278 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 静态估计生成结果的执行时间和并行度，在仿真之前筛掉并行度过低的种子
+# 代价模型：
+# 1. 每个 action 耗时为 Action.cost，没有标注的使用 default_cost
+# 2. 前序在其他处理核上时，需要额外等待 sync_cost（缓存行在处理核之间传递、smp_rmb 等）
+# 3. 每个处理核按 CBackendThreadAssign 的线程划分执行，同一时刻只执行一个 action，
+#    总是执行最早可以开始的线程头部 action，近似 cooperative 调度
+#    生成时运行了 soc 后端时，图中保存了其线程划分，直接使用；否则重新划分，与 soc 输出一般不同
+#
+# python -m purslane.makespan graph.npz --gantt_text --min_parallelism 2
+
+import argparse
+import dataclasses
+import heapq
+import html
+import json
+import logging
+import random
+import sys
+import typing
+from purslane import backend
+from purslane import dag
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class CoreStats:
+    id: int
+    num_threads: int
+    num_actions: int
+    busy: int
+    idle: int
+
+
+@dataclasses.dataclass
+class Interval:
+    start: int
+    finish: int
+    name: str
+    thread_id: int
+
+
+@dataclasses.dataclass
+class MakespanEstimate:
+    makespan: int
+    # 考虑跨核等待的最长依赖路径，与处理核数量无关的下界
+    critical_path: int
+    total_work: int
+    cross_thread_waits: int
+    cross_core_waits: int
+    cores: typing.List[CoreStats]
+    # 每个处理核上 action 的执行区间，按开始时间排序
+    intervals: typing.List[typing.List[Interval]]
+
+    @property
+    def parallelism(self) -> float:
+        return self.total_work / self.makespan if self.makespan else 0.0
+
+    def Summary(self) -> dict:
+        return {
+            'num_actions': sum(c.num_actions for c in self.cores),
+            'num_cores': len(self.cores),
+            'num_threads': sum(c.num_threads for c in self.cores),
+            'total_work': self.total_work,
+            'critical_path': self.critical_path,
+            'makespan': self.makespan,
+            'parallelism': self.parallelism,
+            'max_parallelism': self.total_work / self.critical_path if self.critical_path else 0.0,
+            'cross_thread_waits': self.cross_thread_waits,
+            'cross_core_waits': self.cross_core_waits,
+            'cores': [dataclasses.asdict(c) for c in self.cores],
+        }
+
+    def GanttText(self, width: int = 80) -> str:
+        # 每列代表 makespan/width 的时间，# 表示该时间段大部分忙，+ 表示部分忙
+        lines = []
+        scale = max(self.makespan, 1) / width
+        for stats, intervals in zip(self.cores, self.intervals):
+            busy = [0.0] * width
+            for iv in intervals:
+                col = int(iv.start / scale)
+                t = iv.start
+                while t < iv.finish and col < width:
+                    end = min(iv.finish, (col + 1) * scale)
+                    busy[col] += end - t
+                    t = end
+                    col += 1
+            row = ''.join('#' if b >= scale / 2 else ('+' if b > 0 else '.') for b in busy)
+            lines.append(f'core {stats.id:>3} |{row}| busy {stats.busy} idle {stats.idle}')
+        return '\n'.join(lines) + '\n'
+
+    def GanttHtml(self) -> str:
+        span = max(self.makespan, 1)
+        rows = []
+        for stats, intervals in zip(self.cores, self.intervals):
+            bars = []
+            for iv in intervals:
+                title = html.escape(f'{iv.name} thread {iv.thread_id} [{iv.start}, {iv.finish})')
+                bars.append(
+                    f'<div class="a" title="{title}" style="left:{100 * iv.start / span:.4f}%;'
+                    f'width:{100 * (iv.finish - iv.start) / span:.4f}%;'
+                    f'background:hsl({iv.thread_id * 67 % 360},60%,60%)"></div>')
+            rows.append(f'<div class="l">core {stats.id}</div><div class="r">{"".join(bars)}</div>\n')
+        summary = html.escape(json.dumps({k: v for k, v in self.Summary().items() if k != 'cores'}))
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>makespan</title><style>\n'
+                'body{font-family:monospace}\n'
+                '.g{display:grid;grid-template-columns:6em 1fr;row-gap:4px}\n'
+                '.r{position:relative;height:20px;background:#eee}\n'
+                '.a{position:absolute;top:0;height:100%;box-sizing:border-box;border-right:1px solid #fff}\n'
+                f'</style></head><body><p>{summary}</p><div class="g">\n{"".join(rows)}</div></body></html>\n')
+
+
+def _Cost(node: dag.Node, default_cost: int) -> int:
+    return default_cost if node.cost is None else node.cost
+
+
+def CriticalPath(graph: dag.Graph, default_cost: int = 1, sync_cost: int = 1) -> int:
+    finish = {}
+    for node in graph.NodesInTopoOrder():
+        start = 0
+        for p in node.predecessors:
+            f = finish[p] + (sync_cost if p.executor_id != node.executor_id else 0)
+            if f > start:
+                start = f
+        finish[node] = start + _Cost(node, default_cost)
+    return max(finish.values(), default=0)
+
+
+def Estimate(graph: dag.Graph, cores: typing.List[dag.Core],
+             default_cost: int = 1, sync_cost: int = 1) -> MakespanEstimate:
+    # cores 为 dag.CBackendThreadAssign 的结果
+    finish: typing.Dict[dag.Node, int] = {}
+    core_time = [0] * len(cores)
+    pos = [[0] * len(core.threads) for core in cores]
+    intervals: typing.List[typing.List[Interval]] = [[] for _ in cores]
+    # 等待某个节点完成的处理核
+    waiting: typing.Dict[dag.Node, typing.List[int]] = {}
+
+    def Candidate(cid: int) -> typing.Optional[typing.Tuple[int, int]]:
+        # 处理核上最早可以开始的线程头部 action，(开始时间, 线程下标)
+        best = None
+        for t, thd in enumerate(cores[cid].threads):
+            if pos[cid][t] >= len(thd.nodes):
+                continue
+            node = thd.nodes[pos[cid][t]]
+            ready = core_time[cid]
+            for p in node.predecessors:
+                f = finish.get(p)
+                if f is None:
+                    waiting.setdefault(p, []).append(cid)
+                    break
+                if p.executor_id != cid:
+                    f += sync_cost
+                if f > ready:
+                    ready = f
+            else:
+                if best is None or ready < best[0]:
+                    best = (ready, t)
+        return best
+
+    # 堆中的候选可能已经过期，以版本号区分
+    version = [0] * len(cores)
+    candidates = [Candidate(cid) for cid in range(len(cores))]
+    heap = [(c[0], cid, 0) for cid, c in enumerate(candidates) if c is not None]
+    heapq.heapify(heap)
+    while heap:
+        _, cid, ver = heapq.heappop(heap)
+        if ver != version[cid]:
+            continue
+        start, t = candidates[cid]
+        thd = cores[cid].threads[t]
+        node = thd.nodes[pos[cid][t]]
+        pos[cid][t] += 1
+        finish[node] = core_time[cid] = start + _Cost(node, default_cost)
+        intervals[cid].append(Interval(start, finish[node], node.name, t))
+
+        for d in {cid, *waiting.pop(node, ())}:
+            version[d] += 1
+            candidates[d] = Candidate(d)
+            if candidates[d] is not None:
+                heapq.heappush(heap, (candidates[d][0], d, version[d]))
+
+    num_nodes = sum(len(thd.nodes) for core in cores for thd in core.threads)
+    if len(finish) != num_nodes:
+        raise RuntimeError(f'only {len(finish)} of {num_nodes} actions can run, threads deadlock')
+
+    makespan = max(core_time, default=0)
+    stats = []
+    for core, ivs in zip(cores, intervals):
+        busy = sum(iv.finish - iv.start for iv in ivs)
+        stats.append(CoreStats(core.id, len(core.threads), len(ivs), busy, makespan - busy))
+
+    cross_thread = cross_core = 0
+    for node in graph.nodes:
+        for p in node.predecessors:
+            if p.executor_id != node.executor_id:
+                cross_core += 1
+                cross_thread += 1
+            elif p.thread_id != node.thread_id:
+                cross_thread += 1
+
+    return MakespanEstimate(makespan, CriticalPath(graph, default_cost, sync_cost),
+                            sum(c.busy for c in stats), cross_thread, cross_core, stats, intervals)
+
+
+def Main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='estimate makespan and parallelism of a saved graph')
+    parser.add_argument('graph', help='saved graph, .npz or json')
+    parser.add_argument('-S', '--seed', type=int, default=0,
+                        help='random seed of thread assignment when the graph has no saved threads')
+    parser.add_argument('--thread_assign', default='greedy',
+                        choices=[m.name.lower() for m in dag.ThreadAssignMode],
+                        help='thread assignment when the graph has no saved threads')
+    parser.add_argument('--reassign_threads', action='store_true',
+                        help='assign threads again even if the graph has saved threads')
+    parser.add_argument('--default_cost', type=int, default=1,
+                        help='cost of actions without a cost annotation')
+    parser.add_argument('--sync_cost', type=int, default=1,
+                        help='extra wait of a dependency on another core')
+    parser.add_argument('--json_output', default=None,
+                        help='summary json file name, default is stdout')
+    parser.add_argument('--gantt_text', action='store_true',
+                        help='print a text gantt chart')
+    parser.add_argument('--gantt_width', type=int, default=80)
+    parser.add_argument('--gantt_html', default=None,
+                        help='html gantt chart file name')
+    parser.add_argument('--min_parallelism', type=float, default=None,
+                        help='exit with 1 if the estimated parallelism is lower')
+    args = parser.parse_args()
+
+    graph = backend.LoadGraph(args.graph)
+    if graph.threads_assigned and not args.reassign_threads:
+        # 生成时运行了 soc 后端，与 soc 输出的线程划分相同
+        logger.info('using saved threads of the soc backend')
+        cores = dag.SavedThreadAssign(graph)
+    else:
+        # 线程划分与 soc 输出一般不同，只作参考
+        logger.info(f'assigning threads, seed {args.seed}')
+        random.seed(args.seed)
+        cores = dag.CBackendThreadAssign(graph, dag.ThreadAssignMode[args.thread_assign.upper()])
+    est = Estimate(graph, cores, args.default_cost, args.sync_cost)
+
+    summary = json.dumps(est.Summary(), indent=2)
+    if args.json_output is None:
+        print(summary)
+    else:
+        with open(args.json_output, 'w') as f:
+            f.write(summary)
+    if args.gantt_text:
+        print(est.GanttText(args.gantt_width), end='')
+    if args.gantt_html is not None:
+        with open(args.gantt_html, 'w') as f:
+            f.write(est.GanttHtml())
+
+    logger.info(f'makespan {est.makespan}, critical path {est.critical_path}, parallelism {est.parallelism:.2f}')
+    if args.min_parallelism is not None and est.parallelism < args.min_parallelism:
+        logger.error(f'parallelism {est.parallelism:.2f} is lower than {args.min_parallelism}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    Main()
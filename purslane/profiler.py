@@ -0,0 +1,185 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 生成过程的 profiler
+# 记录各个阶段的耗时和内存，以及每个 Action 类的构造次数、Do 次数和耗时
+# 没有启用时 Phase 返回空的 context manager，dsl.Do 中只有一次判断
+
+import contextlib
+import dataclasses
+import json
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+import typing
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class PhaseRecord:
+    # 以 ; 连接的阶段路径，嵌套阶段包含外层阶段名
+    path: str
+    start: float
+    duration: float = 0.0
+    # 阶段结束时进程的最大 rss，单位 KiB
+    max_rss_kib: int = 0
+    # 阶段内 python 分配内存的峰值，只有启用 tracemalloc 时记录
+    peak_bytes: typing.Optional[int] = None
+
+
+@dataclasses.dataclass
+class ActionRecord:
+    num_constructed: int = 0
+    num_done: int = 0
+    # 包含子 action 的时间
+    total_time: float = 0.0
+    # 不包含子 action 的时间
+    self_time: float = 0.0
+
+
+def _MaxRssKib() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class Profiler:
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.phases: typing.List[PhaseRecord] = []
+        self.actions: typing.Dict[str, ActionRecord] = {}
+        # 折叠调用栈 -> 自身时间，可以直接交给 flamegraph.pl
+        self.folded: typing.Dict[str, float] = {}
+
+        self._phase_stack: typing.List[str] = []
+        self._open_phases: typing.List[PhaseRecord] = []
+        # 每个阶段中最外层 action 的时间，用于计算阶段自身时间
+        self._phase_action_time: typing.Dict[str, float] = {}
+        # [类名, 开始时间, 子 action 时间]
+        self._action_stack: typing.List[typing.List] = []
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def _Phase(self, name: str):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._FoldPeak()
+
+        self._phase_stack.append(name)
+        record = PhaseRecord(';'.join(self._phase_stack),
+                             time.perf_counter() - self._start)
+        if self.trace_memory:
+            record.peak_bytes = 0
+        self.phases.append(record)
+        self._open_phases.append(record)
+        try:
+            yield record
+        finally:
+            record.duration = time.perf_counter() - self._start - record.start
+            record.max_rss_kib = _MaxRssKib()
+            if self.trace_memory:
+                self._FoldPeak()
+            self._open_phases.pop()
+            self._phase_stack.pop()
+            # 内层阶段的峰值也是外层阶段的峰值
+            if self.trace_memory and self._open_phases:
+                outer = self._open_phases[-1]
+                outer.peak_bytes = max(outer.peak_bytes, record.peak_bytes)
+            logger.info(f'{record.path}: {record.duration:.3f}s')
+
+    def _FoldPeak(self) -> None:
+        # 把目前为止的峰值计入当前阶段，然后重新开始统计
+        if self._open_phases:
+            current = self._open_phases[-1]
+            current.peak_bytes = max(current.peak_bytes, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    def ActionConstructed(self, cls_name: str) -> None:
+        record = self.actions.get(cls_name)
+        if record is None:
+            record = self.actions[cls_name] = ActionRecord()
+        record.num_constructed += 1
+
+    def ActionEnter(self, cls_name: str) -> None:
+        self._action_stack.append([cls_name, time.perf_counter(), 0.0])
+
+    def ActionExit(self) -> None:
+        cls_name, start, children = self._action_stack.pop()
+        elapsed = time.perf_counter() - start
+        record = self.actions.get(cls_name)
+        if record is None:
+            record = self.actions[cls_name] = ActionRecord()
+        record.num_done += 1
+        record.self_time += elapsed - children
+
+        # 递归的 action 只在最外层计入 total_time，避免重复计算
+        if all(frame[0] != cls_name for frame in self._action_stack):
+            record.total_time += elapsed
+
+        stack = ';'.join(self._phase_stack + [frame[0] for frame in self._action_stack] + [cls_name])
+        self.folded[stack] = self.folded.get(stack, 0.0) + elapsed - children
+
+        if self._action_stack:
+            self._action_stack[-1][2] += elapsed
+        else:
+            path = ';'.join(self._phase_stack)
+            self._phase_action_time[path] = self._phase_action_time.get(path, 0.0) + elapsed
+
+    def Report(self) -> dict:
+        return {
+            'total_time': time.perf_counter() - self._start,
+            'max_rss_kib': _MaxRssKib(),
+            'phases': [dataclasses.asdict(p) for p in self.phases],
+            'actions': {name: dataclasses.asdict(r) for name, r in
+                        sorted(self.actions.items(), key=lambda kv: kv[1].self_time, reverse=True)},
+        }
+
+    def Dump(self, fname: str, folded_fname: str = None) -> None:
+        with open(fname, 'w') as f:
+            json.dump(self.Report(), f, indent=2)
+
+        if folded_fname is not None:
+            with open(folded_fname, 'w') as f:
+                for stack, t in self.Folded().items():
+                    # flamegraph 使用整数样本数，以微秒为单位
+                    us = round(t * 1e6)
+                    if us > 0:
+                        f.write(f'{stack} {us}\n')
+
+    def Folded(self) -> typing.Dict[str, float]:
+        # 阶段的自身时间为总时间减去内层阶段和最外层 action 的时间
+        folded = {path: -t for path, t in self._phase_action_time.items()}
+        for p in self.phases:
+            folded[p.path] = folded.get(p.path, 0.0) + p.duration
+            parent = p.path.rpartition(';')[0]
+            if parent:
+                folded[parent] = folded.get(parent, 0.0) - p.duration
+        for stack, t in self.folded.items():
+            folded[stack] = folded.get(stack, 0.0) + t
+        return folded
+
+
+# 当前生效的 profiler，None 表示没有启用
+active: typing.Optional[Profiler] = None
+
+_NULL_PHASE = contextlib.nullcontext()
+
+
+def Phase(name: str):
+    if active is None:
+        return _NULL_PHASE
+    return active._Phase(name)
@@ -0,0 +1,74 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 一次生成所需的全部状态
+# dsl 上下文（依赖图）、状态迁移、影子内存、v8 寄存器分配以及 OpenOutput 打开的输出文件
+# 各模块仍然通过模块级变量访问当前状态，GenerationSession 进入时替换这些变量，退出时关闭输出文件并恢复之前的状态，
+# 退出后 session 不再被引用时，依赖图和影子内存随之释放
+# 长期运行的进程可以连续生成，不需要重新导入场景模块：
+#
+# for seed in seeds:
+#     with GenerationSession():
+#         random.seed(seed)
+#         dsl.Run(Entry(), args)
+
+import typing
+from purslane import addr_space
+from purslane import dsl
+from purslane import state
+from purslane.aarch64 import v8
+
+
+def _Installed() -> tuple:
+    return (dsl.global_ctx, dsl.output_files, state.global_ctx,
+            addr_space.global_shadow_memory, v8.global_context)
+
+
+def _Install(installed: tuple) -> None:
+    (dsl.global_ctx, dsl.output_files, state.global_ctx,
+     addr_space.global_shadow_memory, v8.global_context) = installed
+
+
+class GenerationSession:
+    def __init__(self):
+        self.dsl_ctx = dsl.Context()
+        self.output_files: typing.Dict[str, typing.TextIO] = {}
+        self.state_ctx = state.Context()
+        self.shadow_memory = addr_space.ShadowMemory()
+        self.v8_ctx = v8.Context()
+        self._saved: typing.List[tuple] = []
+
+    def __enter__(self) -> 'GenerationSession':
+        # 状态迁移在类定义时注册，已经导入的场景模块注册的迁移在新 session 中继续可用，
+        # session 中新导入的模块注册的迁移不会带出 session
+        for cls, ctrl in state.global_ctx.transition_ctrl_dict.items():
+            if cls not in self.state_ctx.transition_ctrl_dict:
+                self.state_ctx.transition_ctrl_dict[cls] = ctrl.Copy()
+        self._saved.append(_Installed())
+        _Install((self.dsl_ctx, self.output_files, self.state_ctx,
+                  self.shadow_memory, self.v8_ctx))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+        _Install(self._saved.pop())
+
+    @property
+    def graph(self):
+        return self.dsl_ctx.graph
+
+    def Close(self) -> None:
+        # 场景写出的文件在 session 结束时关闭，保证内容完整
+        for f in self.output_files.values():
+            f.close()
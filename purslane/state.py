@@ -28,6 +28,12 @@ class TransitionCtrl:
             self.trns_table[dst] = []
         self.trns_table[dst].append(trns_act)
 
+    def Copy(self) -> 'TransitionCtrl':
+        ctrl = TransitionCtrl()
+        ctrl.trns_acts = list(self.trns_acts)
+        ctrl.trns_table = {dst: list(acts) for dst, acts in self.trns_table.items()}
+        return ctrl
+
     def ToInitiative(self, cs, init_state) -> list[any]:
         # find a path to a initiative action from current state(cs)
         visited = set()
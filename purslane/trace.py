@@ -0,0 +1,240 @@
+#  Copyright 2024 zuoqian, zuoqian@qq.com
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#  https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# 解析 --soc_trace 输出的环形缓冲区
+# 生成时在 <soc_output>.trace.json 记录缓冲区布局和每个 action 所在的处理核、线程，
+# 运行以后 dump 出所有处理核的缓冲区（hosted 时 mango_main 写出 mango_trace.bin，
+# 裸机时从 --soc_trace_addr 或符号 mango_trace_rings 开始，num_cores x ring_size 字节），
+# 输出每个 action 的等待时间和执行时间，以及可以在 chrome://tracing 或 perfetto 打开的 json
+# 卡住时没有 end 的 action 和每个处理核最后的记录指出停在哪里
+#
+# python -m purslane.trace mango_trace.bin soc.c.trace.json --chrome_output trace.json --top 20
+
+import argparse
+import dataclasses
+import json
+import logging
+import struct
+import typing
+from purslane import dag
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<IIQ')
+_ENTRY = struct.Struct('<QII')
+
+
+@dataclasses.dataclass
+class TraceRecord:
+    ts: int
+    sn: int
+    event: dag.TraceEvent
+
+
+@dataclasses.dataclass
+class CoreTrace:
+    id: int
+    # 按写入顺序，缓冲区写满以后只有最后 num_entries 条
+    records: typing.List[TraceRecord]
+    # 被覆盖的记录数
+    dropped: int = 0
+
+
+@dataclasses.dataclass
+class ActionLatency:
+    sn: int
+    name: str
+    core: int
+    thread: int
+    wait_exit: typing.Optional[int] = None
+    start: typing.Optional[int] = None
+    end: typing.Optional[int] = None
+    # 同一线程上一个 action 结束（第一个 action 为处理核第一条记录）到等待结束
+    wait: typing.Optional[int] = None
+
+    @property
+    def run(self) -> typing.Optional[int]:
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+
+def DumpMeta(graph: dag.Graph, trace: dag.SocTrace, hosted: bool, fname: str) -> None:
+    # 在 cooperative 后端生成以后调用，此时线程划分已经完成
+    actions = [{'sn': node.sn, 'name': node.name, 'core': node.executor_id, 'thread': node.thread_id}
+               for node in graph.nodes]
+    with open(fname, 'w') as f:
+        json.dump({'hosted': hosted, 'entries': trace.entries, 'addr': trace.addr,
+                   'ring_size': trace.ring_size, 'num_cores': graph.num_executors,
+                   # hosted 时间戳为纳秒，裸机为 cntvct_el0 计数，频率见 cntfrq_el0
+                   'timer_hz': 1000000000 if hosted else None,
+                   'actions': actions}, f, indent=1)
+
+
+def ParseRings(data: bytes, num_cores: typing.Optional[int] = None) -> typing.List[CoreTrace]:
+    # 缓冲区依次排列，每个缓冲区的大小由头部的 num_entries 决定
+    cores = []
+    offset = 0
+    while offset + _HEADER.size <= len(data) and (num_cores is None or len(cores) < num_cores):
+        magic, num_entries, head = _HEADER.unpack_from(data, offset)
+        if magic != dag.TRACE_MAGIC:
+            # 处理核没有运行到 mango_trace_init，之后的布局无法确定
+            logger.warning(f'core {len(cores)} trace ring is not initialized, stop parsing')
+            break
+        size = _HEADER.size + _ENTRY.size * num_entries
+        if offset + size > len(data):
+            raise ValueError(f'core {len(cores)} trace ring is truncated, {len(data) - offset} of {size} bytes')
+
+        first = max(0, head - num_entries)
+        records = []
+        for i in range(first, head):
+            ts, sn, event = _ENTRY.unpack_from(data, offset + _HEADER.size + _ENTRY.size * (i % num_entries))
+            records.append(TraceRecord(ts, sn, dag.TraceEvent(event)))
+        if first > 0:
+            logger.warning(f'core {len(cores)}: {first} oldest trace records are overwritten')
+        cores.append(CoreTrace(len(cores), records, first))
+        offset += size
+    return cores
+
+
+def ActionLatencies(cores: typing.List[CoreTrace], meta: dict) -> typing.List[ActionLatency]:
+    # 只包含有记录的 action，按 sn 排序
+    info = {a['sn']: a for a in meta['actions']}
+    latencies: typing.Dict[int, ActionLatency] = {}
+    for core in cores:
+        if not core.records:
+            continue
+        # 每个线程上一个 action 的结束时间
+        last_end: typing.Dict[int, int] = {}
+        origin = core.records[0].ts
+        for r in core.records:
+            lat = latencies.get(r.sn)
+            if lat is None:
+                a = info.get(r.sn)
+                if a is None:
+                    logger.warning(f'core {core.id}: unknown action sn {r.sn}')
+                    continue
+                lat = latencies[r.sn] = ActionLatency(r.sn, a['name'], a['core'], a['thread'])
+            if r.event == dag.TraceEvent.WAIT_EXIT:
+                lat.wait_exit = r.ts
+                lat.wait = r.ts - last_end.get(lat.thread, origin)
+            elif r.event == dag.TraceEvent.START:
+                lat.start = r.ts
+            else:
+                lat.end = r.ts
+                last_end[lat.thread] = r.ts
+    return sorted(latencies.values(), key=lambda lat: lat.sn)
+
+
+def Unfinished(cores: typing.List[CoreTrace], meta: dict) -> typing.List[str]:
+    # 卡住时的诊断：开始以后没有结束的 action，以及每个处理核最后一条记录
+    info = {a['sn']: a['name'] for a in meta['actions']}
+    lines = []
+    for core in cores:
+        started = {}
+        for r in core.records:
+            if r.event == dag.TraceEvent.START:
+                started[r.sn] = r.ts
+            elif r.event == dag.TraceEvent.END:
+                started.pop(r.sn, None)
+        for sn, ts in started.items():
+            lines.append(f'core {core.id}: {info.get(sn, sn)} started at {ts} without end')
+        if core.records:
+            r = core.records[-1]
+            lines.append(f'core {core.id}: last record {r.event.name.lower()} of {info.get(r.sn, r.sn)} at {r.ts}')
+        else:
+            lines.append(f'core {core.id}: no records')
+    return lines
+
+
+def LatencyTable(latencies: typing.List[ActionLatency], top: typing.Optional[int] = None) -> str:
+    # 按执行时间从长到短，没有结束的 action 排在最前
+    rows = sorted(latencies, key=lambda lat: (lat.run is not None, -(lat.run or 0)))
+    if top is not None:
+        rows = rows[:top]
+
+    def Fmt(v: typing.Optional[int]) -> str:
+        return '-' if v is None else str(v)
+    lines = [f'{"sn":>8} {"core":>4} {"thread":>6} {"wait":>12} {"run":>12}  name']
+    for lat in rows:
+        lines.append(f'{lat.sn:>8} {lat.core:>4} {lat.thread:>6} {Fmt(lat.wait):>12} {Fmt(lat.run):>12}  {lat.name}')
+    return '\n'.join(lines) + '\n'
+
+
+def ChromeTrace(cores: typing.List[CoreTrace], meta: dict,
+                timer_hz: typing.Optional[float] = None) -> dict:
+    # 处理核为 pid，线程为 tid，时间单位为微秒；没有频率时直接使用计数
+    scale = 1e6 / timer_hz if timer_hz else 1.0
+    origin = min((c.records[0].ts for c in cores if c.records), default=0)
+
+    def Us(ts: int) -> float:
+        return (ts - origin) * scale
+
+    events = []
+    for core in cores:
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': core.id, 'args': {'name': f'core {core.id}'}})
+    threads = sorted({(a['core'], a['thread']) for a in meta['actions'] if a['thread'] is not None})
+    for core_id, thread_id in threads:
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': core_id, 'tid': thread_id,
+                       'args': {'name': f'thread {thread_id}'}})
+
+    for lat in ActionLatencies(cores, meta):
+        args = {'sn': lat.sn}
+        if lat.wait is not None:
+            events.append({'name': f'wait {lat.name}', 'cat': 'wait', 'ph': 'X', 'pid': lat.core,
+                           'tid': lat.thread, 'ts': Us(lat.wait_exit - lat.wait), 'dur': lat.wait * scale,
+                           'args': args})
+        if lat.run is not None:
+            events.append({'name': lat.name, 'cat': 'action', 'ph': 'X', 'pid': lat.core, 'tid': lat.thread,
+                           'ts': Us(lat.start), 'dur': lat.run * scale, 'args': args})
+        elif lat.start is not None:
+            # 没有结束，可能就是卡住的 action
+            events.append({'name': lat.name, 'cat': 'action', 'ph': 'i', 's': 't', 'pid': lat.core,
+                           'tid': lat.thread, 'ts': Us(lat.start), 'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ns' if timer_hz else 'ms'}
+
+
+def Main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='decode trace ring buffers of the soc cooperative backend')
+    parser.add_argument('dump', help='dumped ring buffers of all cores, mango_trace.bin when hosted')
+    parser.add_argument('meta', help='<soc_output>.trace.json written with --soc_trace')
+    parser.add_argument('--timer_hz', type=float, default=None,
+                        help='timestamp frequency, cntfrq_el0 on bare metal, default is from the meta file')
+    parser.add_argument('--top', type=int, default=None,
+                        help='only print the actions with the longest run time')
+    parser.add_argument('--chrome_output', default=None,
+                        help='chrome trace json file name')
+    args = parser.parse_args()
+
+    with open(args.meta) as f:
+        meta = json.load(f)
+    with open(args.dump, 'rb') as f:
+        cores = ParseRings(f.read(), meta['num_cores'])
+
+    print(LatencyTable(ActionLatencies(cores, meta), args.top), end='')
+    for line in Unfinished(cores, meta):
+        print(line)
+
+    if args.chrome_output is not None:
+        timer_hz = args.timer_hz or meta.get('timer_hz')
+        if timer_hz is None:
+            logger.warning('timer frequency is unknown, timestamps are raw counts')
+        with open(args.chrome_output, 'w') as f:
+            json.dump(ChromeTrace(cores, meta, timer_hz), f)
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,130 @@
+import unittest
+import argparse
+import random
+import tempfile
+import os
+import json
+
+from purslane import backend
+from purslane import dsl
+from purslane.dsl import Do, Action, Parallel, Sequence
+
+
+class Leaf(Action):
+    def Body(self):
+        self.c_src = ''
+
+
+class Bound(Action):
+    # 指定在 executor 1 上执行
+    def Body(self):
+        self.executor_id = 1
+        self.c_src = ''
+
+
+class Top(Action):
+    def Activity(self):
+        for _ in range(8):
+            with Parallel():
+                for _ in range(4):
+                    with Sequence():
+                        Do(Leaf())
+                        Do(Bound())
+
+
+class TestBackend(unittest.TestCase):
+    def test_regenerate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            npz = os.path.join(tmpdir, 'graph.npz')
+            random.seed(0)
+            dsl.global_ctx = dsl.Context()
+            parser = argparse.ArgumentParser()
+            dsl.PrepareArgParser(parser)
+            dsl.Run(Top(), parser.parse_args(
+                ['--graph_output', os.path.join(tmpdir, 'graph.json'),
+                 '--graph_npz_output', npz]))
+            bound = {n.name for n in dsl.global_ctx.graph.nodes
+                     if n.executor_id is not None and not n.executor_assigned}
+            self.assertEqual(len(bound), 32)
+
+            for graph_file in [npz, os.path.join(tmpdir, 'graph.json')]:
+                soc = os.path.join(tmpdir, 'soc.c')
+                parser = argparse.ArgumentParser()
+                backend.PrepareArgParser(parser)
+                graph = backend.Run(parser.parse_args(
+                    [graph_file, '--num_executors', '4', '--executor_policy', 'random',
+                     '--soc_output', soc, '--soc_cooperative']))
+                self.assertEqual(graph.num_executors, 4)
+                for node in graph.nodes:
+                    if node.name in bound:
+                        self.assertEqual(node.executor_id, 1)
+                    else:
+                        self.assertIn(node.executor_id, range(4))
+                with open(soc) as f:
+                    self.assertIn('void core_3_func()', f.read())
+
+            # action 指定的 executor 超出范围
+            parser = argparse.ArgumentParser()
+            backend.PrepareArgParser(parser)
+            with self.assertRaises(RuntimeError):
+                backend.Run(parser.parse_args([npz, '--num_executors', '1']))
+
+    def test_saved_threads(self):
+        # executor 不变时使用保存的线程划分，与生成时的 soc 输出相同
+        with tempfile.TemporaryDirectory() as tmpdir:
+            graph_json = os.path.join(tmpdir, 'graph.json')
+            soc = os.path.join(tmpdir, 'soc.c')
+            random.seed(1)
+            dsl.global_ctx = dsl.Context()
+            parser = argparse.ArgumentParser()
+            dsl.PrepareArgParser(parser)
+            dsl.Run(Top(), parser.parse_args(
+                ['--graph_output', graph_json, '--soc_output', soc, '--soc_cooperative']))
+            with open(soc) as f:
+                expected = f.read()
+
+            regen = os.path.join(tmpdir, 'regen.c')
+            random.seed(2)
+            parser = argparse.ArgumentParser()
+            backend.PrepareArgParser(parser)
+            backend.Run(parser.parse_args([graph_json, '--soc_output', regen, '--soc_cooperative']))
+            with open(regen) as f:
+                self.assertEqual(f.read(), expected)
+
+            # 重新分配 executor 以后重新划分线程
+            backend.Run(parser.parse_args(
+                [graph_json, '--num_executors', '3', '--soc_output', regen, '--soc_cooperative']))
+            with open(regen) as f:
+                self.assertIn('void core_2_func()', f.read())
+
+    def test_old_json(self):
+        # 旧版本的 graph.json 没有 executor_assigned、cost 和线程划分
+        graph_dict = {
+            'sv_headers': [], 'c_headers': [], 'c_decls': [],
+            'executors': [{'id': 0}, {'id': 1}],
+            'actions': [
+                {'sn': 0, 'executor_id': 0, 'c_src': '', 'sv_src': None, 'name': 'a', 'predecessors': []},
+                {'sn': 1, 'executor_id': 1, 'c_src': '', 'sv_src': None, 'name': 'b', 'predecessors': [0]},
+                {'sn': 2, 'executor_id': 0, 'c_src': '', 'sv_src': None, 'name': 'c', 'predecessors': [1]},
+            ],
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            graph_json = os.path.join(tmpdir, 'graph.json')
+            with open(graph_json, 'w') as f:
+                json.dump(graph_dict, f)
+            soc = os.path.join(tmpdir, 'soc.c')
+            parser = argparse.ArgumentParser()
+            backend.PrepareArgParser(parser)
+            graph = backend.Run(parser.parse_args([graph_json, '--soc_output', soc, '--soc_cooperative']))
+            self.assertFalse(graph.executor_assigned_known)
+            self.assertEqual([node.executor_id for node in graph.nodes], [0, 1, 0])
+            with open(soc) as f:
+                self.assertIn('void core_1_func()', f.read())
+
+            # 无法区分 action 指定的 executor，不能重新分配
+            with self.assertRaises(RuntimeError):
+                backend.Run(parser.parse_args([graph_json, '--num_executors', '4']))
+
+
+if __name__ == '__main__':
+    unittest.main()
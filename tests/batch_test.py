@@ -0,0 +1,93 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+
+from purslane import batch
+
+SCENARIO = '''
+import argparse
+import random
+from purslane import dsl
+from purslane.addr_space import SMWriteBytes, SMReadBytes
+from purslane.dsl import Do, Action, Parallel
+
+rf = dsl.OpenOutput('rand_proc.S')
+# 模块级状态，每个种子都应该重新开始
+counter = []
+
+
+class Leaf(Action):
+    def Body(self):
+        counter.append(1)
+        addr = random.randrange(0, 1 << 20)
+        # 影子内存中残留的数据会改变输出
+        old = SMReadBytes(addr, 1)[0]
+        SMWriteBytes(addr, bytes([random.randrange(1, 256)]))
+        self.c_src = f'x = {old};\\n'
+        rf.write(f'// {self.name} {len(counter)}\\n')
+
+
+class Top(Action):
+    def Activity(self):
+        for _ in range(4):
+            with Parallel():
+                for _ in range(random.randrange(1, 4)):
+                    Do(Leaf())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    dsl.PrepareArgParser(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    dsl.Run(Top(), args)
+'''
+
+OUTPUTS = ['graph.json', 'soc.c', 'rand_proc.S']
+
+
+class TestBatch(unittest.TestCase):
+    def read_outputs(self, seed_dir: str) -> list:
+        contents = []
+        for fname in OUTPUTS:
+            with open(os.path.join(seed_dir, fname)) as f:
+                contents.append(f.read())
+        return contents
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            script = os.path.join(tmpdir, 'scenario.py')
+            with open(script, 'w') as f:
+                f.write(SCENARIO)
+            scenario_args = ['--soc_output', 'soc.c', '--soc_cooperative']
+
+            # 单独运行的结果作为参考
+            ref_dir = os.path.join(tmpdir, 'ref')
+            os.makedirs(ref_dir)
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(batch.__file__)))
+            subprocess.run([sys.executable, script, '--seed', '3'] + scenario_args,
+                           cwd=ref_dir, env=env, check=True, capture_output=True)
+            ref = self.read_outputs(ref_dir)
+
+            for jobs in [1, 2]:
+                out_dir = os.path.join(tmpdir, f'jobs{jobs}')
+                results = batch.RunBatch(script, [1, 2, 3, 4], out_dir, scenario_args, jobs)
+                self.assertTrue(all(r.ok for r in results), results)
+                self.assertEqual([r.seed for r in results], [1, 2, 3, 4])
+                self.assertEqual(self.read_outputs(os.path.join(out_dir, 'seed_3')), ref)
+                self.assertTrue(os.path.isfile(os.path.join(out_dir, 'batch.json')))
+
+    def test_failure(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            script = os.path.join(tmpdir, 'scenario.py')
+            with open(script, 'w') as f:
+                f.write('raise RuntimeError("broken scenario")\n')
+            results = batch.RunBatch(script, [0], tmpdir, [], 1)
+            self.assertFalse(results[0].ok)
+            self.assertIn('broken scenario', results[0].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
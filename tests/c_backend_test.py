@@ -0,0 +1,261 @@
+import unittest
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+
+from purslane import dag
+from purslane import trace
+from purslane.bench.graphs import LayeredGraph
+
+
+def CheckedGraph(num_nodes: int, num_executors: int, seed: int = 0) -> dag.Graph:
+    # 每个 action 检查其前序都已经执行过，再标记自己执行完毕
+    # 线程分配使用全局随机数
+    random.seed(seed)
+    graph = LayeredGraph(num_nodes, 16, seed=seed)
+    graph.TransitiveReduction()
+    graph.AssignSN()
+    graph.num_executors = num_executors
+    graph.AssignExecutorSpread()
+    graph.AddCDecl('extern volatile uint32_t done[];\nextern volatile uint32_t failed;')
+    for node in graph.nodes:
+        checks = ''.join(
+            f'if(!done[{pred.sn}]) failed = 1;\n' for pred in node.predecessors)
+        node.c_src = f'{checks}done[{node.sn}] = 1;\n'
+    return graph
+
+
+def CallGraph(num_nodes: int, num_executors: int, seed: int = 0) -> dag.Graph:
+    # 同 CheckedGraph，但检查和标记通过函数调用，body 只有常量不同
+    graph = CheckedGraph(num_nodes, num_executors, seed)
+    graph.c_decls = ['void check(uint32_t sn);\nvoid mark(uint32_t sn);']
+    for node in graph.nodes:
+        checks = ''.join(f'check({pred.sn});\n' for pred in node.predecessors)
+        node.c_src = f'{checks}mark({node.sn}U);\n'
+    return graph
+
+
+MAIN_C = '''
+#include <stdint.h>
+#include <stdio.h>
+volatile uint32_t done[%d];
+volatile uint32_t failed = 0;
+void check(uint32_t sn){
+if(!done[sn]) failed = 1;
+}
+void mark(uint32_t sn){
+done[sn] = 1;
+}
+void mango_main();
+int main(){
+mango_main();
+for(int i = 0; i < %d; i++){
+if(!done[i]) failed = 1;
+}
+printf("failed %%d\\n", failed);
+return failed;
+}
+'''
+
+
+@unittest.skipIf(shutil.which('gcc') is None, 'gcc not found')
+class TestHostedBackends(unittest.TestCase):
+    def build_and_run(self, tmpdir: str, num_nodes: int, srcs: list, cflags: list = ()):
+        with open(os.path.join(tmpdir, 'main.c'), 'w') as f:
+            f.write(MAIN_C % (num_nodes, num_nodes))
+        exe = os.path.join(tmpdir, 'a.out')
+        subprocess.run(['gcc', '-D_GNU_SOURCE', '-O1', '-pthread', *cflags, '-o', exe,
+                        os.path.join(tmpdir, 'main.c')] + srcs, check=True)
+        ret = subprocess.run([exe], capture_output=True, timeout=60, cwd=tmpdir)
+        self.assertEqual(ret.returncode, 0, ret.stdout)
+
+    def test_cooperative(self):
+        for scheduler in dag.CooperativeScheduler:
+            graph = CheckedGraph(300, 3)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, 'soc.c')
+                dag.CooperativeCBackendGenF(
+                    graph, True, False, fname, False, scheduler=scheduler)
+                self.build_and_run(tmpdir, 300, [fname])
+
+    def test_cooperative_wait(self):
+        for scheduler in dag.CooperativeScheduler:
+            for wait in dag.CooperativeWait:
+                graph = CheckedGraph(300, 3)
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    fname = os.path.join(tmpdir, 'soc.c')
+                    dag.CooperativeCBackendGenF(
+                        graph, True, False, fname, False, scheduler=scheduler, wait=wait, poll_count=True)
+                    self.build_and_run(tmpdir, 300, [fname])
+
+    def test_cooperative_split(self):
+        for scheduler in dag.CooperativeScheduler:
+            graph = CheckedGraph(300, 3)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, 'soc.c')
+                units = dag.CooperativeCBackendGenSplitF(
+                    graph, True, False, fname, False, scheduler=scheduler)
+                self.assertEqual(len(units), 2 + 3)
+                self.build_and_run(tmpdir, 300, [u for u in units if u.endswith('.c')])
+
+    def test_cooperative_interning(self):
+        for interning in dag.BodyInterning:
+            graph = CallGraph(300, 3)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, 'soc.c')
+                dag.CooperativeCBackendGenF(
+                    graph, True, False, fname, False, interning)
+                with open(fname) as f:
+                    num_bodies = f.read().count('_body_func(uint32_t state')
+                if interning == dag.BodyInterning.PARAMETERIZED:
+                    self.assertLess(num_bodies, 10)
+                else:
+                    self.assertEqual(num_bodies, 300)
+                self.build_and_run(tmpdir, 300, [fname])
+
+    def test_cooperative_trace(self):
+        for scheduler in dag.CooperativeScheduler:
+            for split in (False, True):
+                graph = CheckedGraph(300, 3)
+                soc_trace = dag.SocTrace(entries=1024)
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    fname = os.path.join(tmpdir, 'soc.c')
+                    if split:
+                        srcs = [u for u in dag.CooperativeCBackendGenSplitF(
+                            graph, True, False, fname, False, scheduler=scheduler, trace=soc_trace)
+                            if u.endswith('.c')]
+                    else:
+                        dag.CooperativeCBackendGenF(
+                            graph, True, False, fname, False, scheduler=scheduler, trace=soc_trace)
+                        srcs = [fname]
+                    trace.DumpMeta(graph, soc_trace, True, fname + '.trace.json')
+                    self.build_and_run(tmpdir, 300, srcs)
+
+                    with open(fname + '.trace.json') as f:
+                        meta = json.load(f)
+                    with open(os.path.join(tmpdir, 'mango_trace.bin'), 'rb') as f:
+                        cores = trace.ParseRings(f.read(), meta['num_cores'])
+                latencies = {lat.sn: lat for lat in trace.ActionLatencies(cores, meta)}
+                self.assertEqual(len(latencies), 300)
+                for node in graph.nodes:
+                    lat = latencies[node.sn]
+                    self.assertLessEqual(lat.start, lat.end)
+                    # 时间戳为 CLOCK_MONOTONIC，各处理核可比
+                    for pred in node.predecessors:
+                        self.assertLessEqual(latencies[pred.sn].end, lat.start)
+                    cross = any(p.executor_id != node.executor_id or p.thread_id != node.thread_id
+                                for p in node.predecessors)
+                    self.assertEqual(lat.wait_exit is not None, cross)
+
+    def test_preemptive(self):
+        for sync in dag.PreemptiveSync:
+            graph = CheckedGraph(300, 2)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                fname = os.path.join(tmpdir, 'soc.c')
+                dag.PreemptiveCBackendGenF(graph, False, fname, sync)
+                self.build_and_run(tmpdir, 300, [fname])
+                if sync == dag.PreemptiveSync.FUTEX:
+                    # 不自旋，所有等待都经过 futex
+                    self.build_and_run(tmpdir, 300, [fname], ['-DMANGO_SPIN_COUNT=0'])
+
+
+class TestSplit(unittest.TestCase):
+    def test_unchanged_units(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'soc.c')
+            units = dag.CooperativeCBackendGenSplitF(
+                CheckedGraph(200, 2), False, False, fname, False)
+            for u in units:
+                os.utime(u, ns=(1, 1))
+
+            # 相同的图重新生成，所有文件都不会重写
+            dag.CooperativeCBackendGenSplitF(
+                CheckedGraph(200, 2), False, False, fname, False)
+            self.assertTrue(all(os.stat(u).st_mtime_ns == 1 for u in units))
+
+            dag.CooperativeCBackendGenSplitF(
+                CheckedGraph(200, 2, seed=1), False, False, fname, False)
+            self.assertTrue(any(os.stat(u).st_mtime_ns != 1 for u in units))
+
+
+class TestCooperativeWait(unittest.TestCase):
+    def generate(self, scheduler: dag.CooperativeScheduler, wait: dag.CooperativeWait, poll_count: bool) -> str:
+        f = io.StringIO()
+        random.seed(0)
+        graph = CheckedGraph(100, 2)
+        cores = dag.CBackendThreadAssign(graph)
+        dag._WriteChunks(f, dag.CooperativeCBackendChunks(
+            graph, cores, False, False, False, scheduler=scheduler, wait=wait, poll_count=poll_count))
+        return f.getvalue()
+
+    def test_wfe(self):
+        for scheduler in dag.CooperativeScheduler:
+            src = self.generate(scheduler, dag.CooperativeWait.WFE, False)
+            self.assertIn('asm volatile("wfe" ::: "memory");', src)
+            self.assertIn('asm volatile("sev" ::: "memory");', src)
+            self.assertIn('#define MANGO_POLL(counter)\n', src)
+
+    def test_spin(self):
+        # 默认的 switch 输出没有等待策略的代码
+        src = self.generate(dag.CooperativeScheduler.SWITCH, dag.CooperativeWait.SPIN, False)
+        self.assertNotIn('mango_idle', src)
+        src = self.generate(dag.CooperativeScheduler.SWITCH, dag.CooperativeWait.SPIN, True)
+        self.assertIn('MANGO_POLL(core_0_thread_0_polls);', src)
+        self.assertNotIn('mango_idle(progress, &backoff);', src)
+
+
+class TestBodyInterning(unittest.TestCase):
+    def test_literal_type(self):
+        self.assertEqual(dag._IntLiteralType('1'), 'int')
+        self.assertEqual(dag._IntLiteralType('2147483648'), 'long')
+        self.assertEqual(dag._IntLiteralType('0xffffffff'), 'unsigned int')
+        self.assertEqual(dag._IntLiteralType('0x80000000UL'), 'unsigned long')
+        self.assertEqual(dag._IntLiteralType('0xffffffffffffffff'), 'unsigned long')
+        self.assertEqual(dag._IntLiteralType('1ll'), 'long long')
+        self.assertEqual(dag._IntLiteralType('010'), 'int')
+        self.assertIsNone(dag._IntLiteralType('09'))
+
+    def test_template(self):
+        tmpl, values = dag._BodyTemplate('x = a[4] + 0x10 + 1.5; // 3\ny = "7";')
+        self.assertEqual(values, ('0x10',))
+        self.assertEqual(tmpl, (('x = a[4] + ', ' + 1.5; // 3\ny = "7";'), ('int',)))
+        self.assertIsNone(dag._BodyTemplate('asm volatile("mov x0, %0" :: "i"(3));'))
+        self.assertIsNone(dag._BodyTemplate('x = y;'))
+
+    def test_identical(self):
+        nodes = [dag.Node(f'n{i}') for i in range(4)]
+        for i, node in enumerate(nodes):
+            node.c_src = 'x++;' if i % 2 == 0 else 'y++;'
+        src = ''.join(dag._CooperativeBodies(
+            nodes, False, dag.BodyInterning.IDENTICAL))
+        self.assertEqual(src.count('(uint32_t state)'), 2)
+        self.assertEqual(nodes[2].body_func_name, nodes[0].body_func_name)
+        self.assertNotEqual(nodes[1].body_func_name, nodes[0].body_func_name)
+
+    def test_static_local(self):
+        # static 局部变量在每个 action 中独立，不能合并
+        nodes = [dag.Node(f'n{i}') for i in range(3)]
+        for node in nodes:
+            node.c_src = 'static int count = 0;\ncount++;'
+        for interning in [dag.BodyInterning.IDENTICAL, dag.BodyInterning.PARAMETERIZED]:
+            src = ''.join(dag._CooperativeBodies(nodes, False, interning))
+            self.assertEqual(src.count('(uint32_t state)'), 3)
+            self.assertEqual(len({node.body_func_name for node in nodes}), 3)
+            self.assertNotIn('shared by', src)
+
+
+class TestWriteChunks(unittest.TestCase):
+    def test_chunks(self):
+        chunks = [str(random.randrange(1000)) for _ in range(1000)]
+        for chunk_size in [1, 7, 1 << 20]:
+            f = io.StringIO()
+            dag._WriteChunks(f, iter(chunks), chunk_size)
+            self.assertEqual(f.getvalue(), ''.join(chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import argparse
+import os
+import random
+import tempfile
+
+from purslane import cache
+from purslane import dsl
+from purslane import session
+from purslane.dsl import Do, Action, Parallel
+
+
+class Leaf(Action):
+    def Body(self):
+        self.c_src = f'x = {random.randrange(1000)};\n'
+        asm_file.write(f'// {self.name}\n')
+
+
+class Top(Action):
+    def Activity(self):
+        for _ in range(4):
+            with Parallel():
+                for _ in range(3):
+                    Do(Leaf())
+
+
+asm_file = None
+
+
+class TestGenerationCache(unittest.TestCase):
+    def test_lru(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out = os.path.join(tmpdir, 'out.c')
+            gen_cache = cache.GenerationCache(os.path.join(tmpdir, 'cache'), 300)
+            for i in range(3):
+                if i == 2:
+                    # 使用 k0 之后，k1 成为最早使用的条目
+                    self.assertEqual(gen_cache.Restore('k0'), [out])
+                with open(out, 'w') as f:
+                    f.write(str(i) * 100)
+                gen_cache.Store(f'k{i}', [out])
+                os.utime(os.path.join(tmpdir, 'cache', f'k{i}', 'manifest.json'), (i, i))
+            # 每个条目 100 字节加上 manifest，只能保留两个
+            self.assertIsNone(gen_cache.Restore('k1'))
+            self.assertEqual(gen_cache.Restore('k0'), [out])
+            with open(out) as f:
+                self.assertEqual(f.read(), '0' * 100)
+            self.assertEqual(gen_cache.Restore('k2'), [out])
+            with open(out) as f:
+                self.assertEqual(f.read(), '2' * 100)
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = os.path.join(tmpdir, 'cache')
+            outputs = [os.path.join(tmpdir, n) for n in ['graph.json', 'soc.c', 'rand_proc.S']]
+
+            def Generate(seed: str) -> dsl.dag.Graph:
+                global asm_file
+                with session.GenerationSession() as sess:
+                    asm_file = dsl.OpenOutput(outputs[2])
+                    parser = argparse.ArgumentParser()
+                    dsl.PrepareArgParser(parser)
+                    args = parser.parse_args(['--graph_output', outputs[0], '--soc_output', outputs[1],
+                                              '--soc_cooperative', '--cache_dir', cache_dir, '--seed', seed])
+                    random.seed(args.seed)
+                    dsl.Run(Top(), args)
+                return sess.graph
+
+            def Contents() -> list:
+                contents = []
+                for fname in outputs:
+                    with open(fname) as f:
+                        contents.append(f.read())
+                return contents
+
+            self.assertTrue(Generate('1').nodes)
+            first = Contents()
+            self.assertIn('// Leaf_0', first[2])
+
+            # 命中时不运行场景
+            self.assertFalse(Generate('1').nodes)
+            self.assertEqual(Contents(), first)
+
+            self.assertTrue(Generate('2').nodes)
+            self.assertNotEqual(Contents(), first)
+            self.assertFalse(Generate('1').nodes)
+            self.assertEqual(Contents(), first)
+
+            # 输出到其他位置时不命中
+            outputs[1] = os.path.join(tmpdir, 'soc2.c')
+            self.assertTrue(Generate('1').nodes)
+
+    def test_restore_path(self):
+        # 以相对路径保存，在其他目录恢复时仍然恢复到保存时的位置
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gen_cache = cache.GenerationCache(os.path.join(tmpdir, 'cache'), 1 << 20)
+            os.makedirs(os.path.join(tmpdir, 'a'))
+            os.makedirs(os.path.join(tmpdir, 'b'))
+            out = os.path.join(tmpdir, 'a', 'out.c')
+            try:
+                os.chdir(os.path.join(tmpdir, 'a'))
+                with open('out.c', 'w') as f:
+                    f.write('a')
+                gen_cache.Store('k', ['out.c'])
+                os.remove('out.c')
+                os.chdir(os.path.join(tmpdir, 'b'))
+                self.assertEqual(gen_cache.Restore('k'), [os.path.realpath(out)])
+            finally:
+                os.chdir(cwd)
+            self.assertTrue(os.path.isfile(out))
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, 'b', 'out.c')))
+
+
+if __name__ == '__main__':
+    unittest.main()
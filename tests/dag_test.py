@@ -0,0 +1,265 @@
+import unittest
+import random
+import os
+import tempfile
+import numpy
+
+from purslane import dag
+from purslane import dsl
+from purslane.bench.graphs import LayeredGraph, ChainsGraph, ScaffoldGraph
+from purslane.bench.reduction import NaiveTransitiveReduction, Edges
+from purslane.bench.contraction import NaiveRemoveNonTargetNodes
+from purslane.bench.thread_assign import NaiveCBackendThreadAssign, Threads, Rounds
+
+
+class TestTransitiveReduction(unittest.TestCase):
+    def test_same_as_naive(self):
+        for seed in range(4):
+            for gen in [LayeredGraph, ChainsGraph]:
+                graph = gen(600, 16, seed=seed)
+                NaiveTransitiveReduction(graph)
+                expected = Edges(graph)
+
+                for mode in dag.ReachabilityMode:
+                    graph = gen(600, 16, seed=seed)
+                    graph.TransitiveReduction(mode)
+                    self.assertEqual(Edges(graph), expected)
+
+    def test_diamond(self):
+        a, b, c, d = [dag.Node(n) for n in 'abcd']
+        b.AddPredecessor(a)
+        c.AddPredecessor(a)
+        d.AddPredecessor(a)
+        d.AddPredecessor(b)
+        d.AddPredecessor(c)
+        graph = dag.Graph()
+        for n in [a, b, c, d]:
+            graph.AddNode(n)
+        graph.AssignSN()
+        graph.TransitiveReduction()
+        self.assertEqual(list(d.predecessors), [b, c])
+        # 没有标记为目标的节点也不会被删除
+        self.assertEqual(graph.nodes, [a, b, c, d])
+
+
+class TestRemoveNonTargetNodes(unittest.TestCase):
+    def random_graph(self, seed: int) -> dag.Graph:
+        graph = LayeredGraph(400, 12, fan_in=3, seed=seed)
+        rng = random.Random(seed)
+        for node in graph.nodes:
+            node.is_target = rng.random() < 0.6
+        return graph
+
+    def test_same_as_naive(self):
+        for seed in range(4):
+            graph = self.random_graph(seed)
+            NaiveRemoveNonTargetNodes(graph)
+            expected = [(p.name, n.name) for n in graph.nodes for p in n.predecessors]
+
+            graph = self.random_graph(seed)
+            graph.RemoveNonTargetNodes()
+            self.assertEqual(
+                [(p.name, n.name) for n in graph.nodes for p in n.predecessors], expected)
+
+    def test_junctions(self):
+        for seed in range(4):
+            for gen in [self.random_graph, lambda seed: ScaffoldGraph(3, 8 + seed)]:
+                graph = gen(seed)
+                NaiveRemoveNonTargetNodes(graph)
+                graph.AssignSN()
+                NaiveTransitiveReduction(graph)
+                expected = sorted(Edges(graph))
+
+                for mode in dag.ReachabilityMode:
+                    graph = gen(seed)
+                    graph.RemoveNonTargetNodes(keep_junctions=True)
+                    graph.AssignSN()
+                    graph.TransitiveReduction(mode, expand_junctions=True)
+                    self.assertTrue(all(n.is_target for n in graph.nodes))
+                    self.assertEqual([n.sn for n in graph.nodes], list(range(len(graph.nodes))))
+                    self.assertEqual(sorted(Edges(graph)), expected)
+
+    def test_scaffold_context(self):
+        # ScaffoldGraph 不改变 dsl 的全局 Context
+        ctx = dsl.global_ctx
+        graph = ScaffoldGraph(2, 3)
+        self.assertIs(dsl.global_ctx, ctx)
+        self.assertIsNot(graph, ctx.graph)
+
+
+class TestReachability(unittest.TestCase):
+    def test_reaches(self):
+        graph = LayeredGraph(300, 8, seed=1)
+        graph.UpdateAllPredecessors()
+        for mode in dag.ReachabilityMode:
+            reach = dag.Reachability(graph, mode)
+            reach.Build()
+            for _ in range(2000):
+                src = random.choice(graph.nodes)
+                dst = random.choice(graph.nodes)
+                self.assertEqual(reach.Reaches(src, dst), dst.HasAncestor(src))
+
+
+class TestSerialization(unittest.TestCase):
+    def saved_graph(self) -> dag.Graph:
+        graph = LayeredGraph(500, 16, seed=3)
+        graph.TransitiveReduction()
+        graph.AssignSN()
+        graph.num_executors = 3
+        # 部分 action 指定 executor
+        for node in graph.nodes[::10]:
+            node.executor_id = 0
+        graph.AssignExecutorSpread()
+        graph.c_headers = ['#include <stdio.h>']
+        graph.c_decls = ['int x;']
+        for node in graph.nodes:
+            # 大量重复的源码，以及 None 和非 ascii 字符
+            node.c_src = f'x += {node.sn % 7};\n'
+            node.sv_src = None if node.sn % 5 == 0 else f'// 节点 {node.name}\n'
+            node.cost = None if node.sn % 3 == 0 else node.sn % 11
+        return graph
+
+    def assertSameGraph(self, a: dag.Graph, b: dag.Graph):
+        self.assertEqual(a.num_executors, b.num_executors)
+        self.assertEqual(a.c_headers, b.c_headers)
+        self.assertEqual(a.c_decls, b.c_decls)
+        self.assertEqual(len(a.nodes), len(b.nodes))
+        for x, y in zip(a.nodes, b.nodes):
+            self.assertEqual((x.name, x.sn, x.executor_id, x.executor_assigned, x.cost, x.c_src, x.sv_src),
+                             (y.name, y.sn, y.executor_id, y.executor_assigned, y.cost, y.c_src, y.sv_src))
+            self.assertEqual([p.sn for p in x.predecessors],
+                             [p.sn for p in y.predecessors])
+
+    def test_json(self):
+        graph = self.saved_graph()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'graph.json')
+            graph.DumpJson(fname)
+            self.assertSameGraph(graph, dag.Graph.LoadJson(fname))
+
+    def test_npz(self):
+        graph = self.saved_graph()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for compress in [False, True]:
+                fname = os.path.join(tmpdir, 'graph.npz')
+                graph.DumpNpz(fname, compress)
+                self.assertSameGraph(graph, dag.Graph.LoadNpz(fname))
+
+    def test_npz_numpy(self):
+        graph = self.saved_graph()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'graph.npz')
+            graph.DumpNpz(fname)
+            arrays = numpy.load(fname)
+            self.assertEqual(list(arrays['sn']), [n.sn for n in graph.nodes])
+            self.assertEqual(arrays['preds'].dtype, numpy.int64)
+
+
+class TestExecutorAssign(unittest.TestCase):
+    def chains(self) -> dag.Graph:
+        graph = ChainsGraph(2000, num_chains=4, cross_prob=0.05, seed=1)
+        graph.TransitiveReduction()
+        graph.AssignSN()
+        # 部分 action 指定 executor
+        for node in graph.nodes[::50]:
+            node.executor_id = 3
+        return graph
+
+    def num_cross(self, graph: dag.Graph) -> int:
+        return sum(1 for n in graph.nodes for p in n.predecessors if p.executor_id != n.executor_id)
+
+    def test_critical_path(self):
+        random.seed(0)
+        spread = self.chains()
+        spread.AssignExecutor(4, dag.ExecutorAssignPolicy.SPREAD)
+        graph = self.chains()
+        graph.AssignExecutor(4, dag.ExecutorAssignPolicy.CRITICAL_PATH)
+        for i, node in enumerate(graph.nodes):
+            self.assertIn(node.executor_id, range(4))
+            if i % 50 == 0:
+                self.assertEqual(node.executor_id, 3)
+                self.assertFalse(node.executor_assigned)
+        self.assertLess(self.num_cross(graph) * 4, self.num_cross(spread))
+        # 负载均衡
+        loads = [sum(1 for n in graph.nodes if n.executor_id == c) for c in range(4)]
+        self.assertLess(max(loads), 2 * min(loads))
+
+    def test_cross_fraction(self):
+        random.seed(0)
+        graph = self.chains()
+        graph.AssignExecutor(4, dag.ExecutorAssignPolicy.CRITICAL_PATH, 0.3)
+        num_edges = sum(len(n.predecessors) for n in graph.nodes)
+        self.assertGreaterEqual(self.num_cross(graph), 0.3 * num_edges)
+
+
+class TestThreadAssign(unittest.TestCase):
+    def test_same_as_naive(self):
+        for seed in range(3):
+            for gen in [LayeredGraph, ChainsGraph]:
+                graph = gen(1500, 16, seed=seed)
+                graph.TransitiveReduction()
+                graph.AssignExecutor(4, dag.ExecutorAssignPolicy.RANDOM)
+                random.seed(seed)
+                expected = Threads(NaiveCBackendThreadAssign(graph))
+                random.seed(seed)
+                cores = dag.CBackendThreadAssign(graph)
+                self.assertEqual(Threads(cores), expected)
+                for core in cores:
+                    for thd in core.threads:
+                        for i, node in enumerate(thd.nodes):
+                            self.assertEqual((node.executor_id, node.thread_id, node.sn_in_thread),
+                                             (core.id, thd.id, i))
+
+    def min_threads(self, graph: dag.Graph, core_id: int) -> int:
+        # Dilworth, 祖先关系上的最大匹配
+        graph.UpdateAllPredecessors()
+        nodes = [n for n in graph.nodes if n.executor_id == core_id]
+        match = {}
+
+        def Augment(v, seen) -> bool:
+            for u in nodes:
+                if v.HasAncestor(u) and u not in seen:
+                    seen.add(u)
+                    if u not in match or Augment(match[u], seen):
+                        match[u] = v
+                        return True
+            return False
+
+        return len(nodes) - sum(Augment(v, set()) for v in nodes)
+
+    def test_chain_cover(self):
+        for seed in range(3):
+            for gen in [LayeredGraph, ChainsGraph]:
+                graph = gen(240, 8, seed=seed)
+                graph.TransitiveReduction()
+                graph.AssignExecutor(2, dag.ExecutorAssignPolicy.RANDOM)
+                random.seed(seed)
+                greedy = sum(len(c.threads) for c in dag.CBackendThreadAssign(graph))
+                random.seed(seed)
+                cores = dag.CBackendThreadAssign(graph, dag.ThreadAssignMode.CHAIN_COVER)
+                self.assertLessEqual(sum(len(c.threads) for c in cores), greedy)
+                graph.UpdateAllPredecessors()
+                for core in cores:
+                    self.assertEqual(len(core.threads), self.min_threads(graph, core.id))
+                    for thd in core.threads:
+                        for i, node in enumerate(thd.nodes):
+                            self.assertEqual((node.thread_id, node.sn_in_thread), (thd.id, i))
+                            if i > 0:
+                                self.assertTrue(node.HasAncestor(thd.nodes[i - 1]))
+                Rounds(cores)
+
+        # executor 比有 action 的处理核多
+        graph = LayeredGraph(60, 4, seed=0)
+        graph.TransitiveReduction()
+        graph.AssignSN()
+        graph.num_executors = 3
+        for node in graph.nodes:
+            node.executor_id = 0
+        cores = dag.CBackendThreadAssign(graph, dag.ThreadAssignMode.CHAIN_COVER)
+        self.assertEqual([len(c.threads) > 0 for c in cores], [True, False, False])
+        self.assertEqual(len(cores[0].threads), self.min_threads(graph, 0))
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    unittest.main()
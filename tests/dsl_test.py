@@ -0,0 +1,173 @@
+import unittest
+import argparse
+import random
+import tempfile
+import os
+import json
+
+from purslane import dsl
+from purslane.dsl import Do, Action, Sequence, Parallel, Schedule
+
+
+class Leaf(Action):
+    def Body(self):
+        self.c_src = ''
+
+
+class Empty(Action):
+    def Activity(self):
+        pass
+
+
+class Deps(Action):
+    # deps on previous actions inside a schedule
+    def __init__(self, prevs):
+        super().__init__()
+        self.prevs = prevs
+
+    def Activity(self):
+        self.deps.extend(random.sample(self.prevs, min(2, len(self.prevs))))
+        Do(Leaf())
+
+
+class Top(Action):
+    def __init__(self, rounds: int):
+        super().__init__()
+        self.rounds = rounds
+
+    def Activity(self):
+        for _ in range(self.rounds):
+            with Parallel():
+                for _ in range(random.randrange(1, 5)):
+                    with Sequence():
+                        Do(Leaf())
+                        Do(Empty())
+                        with Parallel():
+                            for _ in range(random.randrange(0, 3)):
+                                Do(Leaf())
+            with Sequence():
+                pass
+            prevs = []
+            with Schedule():
+                for _ in range(random.randrange(1, 6)):
+                    act = Deps(prevs[:])
+                    Do(act)
+                    prevs.append(act)
+
+
+def Generate(rounds: int, seed: int, extra_args: list) -> dsl.dag.Graph:
+    random.seed(seed)
+    dsl.global_ctx = dsl.Context()
+    parser = argparse.ArgumentParser()
+    dsl.PrepareArgParser(parser)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        args = parser.parse_args(
+            ['--graph_output', os.path.join(tmpdir, 'graph.json')] + extra_args)
+        dsl.Run(Top(rounds), args)
+    return dsl.global_ctx.graph
+
+
+def NamedEdges(graph) -> set:
+    return {(p.name, n.name) for n in graph.nodes for p in n.predecessors}
+
+
+class TestIncrementalGraph(unittest.TestCase):
+    def test_same_edges(self):
+        for seed in range(8):
+            scaffold = Generate(6, seed, [])
+            incremental = Generate(6, seed, ['--incremental_graph'])
+            self.assertEqual([n.name for n in incremental.nodes],
+                             [n.name for n in scaffold.nodes])
+            self.assertEqual(NamedEdges(incremental), NamedEdges(scaffold))
+
+    def test_parallel_dependence(self):
+        class Bad(Action):
+            def Activity(self):
+                with Parallel():
+                    a = Leaf()
+                    Do(a)
+                    b = Leaf()
+                    b.deps.append(a)
+                    Do(b)
+
+        for extra_args in [[], ['--incremental_graph']]:
+            dsl.global_ctx = dsl.Context()
+            dsl.global_ctx.incremental = len(extra_args) > 0
+            with self.assertRaises(Exception):
+                Do(Bad())
+
+
+class TestScopeIndex(unittest.TestCase):
+    def test_nested_crossing(self):
+        # 依赖从一个分支内部的动作指向另一个分支内部的动作
+        class Bad(Action):
+            def Activity(self):
+                with Parallel():
+                    with Sequence():
+                        Do(Leaf())
+                        a = Leaf()
+                        Do(a)
+                    with Sequence():
+                        b = Leaf()
+                        b.deps.append(a)
+                        Do(b)
+
+        for incremental in [False, True]:
+            dsl.global_ctx = dsl.Context()
+            dsl.global_ctx.incremental = incremental
+            with self.assertRaises(RuntimeError):
+                Do(Bad())
+
+    def test_inside_branch(self):
+        class Good(Action):
+            def Activity(self):
+                with Parallel():
+                    with Sequence():
+                        a = Leaf()
+                        Do(a)
+                        b = Leaf()
+                        b.deps.append(a)
+                        Do(b)
+                    Do(Leaf())
+
+        for incremental in [False, True]:
+            dsl.global_ctx = dsl.Context()
+            dsl.global_ctx.incremental = incremental
+            Do(Good())
+
+
+class TestProfile(unittest.TestCase):
+    def test_report(self):
+        random.seed(0)
+        dsl.global_ctx = dsl.Context()
+        parser = argparse.ArgumentParser()
+        dsl.PrepareArgParser(parser)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = parser.parse_args(
+                ['--graph_output', os.path.join(tmpdir, 'graph.json'),
+                 '--soc_output', os.path.join(tmpdir, 'soc.c'),
+                 '--soc_cooperative', '--profile_memory'])
+            dsl.Run(Top(3), args)
+            self.assertIsNone(dsl.profiler.active)
+
+            with open(os.path.join(tmpdir, 'graph_profile.json')) as f:
+                report = json.load(f)
+            paths = [p['path'] for p in report['phases']]
+            self.assertIn('do', paths)
+            self.assertIn('transitive reduction', paths)
+            self.assertIn('soc backend;thread assign', paths)
+            self.assertTrue(all(p['peak_bytes'] > 0 for p in report['phases']))
+
+            self.assertEqual(report['actions']['Top']['num_done'], 1)
+            self.assertEqual(report['actions']['Top']['num_constructed'], 1)
+            leaf = report['actions']['Leaf']
+            self.assertEqual(leaf['num_constructed'], leaf['num_done'])
+            self.assertGreater(leaf['num_done'], 0)
+
+            with open(os.path.join(tmpdir, 'graph_profile.folded')) as f:
+                stacks = [line.rsplit(' ', 1)[0] for line in f]
+            self.assertIn('do;Top', stacks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import shutil
+import tempfile
+
+from purslane.bench import hosted
+
+
+@unittest.skipIf(shutil.which('gcc') is None, 'gcc not found')
+class TestHostedBench(unittest.TestCase):
+    def test_backends(self):
+        graph = hosted.BenchGraph('moesi', 200, 2)
+        results = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for backend in hosted.BACKENDS:
+                results.append(hosted.RunBackend(graph, 'moesi', backend, tmpdir, 1))
+        for r in results:
+            self.assertEqual((r.num_actions, r.num_cores, r.num_threads), (200, 2, 2))
+            self.assertGreater(r.runtime_ns, 0)
+            # 链之间有依赖，一定有跨核等待
+            self.assertIsNotNone(r.wait_mean_ns)
+            self.assertGreaterEqual(r.wait_p99_ns, r.wait_p50_ns)
+
+        baseline = {r.key: {'runtime_ns': r.runtime_ns} for r in results}
+        self.assertEqual(hosted.Compare(results, baseline, 0.0), [])
+        baseline[results[0].key]['runtime_ns'] = results[0].runtime_ns // 2
+        self.assertEqual(len(hosted.Compare(results, baseline, 0.5)), 1)
+
+    def test_shapes(self):
+        for shape in hosted.SHAPES:
+            graph = hosted.BenchGraph(shape, 64, 4)
+            self.assertEqual(len(graph.nodes), 64)
+            cross = sum(1 for n in graph.nodes for p in n.predecessors if p.executor_id != n.executor_id)
+            if shape in ('chains', 'wide'):
+                self.assertEqual(cross, 0)
+            else:
+                self.assertGreater(cross, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
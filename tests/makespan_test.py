@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+import random
+
+from purslane import backend
+from purslane import dag
+from purslane import makespan
+from purslane.bench.graphs import LayeredGraph
+
+
+def Chain(graph: dag.Graph, n: int, executor_id: int, pred: dag.Node = None) -> list:
+    nodes = []
+    for i in range(n):
+        node = dag.Node(f'c{executor_id}_{len(graph.nodes)}')
+        node.executor_id = executor_id
+        if pred is not None:
+            node.AddPredecessor(pred)
+        graph.AddNode(node)
+        nodes.append(node)
+        pred = node
+    return nodes
+
+
+class TestMakespan(unittest.TestCase):
+    def estimate(self, graph: dag.Graph, sync_cost: int = 1) -> makespan.MakespanEstimate:
+        graph.AssignSN()
+        cores = dag.CBackendThreadAssign(graph)
+        return makespan.Estimate(graph, cores, 1, sync_cost)
+
+    def test_chains(self):
+        graph = dag.Graph(2)
+        a = Chain(graph, 4, 0)
+        for node in a:
+            node.cost = 2
+        Chain(graph, 3, 1)
+        est = self.estimate(graph)
+        self.assertEqual(est.makespan, 8)
+        self.assertEqual(est.critical_path, 8)
+        self.assertEqual(est.total_work, 11)
+        self.assertEqual([c.idle for c in est.cores], [0, 5])
+        self.assertEqual(est.cross_core_waits, 0)
+
+    def test_sync_cost(self):
+        graph = dag.Graph(2)
+        a = Chain(graph, 2, 0)
+        Chain(graph, 2, 1, a[-1])
+        est = self.estimate(graph, sync_cost=3)
+        self.assertEqual(est.makespan, 2 + 3 + 2)
+        self.assertEqual(est.critical_path, 7)
+        self.assertEqual(est.cross_core_waits, 1)
+        self.assertEqual(est.cross_thread_waits, 1)
+
+    def test_random(self):
+        random.seed(0)
+        graph = LayeredGraph(1000, 16, seed=2)
+        graph.TransitiveReduction()
+        graph.AssignSN()
+        graph.num_executors = 4
+        graph.AssignExecutorSpread()
+        est = self.estimate(graph)
+        self.assertEqual(sum(c.num_actions for c in est.cores), 1000)
+        self.assertGreaterEqual(est.makespan, est.critical_path)
+        self.assertGreaterEqual(est.makespan * 4, est.total_work)
+        self.assertEqual(len(est.GanttText(40).splitlines()), 4)
+        self.assertEqual(est.GanttHtml().count('class="a"'), 1000)
+
+    def test_saved_threads(self):
+        # 保存的图带有 soc 后端的线程划分，读出以后不再重新划分
+        random.seed(1)
+        graph = LayeredGraph(300, 8, seed=3)
+        graph.TransitiveReduction()
+        graph.AssignSN()
+        graph.num_executors = 3
+        graph.AssignExecutorSpread()
+        cores = dag.CBackendThreadAssign(graph)
+        expected = [[[node.sn for node in thd.nodes] for thd in core.threads] for core in cores]
+        with tempfile.TemporaryDirectory() as tmp:
+            for fname in ['g.json', 'g.npz']:
+                fname = os.path.join(tmp, fname)
+                if fname.endswith('.npz'):
+                    graph.DumpNpz(fname)
+                else:
+                    graph.DumpJson(fname)
+                loaded = backend.LoadGraph(fname)
+                self.assertTrue(loaded.threads_assigned)
+                saved = dag.SavedThreadAssign(loaded)
+                self.assertEqual([[[node.sn for node in thd.nodes] for thd in core.threads] for core in saved],
+                                 expected)
+                self.assertEqual(makespan.Estimate(loaded, saved).makespan, makespan.Estimate(graph, cores).makespan)
+
+        # 没有运行 soc 后端时不保存
+        graph = dag.Graph(1)
+        Chain(graph, 2, 0)
+        graph.AssignSN()
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, 'g.json')
+            graph.DumpJson(fname)
+            self.assertFalse(dag.Graph.LoadJson(fname).threads_assigned)
+
+
+if __name__ == '__main__':
+    unittest.main()
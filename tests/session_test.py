@@ -0,0 +1,65 @@
+import unittest
+import argparse
+import os
+import random
+import tempfile
+
+from purslane import addr_space
+from purslane import dsl
+from purslane import session
+from purslane.addr_space import SMRead8, SMWrite8
+from purslane.dsl import Do, Action, Parallel
+
+
+class Leaf(Action):
+    def Body(self):
+        addr = random.randrange(0, 1 << 16)
+        # 上一次生成残留在影子内存中的数据会改变输出
+        self.c_src = f'x = {SMRead8(addr)};\n'
+        SMWrite8(addr, random.randrange(1, 256))
+        dsl.OpenOutput('rand_proc.S', '// rand proc\n').write(f'// {self.name}\n')
+
+
+class Top(Action):
+    def Activity(self):
+        for _ in range(8):
+            with Parallel():
+                for _ in range(3):
+                    Do(Leaf())
+
+
+class TestGenerationSession(unittest.TestCase):
+    def generate(self, seed: int) -> list:
+        parser = argparse.ArgumentParser()
+        dsl.PrepareArgParser(parser)
+        args = parser.parse_args(['--soc_output', 'soc.c', '--soc_cooperative'])
+        with session.GenerationSession() as sess:
+            random.seed(seed)
+            dsl.Run(Top(), args)
+            self.assertIs(dsl.global_ctx.graph, sess.graph)
+        contents = []
+        for fname in ['graph.json', 'soc.c', 'rand_proc.S']:
+            with open(fname) as f:
+                contents.append(f.read())
+        return contents
+
+    def test_back_to_back(self):
+        outer_ctx = dsl.global_ctx
+        outer_memory = addr_space.global_shadow_memory
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                first = self.generate(1)
+                self.generate(2)
+                self.assertEqual(self.generate(1), first)
+                self.assertTrue(first[2].startswith('// rand proc\n// Leaf_0\n'))
+            finally:
+                os.chdir(cwd)
+        self.assertIs(dsl.global_ctx, outer_ctx)
+        self.assertIs(addr_space.global_shadow_memory, outer_memory)
+        self.assertEqual(dsl.output_files, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
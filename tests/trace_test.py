@@ -0,0 +1,51 @@
+import unittest
+import struct
+
+from purslane import dag
+from purslane import trace
+
+META = {
+    'num_cores': 1,
+    'timer_hz': 1000000000,
+    'actions': [{'sn': 0, 'name': 'a', 'core': 0, 'thread': 0},
+                {'sn': 1, 'name': 'b', 'core': 0, 'thread': 1}],
+}
+
+
+def Ring(entries: int, records: list) -> bytes:
+    # 与生成代码中 mango_trace 的写入方式相同
+    slots = [(0, 0, 0)] * entries
+    for i, r in enumerate(records):
+        slots[i % entries] = r
+    data = struct.pack('<IIQ', dag.TRACE_MAGIC, entries, len(records))
+    return data + b''.join(struct.pack('<QII', *r) for r in slots)
+
+
+class TestTrace(unittest.TestCase):
+    def test_wrap(self):
+        records = [(10 * i, i, dag.TraceEvent.START.value) for i in range(6)]
+        cores = trace.ParseRings(Ring(4, records))
+        self.assertEqual(len(cores), 1)
+        self.assertEqual(cores[0].dropped, 2)
+        self.assertEqual([r.ts for r in cores[0].records], [20, 30, 40, 50])
+
+    def test_latency(self):
+        records = [(100, 0, dag.TraceEvent.START.value), (150, 0, dag.TraceEvent.END.value),
+                   (170, 1, dag.TraceEvent.WAIT_EXIT.value), (180, 1, dag.TraceEvent.START.value)]
+        cores = trace.ParseRings(Ring(8, records) + bytes(16))
+        self.assertEqual(len(cores), 1)
+        a, b = trace.ActionLatencies(cores, META)
+        self.assertEqual((a.run, a.wait), (50, None))
+        # b 在另一个线程，等待从处理核第一条记录开始计算，没有结束
+        self.assertEqual((b.run, b.wait), (None, 70))
+        self.assertIn('b started at 180 without end', '\n'.join(trace.Unfinished(cores, META)))
+
+        events = trace.ChromeTrace(cores, META, META['timer_hz'])['traceEvents']
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(spans['a']['dur'], 0.05)
+        self.assertEqual(spans['wait b']['ts'], 0.0)
+        self.assertEqual([e['name'] for e in events if e['ph'] == 'i'], ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import io
+import re
+
+from purslane import dag
+from purslane.bench.graphs import LayeredGraph
+
+
+def BodyGraph(num_nodes: int, num_bodies: int) -> dag.Graph:
+    graph = LayeredGraph(num_nodes, 16, seed=0)
+    graph.TransitiveReduction()
+    graph.AssignSN()
+    graph.num_executors = 3
+    graph.AssignExecutorSpread()
+    for node in graph.nodes:
+        node.sv_src = f'    exec.Run({node.sn % num_bodies});\n'
+    return graph
+
+
+def Words(data: str) -> list:
+    # 与 $readmemh 相同，忽略注释，按空白分隔的十六进制数
+    return [int(w, 16) for line in data.splitlines() for w in line.split('//')[0].split()]
+
+
+def Compact(graph: dag.Graph):
+    f = io.StringIO()
+    data_f = io.StringIO()
+    names_f = io.StringIO()
+    dag.UvmCompactBackendGen(graph, 'uvm_executor', f, data_f, names_f, 'out.sv')
+    return f.getvalue(), Words(data_f.getvalue()), names_f.getvalue().splitlines()
+
+
+class TestUvmCompact(unittest.TestCase):
+    def test_data(self):
+        graph = BodyGraph(500, 7)
+        for node in graph.nodes:
+            node.sv_src = f'    exec.Run{node.sn % 7}();\n'
+        src, words, names = Compact(graph)
+        self.assertEqual(len(re.findall(r'^class \w+_Action extends MangoArgsAction;', src, re.M)), 7)
+        self.assertIn('string data_file = "out.sv.hex";', src)
+        self.assertIn('string names_file = "out.sv.names";', src)
+
+        num_actions, num_succs, num_args = words[:3]
+        self.assertEqual((num_actions, num_args), (500, 0))
+        self.assertEqual(len(words), 3 + 8 * num_actions + num_succs)
+        succ_base = 3 + 8 * num_actions
+        nodes = list(graph.Nodes())
+        for i, node in enumerate(nodes):
+            _, sn, executor_id, num_preds, begin, num, _, name = words[3 + 8 * i:11 + 8 * i]
+            self.assertEqual((sn, executor_id, num_preds), (node.sn, node.executor_id, len(node.predecessors)))
+            self.assertEqual(names[name], node.name)
+            succs = [nodes[j] for j in words[succ_base + begin:succ_base + begin + num]]
+            self.assertEqual(succs, list(node.Successors()))
+
+    def test_literals(self):
+        # 与 chi_moesi 相同，只有地址和数据不同的 action 共用一个类，常量放在数据文件中
+        graph = BodyGraph(40, 1)
+        for node in graph.nodes:
+            addr = 0x80000000 + 64 * node.sn
+            bv = '{' + ','.join(f"8'h{(node.sn + i) & 0xff:x}" for i in range(4)) + '}'
+            node.sv_src = f'    exec.ReadClean(64\'h{addr:x}, {bv}, 8\'d{node.sn % 4});\n'
+        graph.nodes[0].sv_src = "    exec.Write(64'h100, 'x);\n"
+        src, words, _ = Compact(graph)
+        self.assertEqual(len(re.findall(r'^class \w+ extends MangoArgsAction;', src, re.M)), 2)
+        self.assertIn('exec.ReadClean(mango_a0, {mango_a1,mango_a2,mango_a3,mango_a4}, mango_a5);', src)
+        self.assertIn('  bit [63:0] mango_a0;', src)
+        self.assertIn('    mango_a0 = {data[pos + 1], data[pos + 0]};', src)
+        # 带 x 的常量不参数化
+        self.assertIn("exec.Write(64'h100, 'x);", src)
+
+        num_actions, num_succs, num_args = words[:3]
+        arg_base = 3 + 8 * num_actions + num_succs
+        self.assertEqual(len(words), arg_base + num_args)
+        for i, node in enumerate(graph.Nodes()):
+            arg_begin = words[3 + 8 * i + 6]
+            if node.sn == 0:
+                continue
+            args = words[arg_base + arg_begin:arg_base + arg_begin + 7]
+            self.assertEqual(args[0] | (args[1] << 32), 0x80000000 + 64 * node.sn)
+            self.assertEqual(args[2:6], [(node.sn + k) & 0xff for k in range(4)])
+            self.assertEqual(args[6], node.sn % 4)
+
+    def test_const_context(self):
+        self.assertIsNone(dag._SvBodyTemplate('    parameter int N = 3;\n'))
+        (pieces, types), values = dag._SvBodyTemplate("    x[3] = {2{4'sd3}} + 7'b101 + 3'(5) + 16;\n")
+        self.assertEqual(pieces, ('    x[3] = {2{', '}} + ', " + 3'(", ') + ', ';\n'))
+        self.assertEqual(types, ('bit signed [3:0]', 'bit [6:0]', 'int', 'int'))
+        self.assertEqual(values, ((4, 3), (7, 5), (32, 5), (32, 16)))
+
+
+class TestUvmScheduler(unittest.TestCase):
+    def test_queue(self):
+        graph = BodyGraph(50, 3)
+        f = io.StringIO()
+        dag.UvmBackendGen(graph, 'uvm_executor', f, scheduler=dag.UvmScheduler.QUEUE,
+                          max_outstanding=2, progress_flush=16)
+        src = f.getvalue()
+        self.assertIn('mailbox #(Action) ready[];', src)
+        self.assertIn('this.max_outstanding = 2;', src)
+        self.assertIn('this.progress_flush = 16;', src)
+        self.assertNotIn('join_none\n  endtask', src)
+        # disable fork 只结束工作进程
+        run = src[src.index('  task Run();'):]
+        self.assertLess(run.index('fork begin'), run.index('this.Worker(executor_id);'))
+        self.assertLess(run.index('disable fork;'), run.index('end join\n'))
+
+        # 默认仍然是每个 action 一个进程
+        f = io.StringIO()
+        dag.UvmBackendGen(BodyGraph(50, 3), 'uvm_executor', f)
+        self.assertIn(dag.UVM_ACTION_SCHEDULER_TMPL.format(executor='uvm_executor'), f.getvalue())
+        self.assertNotIn('mailbox', f.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()